@@ -1,22 +1,62 @@
-from flask import Flask
+from flask import Flask, g, request
 from flask_cors import CORS
+import logging
 import os
 
+from config import Config
+from services.tenancy import DEFAULT_USER, check_multi_user_config, public, user_from_token
+
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
 def create_app():
+    check_multi_user_config()
     app = Flask(__name__)
     CORS(app)
 
+    @app.before_request
+    def identify_user():
+        """Every request acts for the user its bearer token was issued to, or the default user in single-user mode"""
+        if not Config.MULTI_USER:
+            g.user_id = DEFAULT_USER
+            return
+        view = app.view_functions.get(request.endpoint)
+        if request.method == 'OPTIONS' or view is None or getattr(view, 'public', False):
+            return
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        user_id = user_from_token(token) if scheme.lower() == 'bearer' else None
+        if user_id is None:
+            return {'error': 'Missing or invalid user token'}, 401
+        g.user_id = user_id
+
     @app.route('/health')
+    @public
     def health_check():
         return {'status': 'healthy'}, 200
 
+    @app.route('/metrics')
+    @public
+    def metrics():
+        """Per-process service metrics"""
+        from services.llm_cache import llm_cache
+        from services.job_queue import job_queue
+        from services.nlp_parser_service import NLPParser
+        from services.user_services import user_services
+        return {
+            'parser': NLPParser.stats(),
+            'llm_cache': llm_cache.stats(),
+            'jobs': job_queue.stats(),
+            'active_users': len(user_services),
+        }, 200
+
     from routes.tasks import tasks_bp
     from routes.chat import chat_bp
     from routes.calendar import calender_bp
+    from routes.auth import auth_bp
 
     app.register_blueprint(tasks_bp, url_prefix='/api/tasks')
     app.register_blueprint(chat_bp, url_prefix='/api/chat')
     app.register_blueprint(calender_bp, url_prefix='/api/calendar')
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
 
     return app
 app = create_app()
@@ -0,0 +1,129 @@
+"""Compare the slotted Task against the previous dict-backed class.
+
+Run from backend/:  python -m benchmarks.task_codec_bench
+"""
+import gc
+import json
+import time
+import tracemalloc
+import uuid
+from typing import Optional
+
+from models.task import Task
+
+
+# the Task class as it was before it used __slots__ and the bulk codec
+class LegacyTask:
+    def __init__(self,
+                 id: str,
+                 title: str,
+                 description: Optional[str]=None,
+                 due_date: Optional[str]=None,
+                 due_time: Optional[str]=None,
+                 priority: str = "medium",
+                 status: str = "todo",
+                 created_at: Optional[str]=None,
+                 task_type: str = "work",
+                 duration_est: Optional[int]=None,
+                 calendar_event_id: Optional[str]=None
+                 ):
+        self.calendar_event_id = calendar_event_id
+        self.id = id
+        self.title = title
+        self.description = description
+        self.due_date = due_date
+        self.due_time = due_time
+        self.priority = priority
+        self.status = status
+        self.created_at = created_at
+        self.task_type = task_type
+        self.duration_est = duration_est
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'due_date': self.due_date,
+            'due_time': self.due_time,
+            'priority': self.priority,
+            'status': self.status,
+            'created_at': self.created_at,
+            'task_type': self.task_type,
+            'duration_est': self.duration_est,
+            'calendar_event_id': self.calendar_event_id
+        }
+
+    @staticmethod
+    def from_dict(info):
+        return LegacyTask(**info)
+
+
+def make_raw(count: int) -> bytes:
+    tasks = []
+    for i in range(count):
+        tasks.append({
+            'id': str(uuid.uuid4()),
+            'title': f"task number {i}",
+            'description': None,
+            'due_date': f"2026-02-{i % 28 + 1:02d}",
+            'due_time': f"{i % 24:02d}:00" if i % 3 else None,
+            'priority': ('low', 'medium', 'high')[i % 3],
+            'status': ('todo', 'in_progress', 'done')[i % 3],
+            'created_at': None,
+            'task_type': ('personal', 'work', 'quick')[i % 3],
+            'duration_est': (i % 12) * 10 or None,
+            'calendar_event_id': None
+        })
+    return json.dumps(tasks, indent=2).encode('utf-8')
+
+
+def legacy_decode(raw: bytes):
+    return [LegacyTask.from_dict(info) for info in json.loads(raw)]
+
+
+def legacy_encode(tasks) -> bytes:
+    return json.dumps([task.to_dict() for task in tasks], indent=2).encode('utf-8')
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bytes_per_task(decode, raw: bytes, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    tasks = decode(raw)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tasks
+    return size / count
+
+
+def run(count: int):
+    raw = make_raw(count)
+    legacy_tasks = legacy_decode(raw)
+    tasks = Task.decode_many(raw)
+
+    rows = [
+        ('legacy', bytes_per_task(legacy_decode, raw, count),
+         best_of(lambda: legacy_decode(raw)), best_of(lambda: legacy_encode(legacy_tasks))),
+        ('slotted', bytes_per_task(Task.decode_many, raw, count),
+         best_of(lambda: Task.decode_many(raw)), best_of(lambda: Task.encode_many(tasks))),
+    ]
+
+    print(f"\n{count:,} tasks ({len(raw) / 1e6:.1f} MB of JSON)")
+    print(f"{'':10}{'bytes/task':>12}{'decode/s':>14}{'encode/s':>14}")
+    for name, mem, decode_s, encode_s in rows:
+        print(f"{name:10}{mem:12.0f}{count / decode_s:14,.0f}{count / encode_s:14,.0f}")
+
+
+if __name__ == '__main__':
+    for n in (10_000, 100_000):
+        run(n)
@@ -18,4 +18,83 @@ class Config:
     TASKS_FILE = 'data/tasks.json'
     CREDENTIALS_FILE = 'data/credentials.json'
 
+    # multi-user mode: every request needs a user token signed with SECRET_KEY,
+    # which POST /api/auth/token issues to callers holding API_KEY (the front
+    # end); tokens expire after USER_TOKEN_MAX_AGE seconds. Without it every
+    # request acts as the 'default' user
+    MULTI_USER = os.getenv('MULTI_USER', 'false').lower() == 'true'
+    API_KEY = os.getenv('API_KEY')
+    USER_TOKEN_MAX_AGE = int(os.getenv('USER_TOKEN_MAX_AGE', str(12 * 3600)))
+
+    # users other than 'default' keep their tasks, credentials and calendar
+    # mirror under USERS_DIR/<user id>/; the data of at most USER_CACHE_SIZE
+    # recently active users is kept loaded per process
+    USERS_DIR = os.getenv('USERS_DIR', 'data/users')
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '256'))
+
+    # Task storage: 'json' rewrites tasks.json in the background,
+    # 'journal' appends each change to tasks.json.journal,
+    # 'sqlite' keeps tasks in TASKS_DB_FILE
+    TASKS_STORAGE = os.getenv('TASKS_STORAGE', 'json')
+    TASKS_DB_FILE = os.getenv('TASKS_DB_FILE', 'data/tasks.db')
+    # seconds to wait before writing pending changes to disk (json)
+    TASKS_FLUSH_DELAY = float(os.getenv('TASKS_FLUSH_DELAY', '0.5'))
+    # journal size that triggers folding it back into tasks.json (journal)
+    TASKS_JOURNAL_COMPACT_BYTES = int(os.getenv('TASKS_JOURNAL_COMPACT_BYTES', str(1024 * 1024)))
+    TASKS_JOURNAL_FSYNC = os.getenv('TASKS_JOURNAL_FSYNC', 'false').lower() == 'true'
+    # confidence the local rule-based parser needs before the LLM is skipped (above 1 disables it)
+    PARSER_LOCAL_CONFIDENCE = float(os.getenv('PARSER_LOCAL_CONFIDENCE', '0.8'))
+    # inputs per LLM request when parsing many at once, and how many of those requests run concurrently
+    PARSE_BATCH_SIZE = int(os.getenv('PARSE_BATCH_SIZE', '20'))
+    PARSE_BATCH_WORKERS = int(os.getenv('PARSE_BATCH_WORKERS', '4'))
+
+    # LLM response cache: in-memory LRU size, default lifetime in seconds,
+    # and an optional SQLite file that keeps entries across restarts
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1024'))
+    LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', str(24 * 3600)))
+    LLM_CACHE_DB = os.getenv('LLM_CACHE_DB', '')
+
+    # regenerate a changed daily summary in the background, serving the previous one meanwhile
+    SUMMARY_BACKGROUND_REFRESH = os.getenv('SUMMARY_BACKGROUND_REFRESH', 'true').lower() == 'true'
+
+    # chat memory: token budget per request, and how many idle sessions to keep
+    CHAT_TOKEN_BUDGET = int(os.getenv('CHAT_TOKEN_BUDGET', '3000'))
+    CHAT_MAX_SESSIONS = int(os.getenv('CHAT_MAX_SESSIONS', '1000'))
+    CHAT_SESSION_IDLE_SECONDS = float(os.getenv('CHAT_SESSION_IDLE_SECONDS', str(6 * 3600)))
+
+    # background jobs (calendar sync): SQLite job table, attempts before a job is
+    # given up, and the first retry delay in seconds (doubled on each retry)
+    JOBS_DB = os.getenv('JOBS_DB', 'data/jobs.db')
+    JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', '6'))
+    JOBS_RETRY_BASE_SECONDS = float(os.getenv('JOBS_RETRY_BASE_SECONDS', '2'))
+
+    # refresh the Google access token this many seconds before it expires (keep above
+    # google-auth's 225s threshold, past which requests would refresh it themselves)
+    CALENDAR_REFRESH_AHEAD_SECONDS = float(os.getenv('CALENDAR_REFRESH_AHEAD_SECONDS', '300'))
+
+    # local copy of the Google calendar, and how old (seconds) it may get before a read syncs it
+    CALENDAR_MIRROR_DB = os.getenv('CALENDAR_MIRROR_DB', 'data/calendar.db')
+    CALENDAR_MIRROR_MAX_STALENESS = float(os.getenv('CALENDAR_MIRROR_MAX_STALENESS', '60'))
+
+    # time zone of timed events, and of the calendar's busy time when planning
+    CALENDAR_TIMEZONE = os.getenv('CALENDAR_TIMEZONE', 'America/New_York')
+
+    # workload planner: how many days around the wanted date it searches, and
+    # the working hours (HH:MM) that free slots are looked for in
+    PLANNER_HORIZON_DAYS = int(os.getenv('PLANNER_HORIZON_DAYS', '14'))
+    PLANNER_DAY_START = os.getenv('PLANNER_DAY_START', '09:00')
+    PLANNER_DAY_END = os.getenv('PLANNER_DAY_END', '18:00')
+
+    # bulk import: concurrent LLM parse requests and the most rows one request may import
+    BULK_PARSE_WORKERS = int(os.getenv('BULK_PARSE_WORKERS', '8'))
+    BULK_IMPORT_MAX_ROWS = int(os.getenv('BULK_IMPORT_MAX_ROWS', '50000'))
+
+    # task matching for chat deletes: local confidence needed to skip the LLM,
+    # and how many top-ranked tasks the LLM is shown otherwise
+    MATCH_LOCAL_CONFIDENCE = float(os.getenv('MATCH_LOCAL_CONFIDENCE', '0.6'))
+    MATCH_LLM_CANDIDATES = int(os.getenv('MATCH_LLM_CANDIDATES', '5'))
+
+    # how many recent task changes to keep for GET /api/tasks/changes
+    TASKS_CHANGELOG_SIZE = int(os.getenv('TASKS_CHANGELOG_SIZE', '1000'))
+
     os.makedirs(DATA_DIR, exist_ok=True)
@@ -0,0 +1,19 @@
+import os
+
+# gunicorn loads this file automatically when started from backend/.
+#
+# Thread workers run each request on its own thread, so a request waiting
+# on OpenAI or Google Calendar (or on a task file lock or a busy SQLite
+# database) only holds that thread. GUNICORN_THREADS bounds the requests in
+# flight per worker, streaming chat responses included. The task and job
+# stores block on flock and SQLite, so event-loop workers such as gevent
+# would stall every request on the worker and are not supported.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+
+# requests each worker keeps in flight
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
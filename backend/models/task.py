@@ -1,8 +1,70 @@
-from datetime import datetime
-from typing import Optional
+import json
+import re
+import sys
+from datetime import date
+from typing import Iterable, List, Optional, Union
+
+TASK_FIELDS = (
+    'id', 'title', 'description', 'due_date', 'due_time', 'priority',
+    'status', 'created_at', 'task_type', 'duration_est', 'calendar_event_id'
+)
+
+PRIORITIES = ('low', 'medium', 'high')
+STATUSES = ('todo', 'in_progress', 'done')
+TASK_TYPES = ('personal', 'work', 'quick')
+# statuses that count towards a day's workload
+OPEN_STATUSES = ('todo', 'in_progress')
+
+_encoder = json.JSONEncoder()
+
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+HH_MM = re.compile(r'([01]\d|2[0-3]):[0-5]\d')
+
+# canonical string objects, so every task shares the same ones
+_PRIORITIES = {value: value for value in PRIORITIES}
+_STATUSES = {value: value for value in STATUSES}
+_TASK_TYPES = {value: value for value in TASK_TYPES}
+
+
+def _choice(value, choices: dict, default: str, field: str) -> str:
+    if value is None:
+        return choices[default]
+    try:
+        return choices[value]
+    except (KeyError, TypeError):
+        raise ValueError(f"Invalid {field}: {value!r} (expected one of {', '.join(choices)})")
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if type(value) is str else value
+
+
+def task_fields_error(task_data: dict) -> Optional[str]:
+    """Why due_date, due_time, task_type or duration_est in task data can't be stored, or None"""
+    due_date = task_data.get('due_date')
+    if due_date is not None:
+        try:
+            date.fromisoformat(due_date)
+            valid = ISO_DATE.fullmatch(due_date) is not None
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            return 'due_date must be YYYY-MM-DD'
+    due_time = task_data.get('due_time')
+    if due_time is not None and (type(due_time) is not str or not HH_MM.fullmatch(due_time)):
+        return 'due_time must be HH:MM'
+    if task_data.get('task_type') is not None and task_data['task_type'] not in TASK_TYPES:
+        return f"task_type must be one of {', '.join(TASK_TYPES)}"
+    duration = task_data.get('duration_est')
+    if duration is not None and (type(duration) is not int or duration < 0):
+        return 'duration_est must be a non-negative integer (minutes)'
+    return None
+
 
 # class object representing a singular task given by the user.
 class Task:
+    __slots__ = TASK_FIELDS
+
     # constructor
     def __init__(self,
                  id: str,
@@ -21,12 +83,12 @@ class Task:
         self.id = id
         self.title = title
         self.description = description
-        self.due_date = due_date # YYYY-MM-DD format
-        self.due_time = due_time # HH:MM format
-        self.priority = priority # one of low, med, high
-        self.status = status # one of todo, in prog, done
+        self.due_date = _intern(due_date) # YYYY-MM-DD format
+        self.due_time = _intern(due_time) # HH:MM format
+        self.priority = _choice(priority, _PRIORITIES, 'medium', 'priority') # one of low, medium, high
+        self.status = _choice(status, _STATUSES, 'todo', 'status') # one of todo, in_progress, done
         self.created_at = created_at
-        self.task_type = task_type # personal, work, quick
+        self.task_type = _choice(task_type, _TASK_TYPES, 'work', 'task_type') # personal, work, quick
         self.duration_est = duration_est # in mins
 
     # convert task into data to store
@@ -45,7 +107,45 @@ class Task:
             'calendar_event_id': self.calendar_event_id
         }
 
+    # estimated minutes as an int (0 when unknown)
+    def duration_minutes(self) -> int:
+        try:
+            return int(self.duration_est or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    # field values in TASK_FIELDS order
+    def to_values(self) -> tuple:
+        return (self.id, self.title, self.description, self.due_date, self.due_time, self.priority,
+                self.status, self.created_at, self.task_type, self.duration_est, self.calendar_event_id)
+
     # return the task from the given data
     @staticmethod
     def from_dict(info):
-        return Task(**info)
\ No newline at end of file
+        return Task(**info)
+
+    # build a task from field values in TASK_FIELDS order
+    @staticmethod
+    def from_values(values: Iterable) -> 'Task':
+        return Task(*values)
+
+    # bulk codec for whole task lists
+
+    @staticmethod
+    def decode_many(raw: Union[str, bytes]) -> List['Task']:
+        """Decode a JSON array of stored tasks"""
+        from_values = Task.from_values
+        return [
+            from_values([info.get(field) for field in TASK_FIELDS])
+            for info in json.loads(raw)
+        ]
+
+    @staticmethod
+    def encode_many(tasks: Iterable['Task']) -> bytes:
+        """Encode tasks as the JSON array stored in tasks.json, one task per line"""
+        # the C encoder is only used without indent, so encode tasks one by one
+        encode = _encoder.encode
+        lines = [encode(dict(zip(TASK_FIELDS, task.to_values()))) for task in tasks]
+        if not lines:
+            return b'[]'
+        return ('[\n' + ',\n'.join(lines) + '\n]').encode('utf-8')
@@ -0,0 +1,28 @@
+import hmac
+
+from flask import Blueprint, request, jsonify
+
+from config import Config
+from services.tenancy import issue_user_token, normalize_user_id, public, valid_user_id
+
+auth_bp = Blueprint('auth', __name__)
+
+
+@auth_bp.route('/token', methods=['POST'])
+@public
+def issue_token():
+    """Issue a user token to the front end, which has already signed the user in.
+
+    Needs the X-Api-Key header to match API_KEY. Body: {"user_id": "..."}.
+    The id is lowercased. Returns {"user_id", "token", "expires_in"}; send the token as "Authorization: Bearer <token>"."""
+    if not Config.MULTI_USER:
+        return jsonify({'error': 'Tokens are only used when MULTI_USER is on'}), 404
+    api_key = request.headers.get('X-Api-Key', '')
+    if not hmac.compare_digest(api_key.encode(), Config.API_KEY.encode()):
+        return jsonify({'error': 'Invalid API key'}), 401
+
+    data = request.get_json(silent=True)
+    user_id = normalize_user_id(data.get('user_id') if isinstance(data, dict) else None)
+    if not valid_user_id(user_id):
+        return jsonify({'error': 'Invalid user_id'}), 400
+    return jsonify({'user_id': user_id, 'token': issue_user_token(user_id), 'expires_in': Config.USER_TOKEN_MAX_AGE}), 200
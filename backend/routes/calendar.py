@@ -1,23 +1,51 @@
-from flask import Blueprint, request, jsonify, redirect
-from services.calendar_services import CalendarService
+from flask import Blueprint, g, request, jsonify, redirect
+from itsdangerous import BadSignature, URLSafeSerializer
+from config import Config
+from services.tenancy import DEFAULT_USER, public
+from services.job_queue import job_queue
+from services.user_services import user_services
 
 calender_bp = Blueprint('calender', __name__)
-calender_service = CalendarService()
+# the OAuth state carries the user id through Google's redirect, signed so it can't be swapped
+oauth_state = URLSafeSerializer(Config.SECRET_KEY, salt='calendar-oauth')
+
+def _calendar_service():
+    """Calendar of the user making the request"""
+    return user_services.get(g.user_id).calendar_service
+
+def _task_service():
+    return user_services.get(g.user_id).task_service
 
 @calender_bp.route('/auth', methods=['GET'])
 def initiate_auth():
     """Authenticate user"""
-    auth_url = calender_service.get_auth_url()
+    auth_url = _calendar_service().get_auth_url(state=oauth_state.dumps(g.user_id))
     return jsonify({'auth_url': auth_url}), 200
 
 @calender_bp.route('/callback', methods=['GET'])
+@public
 def oauth_callback():
     code = request.args.get('code')
     if not code:
         return jsonify({'error': 'No authorization code provided'}), 400
 
+    state = request.args.get('state')
+    try:
+        # Google's redirect carries no user token; the user comes from the state we signed
+        if state:
+            user_id = oauth_state.loads(state)
+        elif Config.MULTI_USER:
+            raise BadSignature('missing state')
+        else:
+            user_id = DEFAULT_USER
+    except BadSignature:
+        return jsonify({'error': 'Invalid state'}), 400
+
     try:
-        calender_service.handle_oauth_callback(code)
+        calendar_service = user_services.get(user_id).calendar_service
+        calendar_service.handle_oauth_callback(code)
+        # e.g. deletes of events whose tasks were deleted while logged out
+        job_queue.release(calendar_service.login_hold_key)
 
         return redirect('https://localhost:8501?auth=success')
     except Exception as e:
@@ -27,35 +55,135 @@ def oauth_callback():
 @calender_bp.route('/status', methods=['GET'])
 def get_auth_status():
     """Check if user is authenticated with Google Calendar"""
-    is_authenticated = calender_service.is_authenticated()
+    is_authenticated = _calendar_service().is_authenticated()
     return jsonify({'authenticated': is_authenticated}), 200
 
 @calender_bp.route('/events', methods=['GET'])
 def get_events():
     """Get upcoming events"""
+    calender_service = _calendar_service()
     if not calender_service.is_authenticated():
         return jsonify({'error': 'Not authenticated'}), 401
 
     max_results = request.args.get('max_results', 10, type=int)
-    events = calender_service.get_upcoming_events(max_results=max_results)
+    max_staleness = request.args.get('max_staleness', type=float)
+    events = calender_service.get_upcoming_events(max_results=max_results, max_staleness=max_staleness)
     return jsonify({'events': events}), 200
 
 @calender_bp.route('/sync-task/<task_id>', methods=['POST'])
 def sync_task(task_id):
     """Sync task"""
+    calender_service, task_service = _calendar_service(), _task_service()
     if not calender_service.is_authenticated():
         return jsonify({'error': 'Not authenticated'}), 401
 
-    from backend.services.tasks_service import TaskService
-    task_service = TaskService()
-
     task = task_service.get_task(task_id)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
 
     try:
-        event_id = calender_service.create_event(task.to_dict())
+        event_id = calender_service.create_event(task.to_dict(), event_id=calender_service.event_id_for(task_id))
         task_service.update_task(task_id, {'calendar_event_id': event_id})
         return jsonify({'message': 'Task synced to calendar', 'event_id': event_id}), 200
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+def _valid_task_ids(task_ids) -> bool:
+    return isinstance(task_ids, list) and all(isinstance(task_id, str) for task_id in task_ids)
+
+
+def _requested_tasks(data: dict, default):
+    """Look up body['task_ids'], or use default() when no ids are given.
+
+    Returns (tasks, results) where results holds an entry for every requested id,
+    already filled in for ids that are missing."""
+    task_service = _task_service()
+    task_ids = data.get('task_ids')
+    if task_ids is None:
+        tasks = default()
+        return tasks, {task.id: {'task_id': task.id} for task in tasks}
+
+    tasks, results = [], {}
+    for task_id in task_ids:
+        if task_id in results:
+            continue
+        task = task_service.get_task(task_id)
+        if task is None:
+            results[task_id] = {'task_id': task_id, 'error': 'Task not found'}
+        else:
+            results[task_id] = {'task_id': task_id}
+            tasks.append(task)
+    return tasks, results
+
+@calender_bp.route('/sync-tasks', methods=['POST'])
+def sync_tasks():
+    """Sync many tasks in batched calendar requests.
+
+    Body: {"task_ids": [...]}; without task_ids, every dated task that isn't synced yet."""
+    calender_service, task_service = _calendar_service(), _task_service()
+    if not calender_service.is_authenticated():
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = request.get_json(silent=True) or {}
+    if not _valid_task_ids(data.get('task_ids', [])):
+        return jsonify({'error': 'task_ids must be a list of strings'}), 400
+
+    tasks, results = _requested_tasks(
+        data, lambda: [task for task in task_service.get_all_tasks() if task.due_date and not task.calendar_event_id]
+    )
+
+    to_create = []
+    for task in tasks:
+        if task.calendar_event_id:
+            results[task.id].update(event_id=task.calendar_event_id, skipped=True)
+        else:
+            to_create.append(task.to_dict())
+
+    for result in calender_service.create_events(to_create):
+        results[result['task_id']].update(result)
+        if 'event_id' in result:
+            task_service.update_task(result['task_id'], {'calendar_event_id': result['event_id']})
+
+    results = list(results.values())
+    return jsonify({
+        'results': results,
+        'synced': sum(1 for r in results if 'event_id' in r and not r.get('skipped')),
+        'failed': sum(1 for r in results if 'error' in r)
+    }), 200
+
+@calender_bp.route('/unsync-tasks', methods=['POST'])
+def unsync_tasks():
+    """Remove many tasks' calendar events in batched calendar requests.
+
+    Body: {"task_ids": [...]}; without task_ids, every synced task."""
+    calender_service, task_service = _calendar_service(), _task_service()
+    if not calender_service.is_authenticated():
+        return jsonify({'error': 'Not authenticated'}), 401
+
+    data = request.get_json(silent=True) or {}
+    if not _valid_task_ids(data.get('task_ids', [])):
+        return jsonify({'error': 'task_ids must be a list of strings'}), 400
+
+    tasks, results = _requested_tasks(
+        data, lambda: [task for task in task_service.get_all_tasks() if task.calendar_event_id]
+    )
+
+    synced = []
+    for task in tasks:
+        if task.calendar_event_id:
+            synced.append(task)
+        else:
+            results[task.id]['skipped'] = True
+
+    deleted = calender_service.delete_events([task.calendar_event_id for task in synced])
+    for task, result in zip(synced, deleted):
+        results[task.id].update(result)
+        if result.get('deleted'):
+            task_service.update_task(task.id, {'calendar_event_id': None})
+
+    results = list(results.values())
+    return jsonify({
+        'results': results,
+        'deleted': sum(1 for r in results if r.get('deleted')),
+        'failed': sum(1 for r in results if 'error' in r)
+    }), 200
@@ -1,15 +1,29 @@
-from flask import Blueprint, jsonify, request
+import json
+
+from flask import Blueprint, Response, g, jsonify, request, stream_with_context
+from services.llm_cache import llm_cache
 from services.openai_service import OpenAIService
-from services.tasks_service import TaskService
+from services.planner_service import local_now
+from services.summary_service import DailySummaryService
+from services.task_matcher import TaskMatcher
+from services.tenancy import UserCache
+from services.user_services import user_services
 import openai
 from config import Config
 
 chat_bp = Blueprint('chat', __name__)
 openai_service = OpenAIService()
-tasks_service = TaskService()
+# each user's summaries, for the most recently active users
+summary_services = UserCache(lambda user_id: DailySummaryService(openai_service), Config.USER_CACHE_SIZE)
 
 openai.api_key = Config.OPENAI_API_KEY
 
+def _session_id(data: dict) -> str:
+    """Conversation session from the request body or the X-Session-Id header, within the requesting user's"""
+    session_id = str(data.get('session_id') or request.headers.get('X-Session-Id') or 'default')
+    return f"{g.user_id}:{session_id}"
+
+
 @chat_bp.route('/message', methods=['POST'])
 def send_message():
     """Send a message to the AI assistant"""
@@ -19,26 +33,63 @@ def send_message():
         return jsonify({'error': 'Message not found'}), 400
 
     user_message = data['message']
-    response = openai_service.chat(user_message)
+    response = openai_service.chat(user_message, session_id=_session_id(data))
     return jsonify({'response': response}), 200
 
+@chat_bp.route('/message/stream', methods=['POST'])
+def stream_message():
+    """Send a message to the AI assistant and stream the reply as Server-Sent Events.
+
+    Each piece of the reply is a `data: {"delta": "..."}` event; the stream
+    ends with an `event: done` event, or `event: error` if generation failed."""
+    data = request.get_json()
+
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message not found'}), 400
+
+    deltas = openai_service.chat_stream(data['message'], session_id=_session_id(data))
+
+    def events():
+        try:
+            for delta in deltas:
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @chat_bp.route('/daily-summary', methods=['GET'])
 def get_daily_summary():
     """Get the daily summary for the user"""
-    tasks = tasks_service.get_all_tasks()
+    today = local_now().date().isoformat()
+    tasks_service = user_services.get(g.user_id).task_service
+    tasks = tasks_service.tasks_for_date(today) + tasks_service.tasks_for_date(None)
     tasks_dict = [task.to_dict() for task in tasks]
 
-    summary = openai_service.generate_daily_summary(tasks_dict)
+    result = summary_services.get(g.user_id).get_summary(today, tasks_dict)
 
     return jsonify({
-        'summary': summary,
-        'task_count': len(tasks)
+        'summary': result['summary'],
+        'task_count': len(tasks),
+        'stale': result['stale'],
+        'fingerprint': result['fingerprint']
     }), 200
 
 
 @chat_bp.route('/match-task', methods=['POST'])
 def match_task():
-    """Use AI to match user input to a task"""
+    """Match user input to a task.
+
+    Tasks are ranked locally (title terms plus due date/time); the LLM is
+    only asked when the best local match isn't clearly right, and then only
+    about the top few candidates."""
     data = request.get_json()
 
     if not data or 'user_input' not in data or 'tasks' not in data:
@@ -50,10 +101,26 @@ def match_task():
     if not tasks:
         return jsonify({'matched_index': None}), 200
 
+    best, confidence, ranked = TaskMatcher(tasks).match(user_input)
+    if best is not None and confidence >= Config.MATCH_LOCAL_CONFIDENCE:
+        return jsonify({'matched_index': best, 'confidence': confidence, 'method': 'local'}), 200
+
+    # with no overlap at all the ranking says nothing, so only a short list is worth asking about
+    if best is None and len(tasks) > Config.MATCH_LLM_CANDIDATES:
+        return jsonify({'matched_index': None, 'confidence': 0.0, 'method': 'local'}), 200
+
+    candidates = ranked[:Config.MATCH_LLM_CANDIDATES]
+    matched_index = _match_with_llm(user_input, tasks, candidates)
+    return jsonify({'matched_index': matched_index, 'confidence': confidence, 'method': 'llm'}), 200
+
+
+def _match_with_llm(user_input: str, tasks: list, candidates: list):
+    """Ask the LLM which candidate (positions in tasks) the user means; None if none or on error"""
     # Build prompt for AI
     task_descriptions = []
-    for task in tasks:
-        desc = f"Index {task['index']}: {task['title']}"
+    for position in candidates:
+        task = tasks[position]
+        desc = f"Index {position}: {task['title']}"
         if task.get('due_date'):
             desc += f" on {task['due_date']}"
         if task.get('due_time'):
@@ -74,23 +141,23 @@ Examples:
 
 Response (number only):"""
 
-    try:
-        import openai
+    messages = [
+        {"role": "system", "content": "You match user requests to task indices. Respond with only a number."},
+        {"role": "user", "content": prompt}
+    ]
+
+    def request_match():
         response = openai.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You match user requests to task indices. Respond with only a number."},
-                {"role": "user", "content": prompt}
-            ]
+            messages=messages
         )
+        return response.choices[0].message.content
 
-        matched_index = int(response.choices[0].message.content.strip())
-
-        if matched_index >= 0 and matched_index < len(tasks):
-            return jsonify({'matched_index': matched_index}), 200
-        else:
-            return jsonify({'matched_index': None}), 200
+    try:
+        content = llm_cache.cached(llm_cache.make_key("gpt-4o-mini", messages), request_match)
+        matched_index = int(content.strip())
+        return matched_index if matched_index in candidates else None
 
     except Exception as e:
         print(f"Error matching task: {e}")
-        return jsonify({'matched_index': None}), 200
\ No newline at end of file
+        return None
\ No newline at end of file
@@ -1,19 +1,264 @@
-from flask import Blueprint, request, jsonify
-from services.tasks_service import TaskService
+import csv
+import json
+import logging
+from datetime import date, datetime, timezone
+
+from flask import Blueprint, Response, g, request, jsonify, stream_with_context
+from models.task import TASK_FIELDS, task_fields_error
 from services.nlp_parser_service import NLPParser
 from services.balancer_service import WorkloadBalancer
-from services.calendar_services import CalendarService
+from services.job_queue import JobHeld, job_queue
+from services.planner_service import local_now
+from services.tenancy import DEFAULT_USER
+from services.user_services import UserServices, user_services
+from services.task_import import ImportTooLarge, TaskImporter, encode_csv, read_csv, read_ndjson
+from googleapiclient.errors import HttpError
 
 tasks_bp = Blueprint('tasks', __name__)
-task_service = TaskService()
 nlp_parser = NLPParser()
-calendar_service = CalendarService()
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 200
+
+
+def _services() -> UserServices:
+    """Task storage and calendar of the user making the request"""
+    return user_services.get(g.user_id)
+
+
+def _enqueue_calendar_job(kind: str, payload: dict, key: str = None):
+    """Queue a calendar job for the requesting user; key makes it idempotent"""
+    job_queue.enqueue(kind, dict(payload, user_id=g.user_id),
+                      idempotency_key=f"{kind}:{g.user_id}:{key}" if key else None)
+
+
+def _add_suggested_dates(services: UserServices, workload_check: dict, task_data: dict):
+    """Add the planner's suggestions to a warned workload check; if planning fails they are left out"""
+    try:
+        workload_check['suggested_dates'] = services.planner.suggest_dates(task_data)
+    except Exception:
+        logger.exception("Could not suggest dates for user %s", services.user_id)
+
+
+def _job_services(payload: dict) -> UserServices:
+    # jobs queued before there were users belong to the default user
+    return user_services.get(payload.get('user_id', DEFAULT_USER))
+
+
+def _require_calendar(services: UserServices, kind: str):
+    """Hold a calendar job until the user logs in to Google, since retrying before then won't help"""
+    if not services.calendar_service.is_authenticated():
+        logger.info("Holding %s job for user %s until they log in to Google Calendar", kind, services.user_id)
+        raise JobHeld(services.calendar_service.login_hold_key)
+
+
+def _create_calendar_event(payload: dict):
+    """Job handler: add a task to Google Calendar and store the event id on the task"""
+    services = _job_services(payload)
+    task = services.task_service.get_task(payload['task_id'])
+    if task is None or task.calendar_event_id:
+        return
+    _require_calendar(services, 'calendar.create')
+
+    calendar_service = services.calendar_service
+    event_id = calendar_service.create_event(task.to_dict(), event_id=calendar_service.event_id_for(task.id))
+    if services.task_service.update_task(task.id, {'calendar_event_id': event_id}) is None:
+        # the task was deleted while its event was being created
+        _delete_calendar_event({'event_id': event_id, 'user_id': services.user_id})
+
+
+def _delete_calendar_event(payload: dict):
+    """Job handler: remove a deleted task's Google Calendar event"""
+    services = _job_services(payload)
+    _require_calendar(services, 'calendar.delete')
+    try:
+        services.calendar_service.delete_event(payload['event_id'])
+    except HttpError as e:
+        if e.resp.status not in (404, 410):
+            raise
+
+
+def _update_calendar_event(payload: dict):
+    """Job handler: rewrite a moved task's Google Calendar event"""
+    services = _job_services(payload)
+    task = services.task_service.get_task(payload['task_id'])
+    if task is None or not task.calendar_event_id:
+        return
+    _require_calendar(services, 'calendar.update')
+    try:
+        services.calendar_service.update_event(task.calendar_event_id, task.to_dict())
+    except HttpError as e:
+        if e.resp.status not in (404, 410):
+            raise
+
+
+job_queue.register('calendar.create', _create_calendar_event)
+job_queue.register('calendar.delete', _delete_calendar_event)
+job_queue.register('calendar.update', _update_calendar_event)
+# pick up jobs left over from a previous run
+job_queue.start()
+
+
+def _encode_tasks(tasks, ndjson: bool):
+    """Yield tasks as a JSON array or NDJSON, a chunk of tasks at a time"""
+    if not ndjson:
+        yield '['
+    chunk = []
+    first = True
+    for task in tasks:
+        chunk.append(json.dumps(task.to_dict()))
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield _join_chunk(chunk, ndjson, first)
+            chunk = []
+            first = False
+    if chunk:
+        yield _join_chunk(chunk, ndjson, first)
+    if not ndjson:
+        yield ']'
+
+
+def _join_chunk(chunk, ndjson: bool, first: bool) -> str:
+    if ndjson:
+        return '\n'.join(chunk) + '\n'
+    return ('' if first else ',') + ','.join(chunk)
+
 
 @tasks_bp.route('/', methods=['GET'])
 def get_all_tasks():
-    """Get all of the tasks"""
-    tasks = task_service.get_all_tasks()
-    return jsonify([task.to_dict() for task in tasks]), 200
+    """Get tasks, optionally filtered and paginated.
+
+    Query params: due_date (repeatable, 'none' for undated tasks), status
+    (repeatable), task_type, priority, limit and cursor. The response is
+    streamed as a JSON array, or as NDJSON with format=ndjson or an
+    Accept: application/x-ndjson header. When more results remain, the
+    cursor for the next page is in the X-Next-Cursor header."""
+    task_service = _services().task_service
+    revision, modified_at = task_service.current_revision()
+    if request.if_none_match.star_tag or any(
+            task_service.matches_revision(tag) for tag in request.if_none_match.as_set()):
+        return _not_modified(revision, modified_at)
+
+    due_dates = [None if d == 'none' else d for d in request.args.getlist('due_date')] or None
+    statuses = request.args.getlist('status') or None
+    limit = request.args.get('limit', type=int)
+    offset = request.args.get('cursor', 0, type=int)
+    if (limit is not None and limit <= 0) or offset < 0:
+        return jsonify({'error': 'limit must be positive and cursor non-negative'}), 400
+
+    tasks = task_service.query_tasks(
+        due_dates=due_dates,
+        statuses=statuses,
+        task_type=request.args.get('task_type'),
+        priority=request.args.get('priority'),
+        offset=offset,
+        limit=limit + 1 if limit is not None else None
+    )
+
+    headers = {}
+    if limit is not None:
+        # fetch one extra task to know whether there is another page
+        tasks = list(tasks)
+        if len(tasks) > limit:
+            tasks = tasks[:limit]
+            headers['X-Next-Cursor'] = str(offset + limit)
+
+    ndjson = request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.best == 'application/x-ndjson'
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+    response = Response(stream_with_context(_encode_tasks(tasks, ndjson)), 200, headers, mimetype=mimetype)
+    _set_revision_headers(response, revision, modified_at)
+    return response
+
+
+@tasks_bp.route('/export', methods=['GET'])
+def export_tasks():
+    """Stream every task as NDJSON (default) or CSV with format=csv, in a form POST /bulk accepts"""
+    tasks = _services().task_service.query_tasks()
+    if request.args.get('format') == 'csv':
+        body, mimetype, extension = encode_csv(tasks), 'text/csv', 'csv'
+    else:
+        body, mimetype, extension = _encode_tasks(tasks, ndjson=True), 'application/x-ndjson', 'ndjson'
+    headers = {'Content-Disposition': f'attachment; filename=tasks.{extension}'}
+    return Response(stream_with_context(body), 200, headers, mimetype=mimetype)
+
+
+@tasks_bp.route('/bulk', methods=['POST'])
+def import_tasks():
+    """Import many tasks from an NDJSON or CSV request body in one write.
+
+    The format comes from the Content-Type (text/csv, otherwise NDJSON) or
+    format=csv|ndjson. Each row is task fields (title required) or free text
+    to parse: a JSON string, or an 'input' field/column. Responds with a
+    result per row; rows with errors (including fields task_fields_error
+    rejects) are skipped."""
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    rows = read_csv(request.stream) if fmt == 'csv' else read_ndjson(request.stream)
+
+    importer = TaskImporter(_services().task_service, parse_many=nlp_parser.parse_many)
+    try:
+        results = importer.run(rows)
+    except ImportTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except (UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': f"Could not read {fmt} body: {e}"}), 400
+
+    return jsonify({
+        'imported': sum(1 for result in results if 'id' in result),
+        'failed': sum(1 for result in results if 'error' in result),
+        'results': results
+    }), 200
+
+
+@tasks_bp.route('/changes', methods=['GET'])
+def get_task_changes():
+    """Get the tasks changed since a revision (from the ETag of a listing or a previous call).
+
+    Returns {'revision', 'reset': False, 'changed': [...], 'deleted': [ids]},
+    or {'revision', 'reset': True, 'tasks': [...]} when the revision is too
+    old or unknown and the client should replace its copy."""
+    since = request.args.get('since')
+    if not since:
+        return jsonify({'error': 'Missing since'}), 400
+
+    task_service = _services().task_service
+    revision, modified_at = task_service.current_revision()
+    if task_service.matches_revision(since):
+        body = {'revision': revision, 'reset': False, 'changed': [], 'deleted': []}
+    else:
+        changes = task_service.changes_since(since)
+        if changes is None:
+            # read the revision first so a change racing this listing is not missed
+            revision, modified_at = task_service.current_revision()
+            body = {
+                'revision': revision,
+                'reset': True,
+                'tasks': [task.to_dict() for task in task_service.get_all_tasks()]
+            }
+        else:
+            revision = changes['revision']
+            body = {
+                'revision': revision,
+                'reset': False,
+                'changed': [task.to_dict() for task in changes['changed']],
+                'deleted': changes['deleted']
+            }
+
+    response = jsonify(body)
+    _set_revision_headers(response, revision, modified_at)
+    return response, 200
+
+
+def _set_revision_headers(response, revision: str, modified_at: float):
+    response.set_etag(revision)
+    response.headers['X-Tasks-Revision'] = revision
+    if modified_at:
+        response.last_modified = datetime.fromtimestamp(modified_at, timezone.utc)
+
+
+def _not_modified(revision: str, modified_at: float):
+    response = Response(status=304)
+    _set_revision_headers(response, revision, modified_at)
+    return response
 
 @tasks_bp.route('/', methods=['POST'])
 def create_task():
@@ -27,32 +272,204 @@ def create_task():
 
     parsed_task =nlp_parser.parse_task(user_input)
 
-    all_tasks = task_service.get_all_tasks()
-    balancer = WorkloadBalancer(all_tasks)
+    services = _services()
+    task_service = services.task_service
+    due_date = parsed_task.get('due_date')
+    balancer = WorkloadBalancer(task_service.workload(due_date) if due_date else {})
     workload_check = balancer.check_new_task_impact(parsed_task)
+    if workload_check['warnings']:
+        _add_suggested_dates(services, workload_check, parsed_task)
 
     new_task = task_service.add_task(parsed_task)
-    event_id = None
+    calendar_sync = None
 
-    if data.get('sync_calendar', False) and parsed_task.get('due_date'):
-        try:
-            if calendar_service.is_authenticated():
-                event_id = calendar_service.create_event(new_task.to_dict())
-                task_service.update_task(new_task.id, {'calendar_event_id': event_id})
-                new_task.calendar_event_id = event_id
-        except Exception as e:
-            print(f"Calendar sync error: {e}")
+    # the event is created in the background; calendar_event_id is set on the task once it exists
+    if data.get('sync_calendar', False) and parsed_task.get('due_date') and services.calendar_service.is_authenticated():
+        _enqueue_calendar_job('calendar.create', {'task_id': new_task.id}, key=new_task.id)
+        calendar_sync = 'queued'
 
     return jsonify({
         'task': new_task.to_dict(),
-        'workload_check': workload_check
+        'workload_check': workload_check,
+        'calendar_sync': calendar_sync
     }), 201
 
+@tasks_bp.route('/batch', methods=['POST'])
+def create_tasks():
+    """Create several tasks in one request and one write.
+
+    Body: {"input": "buy milk, call mom tomorrow"} for one utterance listing
+    tasks, or {"inputs": [...]} for separate inputs. Either way the inputs are
+    parsed with as few LLM requests as possible. Tasks of an utterance that
+    would overload their day get suggested_dates, as in create_task."""
+    data = request.get_json()
+
+    utterance = False
+    if data and isinstance(data.get('inputs'), list):
+        parsed_tasks = nlp_parser.parse_many([str(usr_input) for usr_input in data['inputs']])
+    elif data and data.get('input'):
+        parsed_tasks = nlp_parser.parse_tasks(data['input'])
+        utterance = True
+    else:
+        return jsonify({'error': 'Missing input'}), 400
+
+    services = _services()
+    task_service = services.task_service
+    new_tasks, workload_checks = [], []
+    day_workloads = {}
+    for parsed_task in parsed_tasks:
+        due_date = parsed_task.get('due_date')
+        if due_date and due_date not in day_workloads:
+            day_workloads[due_date] = task_service.workload(due_date)
+        # earlier tasks in the batch count towards the workload of later ones
+        workload_check = WorkloadBalancer(day_workloads.get(due_date, {})).check_new_task_impact(parsed_task)
+        if utterance and workload_check['warnings']:
+            _add_suggested_dates(services, workload_check, parsed_task)
+        workload_checks.append(workload_check)
+
+        new_task = task_service.build_task(parsed_task)
+        new_tasks.append(new_task)
+        if due_date:
+            workload = day_workloads[due_date]
+            count, minutes = workload.get(new_task.task_type, (0, 0))
+            workload[new_task.task_type] = (count + 1, minutes + new_task.duration_minutes())
+
+    task_service.add_tasks(new_tasks)
+
+    calendar_sync = None
+    if data.get('sync_calendar', False) and day_workloads and services.calendar_service.is_authenticated():
+        for new_task in new_tasks:
+            if new_task.due_date:
+                _enqueue_calendar_job('calendar.create', {'task_id': new_task.id}, key=new_task.id)
+        calendar_sync = 'queued'
+
+    return jsonify({
+        'tasks': [new_task.to_dict() for new_task in new_tasks],
+        'workload_checks': workload_checks,
+        'calendar_sync': calendar_sync
+    }), 201
+
+@tasks_bp.route('/suggest-dates', methods=['POST'])
+def suggest_dates():
+    """Suggest days, with free slots, that have room for a task.
+
+    Body: {"input": "..."} to parse, or task fields (due_date, task_type,
+    duration_est). Optional: limit (default 3) and horizon, the days searched
+    either side of the due date."""
+    data = request.get_json(silent=True) or {}
+    if data.get('input'):
+        task_data = nlp_parser.parse_task(data['input'])
+    else:
+        task_data = data
+        error = task_fields_error(task_data)
+        if error:
+            return jsonify({'error': error}), 400
+    limit = data.get('limit', 3)
+    horizon = data.get('horizon')
+    if not isinstance(limit, int) or limit <= 0 or (horizon is not None and (not isinstance(horizon, int) or horizon <= 0)):
+        return jsonify({'error': 'limit and horizon must be positive integers'}), 400
+
+    suggestions = _services().planner.suggest_dates(task_data, limit=limit, horizon=horizon)
+    return jsonify({'task': task_data, 'suggestions': suggestions}), 200
+
+@tasks_bp.route('/rebalance', methods=['POST'])
+def rebalance_tasks():
+    """Plan (or with apply, make) moves that spread overloaded days out.
+
+    Body: start_date (default today), days (default 7) and apply (default
+    false). Applied moves also move the tasks' calendar events."""
+    data = request.get_json(silent=True) or {}
+    days = data.get('days', 7)
+    if not isinstance(days, int) or not 1 <= days <= 366:
+        return jsonify({'error': 'days must be between 1 and 366'}), 400
+    try:
+        start = date.fromisoformat(data['start_date']) if data.get('start_date') else local_now().date()
+    except (TypeError, ValueError):
+        return jsonify({'error': 'start_date must be YYYY-MM-DD'}), 400
+
+    services = _services()
+    plan = services.planner.rebalance(start, days)
+    plan['applied'] = False
+    if data.get('apply', False):
+        for move in plan['moves']:
+            task = services.task_service.update_task(move['task_id'], {'due_date': move['to']})
+            if task is not None and task.calendar_event_id:
+                # rewriting an event is idempotent, so repeats need no key
+                _enqueue_calendar_job('calendar.update', {'task_id': task.id})
+        plan['applied'] = True
+    return jsonify(plan), 200
+
+@tasks_bp.route('/schedule', methods=['POST'])
+def schedule_tasks():
+    """Propose (or with commit, set) times for open tasks without a due time.
+
+    Body: start_date (default today), days (default 7), include_undated
+    (default false) to also place tasks without a due date, and commit
+    (default false). Committing sets each task's date and time; with
+    sync_calendar their events are then created or moved in one batch,
+    otherwise tasks that already have events get them moved in the background."""
+    data = request.get_json(silent=True) or {}
+    days = data.get('days', 7)
+    if not isinstance(days, int) or not 1 <= days <= 366:
+        return jsonify({'error': 'days must be between 1 and 366'}), 400
+    try:
+        start = date.fromisoformat(data['start_date']) if data.get('start_date') else local_now().date()
+    except (TypeError, ValueError):
+        return jsonify({'error': 'start_date must be YYYY-MM-DD'}), 400
+
+    services = _services()
+    task_service, calendar_service = services.task_service, services.calendar_service
+    plan = services.scheduler.plan(start, days, include_undated=bool(data.get('include_undated', False)))
+    plan['committed'] = False
+    plan['calendar'] = None
+    if not data.get('commit', False):
+        return jsonify(plan), 200
+
+    scheduled = []
+    for slot in plan['slots']:
+        task = task_service.update_task(slot['task_id'], {
+            'due_date': slot['date'], 'due_time': slot['start'], 'duration_est': slot['duration_est']
+        })
+        if task is not None:
+            scheduled.append(task)
+    plan['committed'] = True
+
+    if data.get('sync_calendar', False) and scheduled and calendar_service.is_authenticated():
+        results = calendar_service.save_events([task.to_dict() for task in scheduled])
+        for result in results:
+            if 'event_id' not in result:
+                continue
+            task_service.update_task(result['task_id'], {'calendar_event_id': result['event_id']})
+            if result.get('existing'):
+                # made by an earlier sync with the old time; rewrite it in the background
+                _enqueue_calendar_job('calendar.update', {'task_id': result['task_id']})
+        plan['calendar'] = {
+            'synced': sum(1 for r in results if 'event_id' in r),
+            'failed': sum(1 for r in results if 'error' in r),
+        }
+    elif any(task.calendar_event_id for task in scheduled):
+        for task in scheduled:
+            if task.calendar_event_id:
+                _enqueue_calendar_job('calendar.update', {'task_id': task.id})
+        plan['calendar'] = 'queued' if calendar_service.is_authenticated() else 'waiting_for_login'
+    return jsonify(plan), 200
+
 @tasks_bp.route('/<task_id>', methods=['PUT'])
 def update_task(task_id):
     """Update a task"""
-    data = request.get_json()
-    updated_task = task_service.update_task(task_id, data)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be an object of task fields'}), 400
+    unknown = sorted(set(data) - set(TASK_FIELDS))
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    error = task_fields_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        updated_task = _services().task_service.update_task(task_id, data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
 
     if updated_task:
         return jsonify(updated_task.to_dict()), 200
@@ -61,17 +478,16 @@ def update_task(task_id):
 @tasks_bp.route('/<task_id>', methods=['DELETE'])
 def delete_task(task_id):
     """Delete a task"""
-    task = task_service.get_task(task_id)
-
-    if task and task.calendar_event_id:
-        if calendar_service.is_authenticated():
-            try:
-                calendar_service.delete_event(task.calendar_event_id)
-                print(f"Deleted calendar event: {task.calendar_event_id}")
-            except Exception as e:
-                print(f"Calendar delete failed: {e}")
-
-    success = task_service.delete_task(task_id)
-    if success:
-        return jsonify({'message': 'Task deleted'}), 200
-    return jsonify({'error': 'Task not found'}), 404
\ No newline at end of file
+    services = _services()
+    task = services.task_service.get_task(task_id)
+
+    success = services.task_service.delete_task(task_id)
+    if not success:
+        return jsonify({'error': 'Task not found'}), 404
+
+    body = {'message': 'Task deleted', 'calendar_delete': None}
+    if task.calendar_event_id:
+        # without a Google login the job is held, keeping the event id, until the user logs in
+        _enqueue_calendar_job('calendar.delete', {'event_id': task.calendar_event_id}, key=task.calendar_event_id)
+        body['calendar_delete'] = 'queued' if services.calendar_service.is_authenticated() else 'waiting_for_login'
+    return jsonify(body), 200
\ No newline at end of file
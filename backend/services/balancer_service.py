@@ -1,5 +1,4 @@
-from typing import List, Dict
-from models.task import Task
+from typing import Dict, Tuple
 
 class WorkloadBalancer:
     """Monitors daily workload while providing warnings when duration and/or tasks
@@ -14,15 +13,9 @@ class WorkloadBalancer:
     RECOMMENDED_DAILY_MINS = 480
     MAX_MINS = 600
 
-    def __init__(self, tasks: List[Task]):
-        self.tasks = tasks
-
-    def get_tasks_for_date(self, date_str: str) -> List[Task]:
-        """Get all tasks for given date"""
-        return [
-            task for task in self.tasks
-            if task.due_date == date_str and task.status in ['todo', 'in_progress']
-        ]
+    def __init__(self, workload: Dict[str, Tuple[int, int]]):
+        # task type -> (open task count, estimated minutes) on the day being checked
+        self.workload = workload
 
     def check_new_task_impact(self, new_task_data: Dict) -> Dict:
         """Check how adding a new task impacts the workload"""
@@ -35,13 +28,11 @@ class WorkloadBalancer:
                 'message': "No due date specified, so no workload impact."
             }
 
-        curr_tasks = self.get_tasks_for_date(due_date)
-
         task_type = new_task_data.get('task_type', 'work')
-        curr_count = sum(1 for t in curr_tasks if t.task_type == task_type)
+        curr_count = self.workload.get(task_type, (0, 0))[0]
         new_count = curr_count + 1
 
-        curr_mins = sum(t.duration_est or 0 for t in curr_tasks)
+        curr_mins = sum(minutes for _, minutes in self.workload.values())
         duration = new_task_data.get('duration_est', 0)
         if isinstance(duration, str):
             try:
@@ -0,0 +1,198 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendar_events (
+    id TEXT PRIMARY KEY,
+    summary TEXT,
+    description TEXT,
+    start_time TEXT NOT NULL,
+    start_utc TEXT NOT NULL,
+    end_utc TEXT NOT NULL,
+    task_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_calendar_events_end ON calendar_events (end_utc, start_utc);
+CREATE TABLE IF NOT EXISTS calendar_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# bumped when the tables change; the mirror is then rebuilt by a full sync
+SCHEMA_VERSION = 2
+
+# how far back the first full sync reaches
+FULL_SYNC_DAYS = 30
+PAGE_SIZE = 250
+
+
+def _utc(point: dict) -> str:
+    """Sortable UTC timestamp for an event start/end ({'dateTime': ...} or {'date': ...})"""
+    if point.get('dateTime'):
+        moment = datetime.fromisoformat(point['dateTime'])
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    # all-day events; the end date is exclusive
+    return f"{date.fromisoformat(point['date']).isoformat()}T00:00:00"
+
+
+class CalendarMirror:
+    """Local copy of the primary calendar, kept current with sync tokens.
+
+    The first sync lists every event from FULL_SYNC_DAYS ago on; after that
+    each sync asks Google only for events changed since the stored sync
+    token. Events live in a SQLite table shared by all workers, so upcoming
+    events are a local query. If Google expires the token (410 Gone) the
+    mirror is rebuilt with a full sync."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def synced_at(self) -> float:
+        """When the last completed sync started (0 if never)"""
+        value = self._get_meta('synced_at')
+        return float(value) if value else 0.0
+
+    def is_stale(self, max_staleness: float) -> bool:
+        synced_at = self.synced_at()
+        dirty_at = float(self._get_meta('dirty_at') or 0)
+        return dirty_at >= synced_at or time.time() - synced_at > max_staleness
+
+    def invalidate(self):
+        """Make the next read sync first, e.g. after this app changed the calendar"""
+        self._set_meta(dirty_at=repr(time.time()))
+
+    def reset(self):
+        """Forget every event and the sync token, e.g. after logging in to another account"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM calendar_events")
+                conn.execute("DELETE FROM calendar_meta")
+
+    def sync(self, service, max_staleness: Optional[float] = None):
+        """Bring the mirror up to date; skipped if another thread just did"""
+        with self._sync_lock:
+            if max_staleness is not None and not self.is_stale(max_staleness):
+                return
+            token = self._get_meta('sync_token')
+            try:
+                self._sync(service, token)
+            except HttpError as e:
+                if token is None or e.resp.status != 410:
+                    raise
+                # the sync token expired; start over
+                self._sync(service, None)
+
+    def upcoming(self, max_results: int = 10) -> List[dict]:
+        """Events that haven't ended yet, soonest first"""
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, summary, description, start_time FROM calendar_events "
+                "WHERE end_utc > ? ORDER BY start_utc LIMIT ?",
+                (now, max_results)
+            ).fetchall()
+        return [
+            {'id': row[0], 'summary': row[1], 'start_time': row[3], 'description': row[2]}
+            for row in rows
+        ]
+
+    def busy(self, start_utc: str, end_utc: str) -> List[Tuple[str, str]]:
+        """(start_utc, end_utc) of the timed events overlapping a UTC range, leaving out tasks' own events"""
+        with self._lock:
+            return self._connection().execute(
+                "SELECT start_utc, end_utc FROM calendar_events "
+                "WHERE end_utc > ? AND start_utc < ? AND task_id IS NULL AND start_time LIKE '%T%' "
+                "ORDER BY start_utc",
+                (start_utc, end_utc)
+            ).fetchall()
+
+    def _sync(self, service, token: Optional[str]):
+        started = time.time()
+        params = {'calendarId': 'primary', 'singleEvents': True, 'maxResults': PAGE_SIZE}
+        if token:
+            params['syncToken'] = token
+        else:
+            start = datetime.now(timezone.utc) - timedelta(days=FULL_SYNC_DAYS)
+            params['timeMin'] = start.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        changed, removed = [], []
+        page_token = None
+        while True:
+            result = service.events().list(pageToken=page_token, **params).execute()
+            for event in result.get('items', []):
+                if event.get('status') == 'cancelled' or 'start' not in event:
+                    removed.append((event['id'],))
+                    continue
+                start = event['start']
+                end = event.get('end', start)
+                changed.append((
+                    event['id'],
+                    event.get('summary', 'Untitled'),
+                    event.get('description', ''),
+                    start.get('dateTime', start.get('date')),
+                    _utc(start),
+                    _utc(end),
+                    event.get('extendedProperties', {}).get('private', {}).get('task_id'),
+                ))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                if not token:
+                    conn.execute("DELETE FROM calendar_events")
+                conn.executemany("INSERT OR REPLACE INTO calendar_events VALUES (?, ?, ?, ?, ?, ?, ?)", changed)
+                conn.executemany("DELETE FROM calendar_events WHERE id = ?", removed)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO calendar_meta (key, value) VALUES (?, ?)",
+                    [('sync_token', result.get('nextSyncToken')), ('synced_at', repr(started))]
+                )
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection().execute("SELECT value FROM calendar_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, **values):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO calendar_meta (key, value) VALUES (?, ?)", values.items())
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # connections must not cross a fork, so each process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            if self._conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                self._conn.executescript(
+                    "DROP TABLE IF EXISTS calendar_events; DROP TABLE IF EXISTS calendar_meta; "
+                    f"PRAGMA user_version = {SCHEMA_VERSION};"
+                )
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
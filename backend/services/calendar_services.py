@@ -1,60 +1,66 @@
-from google.oauth2.credentials import Credentials
+import queue
+import re
+from contextlib import contextmanager
+from typing import List, Tuple
+from zoneinfo import ZoneInfo
+
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
-from datetime import datetime, timedelta
-import os
-import json
+from googleapiclient.errors import HttpError
+from datetime import date, datetime, timedelta, timezone
 from config import Config
+from services.calendar_mirror import CalendarMirror
+from services.credential_manager import CredentialManager
+from services.tenancy import DEFAULT_USER, user_path
 
 class CalendarService:
     SCOPES = ['https://www.googleapis.com/auth/calendar']
+    # requests per batch call; Google recommends at most 50
+    BATCH_SIZE = 50
 
-    def __init__(self):
-        self.credentials_file = Config.CREDENTIALS_FILE
-        self.creds = None
-        self._load_credentials()
+    def __init__(self, user_id: str = DEFAULT_USER):
+        self.user_id = user_id
+        self.credentials_file = user_path(user_id, Config.CREDENTIALS_FILE)
+        self.credentials = CredentialManager.shared(self.credentials_file)
+        # built clients ready for reuse; httplib2 isn't thread-safe, so each is used by one request at a time
+        self._clients = queue.LifoQueue()
+        self._clients_creds = None
+        self.mirror = CalendarMirror(user_path(user_id, Config.CALENDAR_MIRROR_DB))
 
-    def _load_credentials(self):
-        """Load saved credentials if they exist"""
-        if os.path.exists(self.credentials_file):
-            try:
-                with open(self.credentials_file, 'r') as f:
-                    cred_data = json.load(f)
-                    self.creds = Credentials(
-                        token=cred_data.get('token'),
-                        refresh_token=cred_data.get('refresh_token'),
-                        token_uri=cred_data.get('token_uri'),
-                        client_id=cred_data.get('client_id'),
-                        client_secret=cred_data.get('client_secret'),
-                        scopes=cred_data.get('scopes')
-                    )
-
-                    if self.creds and self.creds.expired and self.creds.refresh_token:
-                        from google.auth.transport.requests import Request
-                        self.creds.refresh(Request())
-                        self._save_credentials(self.creds)
-                        print("✅ Refreshed expired credentials")
+    @property
+    def creds(self):
+        return self.credentials.get()
 
-            except Exception as e:
-                print(f"Error loading credentials: {e}")
-                self.creds = None
-
-    def _save_credentials(self, creds):
-        """Save credentials to file"""
-        os.makedirs(os.path.dirname(self.credentials_file), exist_ok=True)
-        cred_dict = {
-            'token': creds.token,
-            'refresh_token': creds.refresh_token,
-            'token_uri': creds.token_uri,
-            'client_id': creds.client_id,
-            'client_secret': creds.client_secret,
-            'scopes': creds.scopes
-        }
-        with open(self.credentials_file, 'w') as f:
-            json.dump(cred_dict, f, indent=2)
-
-    def get_auth_url(self) -> str:
-        """Generate authorization URL"""
+    @contextmanager
+    def _client(self):
+        """Borrow a Calendar API client, building one only when none is free"""
+        creds = self.creds
+        if creds is None:
+            raise Exception("Not authenticated with Google Calendar")
+
+        if creds is not self._clients_creds:
+            # clients are bound to a credentials object; drop the ones built for a previous login
+            self._clients = queue.LifoQueue()
+            self._clients_creds = creds
+        clients = self._clients
+
+        try:
+            service = clients.get_nowait()
+        except queue.Empty:
+            service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
+        try:
+            yield service
+        finally:
+            clients.put(service)
+
+    def close(self):
+        """Release the user's calendar resources, e.g. when their data is unloaded"""
+        self.credentials.close()
+        self.mirror.close()
+        self._clients = queue.LifoQueue()
+
+    def get_auth_url(self, state: str = None) -> str:
+        """Generate authorization URL; Google passes state back to the callback"""
         flow = Flow.from_client_config(
             {
                 "web": {
@@ -69,7 +75,7 @@ class CalendarService:
             redirect_uri=Config.GOOGLE_REDIRECT_URI
         )
 
-        auth_uri, _ = flow.authorization_url(prompt='consent')
+        auth_uri, _ = flow.authorization_url(prompt='consent', state=state)
         return auth_uri
 
     def handle_oauth_callback(self, authorization_code: str):
@@ -89,38 +95,31 @@ class CalendarService:
         )
 
         flow.fetch_token(code=authorization_code)
-        self.creds = flow.credentials
-        self._save_credentials(self.creds)
+        self.credentials.save(flow.credentials)
+        # the login may be for a different account
+        self.mirror.reset()
+
+    @property
+    def login_hold_key(self) -> str:
+        """Hold key of background jobs waiting for this user to log in"""
+        return f"calendar-login:{self.user_id}"
 
     def is_authenticated(self) -> bool:
         """Check if user is authenticated"""
-        if not self.creds:
-            return False
+        creds = self.creds
+        return creds is not None and creds.valid
 
-        # Check if token is expired
-        if self.creds.expired:
-            if self.creds.refresh_token:
-                try:
-                    from google.auth.transport.requests import Request
-                    self.creds.refresh(Request())
-                    self._save_credentials(self.creds)
-                    print("✅ Token refreshed automatically")
-                    return True
-                except Exception as e:
-                    print(f"❌ Failed to refresh token: {e}")
-                    return False
-            else:
-                return False
-
-        return self.creds.valid
-
-    def create_event(self, task: dict) -> str:
-        """Create an event"""
-        if not self.is_authenticated():
-            raise Exception("Not authenticated with Google Calendar")
+    @staticmethod
+    def event_id_for(task_id: str):
+        """Calendar event id derived from a task id, or None if the id isn't a valid event id.
 
-        service = build('calendar', 'v3', credentials=self.creds)
+        Inserting with this id makes creating a task's event idempotent."""
+        event_id = task_id.replace('-', '')
+        return event_id if re.fullmatch(r'[0-9a-v]{5,1024}', event_id) else None
 
+    @staticmethod
+    def _build_event(task: dict) -> dict:
+        """Calendar event body for a task"""
         if task.get('due_date'):
             start_date = task['due_date']
             if task.get('due_time'):
@@ -138,20 +137,17 @@ class CalendarService:
                 start_dt = datetime.fromisoformat(start_datetime)
                 end_dt = start_dt + timedelta(minutes=dur_mins)
                 end_datetime = end_dt.isoformat()
-                start_dt = datetime.fromisoformat(start_datetime)
-                end_dt = start_dt + timedelta(minutes=dur_mins)
-                end_datetime = end_dt.isoformat()
 
                 event = {
                     'summary': task['title'],
                     'description': task.get('description', ''),
                     'start': {
                         'dateTime': start_datetime,
-                        'timeZone': 'America/New_York',
+                        'timeZone': Config.CALENDAR_TIMEZONE,
                     },
                     'end': {
                         'dateTime': end_datetime,
-                        'timeZone': 'America/New_York',
+                        'timeZone': Config.CALENDAR_TIMEZONE,
                     }
                 }
             else:
@@ -169,43 +165,194 @@ class CalendarService:
                 'start': {'date': today},
                 'end': {'date': today},
             }
-        created_event = service.events().insert(calendarId='primary', body=event).execute()
+        if task.get('id'):
+            # lets the mirror tell task events apart from the rest of the calendar
+            event['extendedProperties'] = {'private': {'task_id': task['id']}}
+        return event
+
+    def create_event(self, task: dict, event_id: str = None) -> str:
+        """Create an event, optionally with a caller-chosen id so retries don't create duplicates"""
+        if not self.is_authenticated():
+            raise Exception("Not authenticated with Google Calendar")
+
+        event = self._build_event(task)
+        if event_id:
+            event['id'] = event_id
+        self.mirror.invalidate()
+        try:
+            with self._client() as service:
+                created_event = service.events().insert(calendarId='primary', body=event).execute()
+        except HttpError as e:
+            # an earlier attempt already created this event
+            if event_id and e.resp.status == 409:
+                return event_id
+            raise
         return created_event['id']
 
-    def get_upcoming_events(self, max_results: int = 10) -> list:
-        """Get upcoming events"""
+    def get_upcoming_events(self, max_results: int = 10, max_staleness: float = None) -> list:
+        """Get upcoming events from the local mirror, syncing it first if it is older than max_staleness seconds"""
         if not self.is_authenticated():
             return []
 
-        service = build('calendar', 'v3', credentials=self.creds)
+        self._sync_mirror(max_staleness)
+        return self.mirror.upcoming(max_results)
+
+    def busy_intervals(self, start: date, end: date) -> List[Tuple[datetime, datetime]]:
+        """Busy times from the start date up to (not including) the end date, as local
+        CALENDAR_TIMEZONE datetimes soonest first; empty when not authenticated.
+
+        Timed events count as busy; all-day events and the events of tasks don't."""
+        if not self.is_authenticated():
+            return []
+
+        self._sync_mirror()
+        tz = ZoneInfo(Config.CALENDAR_TIMEZONE)
+
+        def utc(day: date) -> str:
+            return datetime.combine(day, datetime.min.time(), tz).astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+        def local(value: str) -> datetime:
+            return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).astimezone(tz).replace(tzinfo=None)
 
-        now = datetime.utcnow().isoformat() + 'Z'
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=now,
-            maxResults=max_results,
-            singleEvents=True,
-            orderBy='startTime',
-        ).execute()
+        return [(local(start_utc), local(end_utc)) for start_utc, end_utc in self.mirror.busy(utc(start), utc(end))]
 
-        events = events_result.get('items', [])
+    def _sync_mirror(self, max_staleness: float = None):
+        """Sync the mirror if it is older than max_staleness seconds; on failure the mirror is used as it is"""
+        if max_staleness is None:
+            max_staleness = Config.CALENDAR_MIRROR_MAX_STALENESS
+        if self.mirror.is_stale(max_staleness):
+            try:
+                with self._client() as service:
+                    self.mirror.sync(service, max_staleness)
+            except Exception as e:
+                print(f"Calendar sync error: {e}")
+
+    def create_events(self, tasks: List[dict]) -> List[dict]:
+        """Create events for many tasks with batched API requests.
+
+        Returns one result per task, in order: {'task_id', 'event_id'} or {'task_id', 'error'}"""
+        results = [{'task_id': task['id']} for task in tasks]
+        requests = []
+        for result, task in zip(results, tasks):
+            event = self._build_event(task)
+            event_id = self.event_id_for(task['id'])
+            if event_id:
+                event['id'] = event_id
+            requests.append((result, event))
+
+        def on_insert(result, event, response, exception):
+            if exception is None:
+                result['event_id'] = response['id']
+            elif isinstance(exception, HttpError) and exception.resp.status == 409 and 'id' in event:
+                # created by an earlier sync
+                result['event_id'] = event['id']
+            else:
+                result['error'] = str(exception)
+
+        self._execute_batched(
+            requests,
+            lambda service, event: service.events().insert(calendarId='primary', body=event),
+            on_insert
+        )
+        return results
+
+    def save_events(self, tasks: List[dict]) -> List[dict]:
+        """Write the events of many tasks with batched API requests: tasks with a
+        calendar_event_id have their event rewritten, the others get one created.
+
+        Returns one result per task, in order: {'task_id', 'event_id'} or {'task_id', 'error'}.
+        'existing': True marks an event created by an earlier sync, which still has the old details."""
+        results = [{'task_id': task['id']} for task in tasks]
+        requests = []
+        for result, task in zip(results, tasks):
+            event = self._build_event(task)
+            if not task.get('calendar_event_id'):
+                event_id = self.event_id_for(task['id'])
+                if event_id:
+                    event['id'] = event_id
+            requests.append((result, (task.get('calendar_event_id'), event)))
+
+        def make_request(service, item):
+            event_id, event = item
+            if event_id:
+                return service.events().update(calendarId='primary', eventId=event_id, body=event)
+            return service.events().insert(calendarId='primary', body=event)
+
+        def on_save(result, item, response, exception):
+            event_id, event = item
+            if exception is None:
+                result['event_id'] = response['id']
+            elif not event_id and isinstance(exception, HttpError) and exception.resp.status == 409 and 'id' in event:
+                result.update(event_id=event['id'], existing=True)
+            else:
+                result['error'] = str(exception)
+
+        self._execute_batched(requests, make_request, on_save)
+        return results
+
+    def delete_events(self, event_ids: List[str]) -> List[dict]:
+        """Delete many events with batched API requests.
 
-        formatted_events = []
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            formatted_events.append({
-                'id': event['id'],
-                'summary': event.get('summary', 'Untitled'),
-                'start_time': start,
-                'description': event.get('description', ''),
-            })
+        Returns one result per event, in order: {'event_id', 'deleted': True} or {'event_id', 'error'}"""
+        results = [{'event_id': event_id} for event_id in event_ids]
+        requests = [(result, result['event_id']) for result in results]
+
+        def on_delete(result, event_id, response, exception):
+            if exception is None or (isinstance(exception, HttpError) and exception.resp.status in (404, 410)):
+                result['deleted'] = True
+            else:
+                result['error'] = str(exception)
+
+        self._execute_batched(
+            requests,
+            lambda service, event_id: service.events().delete(calendarId='primary', eventId=event_id),
+            on_delete
+        )
+        return results
+
+    def _execute_batched(self, requests: list, make_request, on_response):
+        """Send (result, item) requests in batches of BATCH_SIZE, calling on_response(result, item, response, exception) for each"""
+        if not requests:
+            return
+        self.mirror.invalidate()
+        if not self.is_authenticated():
+            raise Exception("Not authenticated with Google Calendar")
+
+        with self._client() as service:
+            for start in range(0, len(requests), self.BATCH_SIZE):
+                chunk = requests[start:start + self.BATCH_SIZE]
+                answered = set()
+
+                def callback(request_id, response, exception, chunk=chunk, answered=answered):
+                    result, item = chunk[int(request_id)]
+                    answered.add(int(request_id))
+                    on_response(result, item, response, exception)
+
+                batch = service.new_batch_http_request(callback=callback)
+                for index, (_, item) in enumerate(chunk):
+                    batch.add(make_request(service, item), request_id=str(index))
+                try:
+                    batch.execute()
+                except Exception as e:
+                    # the batch call itself failed; report it on every item it didn't answer
+                    for index, (result, _) in enumerate(chunk):
+                        if index not in answered:
+                            result['error'] = str(e)
+
+    def update_event(self, event_id: str, task: dict):
+        """Rewrite a task's event from the task, e.g. after it moved to another day"""
+        if not self.is_authenticated():
+            raise Exception("Not authenticated with Google Calendar")
 
-        return formatted_events
+        self.mirror.invalidate()
+        with self._client() as service:
+            service.events().update(calendarId='primary', eventId=event_id, body=self._build_event(task)).execute()
 
     def delete_event(self, event_id: str):
         """Delete an event"""
         if not self.is_authenticated():
             raise Exception("Not authenticated with Google Calendar")
 
-        service = build('calendar', 'v3', credentials=self.creds)
-        service.events().delete(calendarId='primary', eventId=event_id).execute()
\ No newline at end of file
+        self.mirror.invalidate()
+        with self._client() as service:
+            service.events().delete(calendarId='primary', eventId=event_id).execute()
\ No newline at end of file
@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+
+def estimate_tokens(message: dict) -> int:
+    """Rough token count for a chat message (about 4 characters per token)"""
+    return len(message.get('content') or '') // 4 + 4
+
+
+class Conversation:
+    """One session's chat state: a rolling summary of older turns plus recent turns"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.summary: Optional[str] = None
+        self.turns: List[dict] = []
+        self.summarizing = False
+
+    def window(self, budget: int) -> List[dict]:
+        """The most recent turns that fit in the token budget, oldest first"""
+        selected = []
+        used = 0
+        for message in reversed(self.turns):
+            cost = estimate_tokens(message)
+            if selected and used + cost > budget:
+                break
+            selected.append(message)
+            used += cost
+        selected.reverse()
+        # don't open the window on an assistant reply without its question
+        while len(selected) > 1 and selected[0]['role'] == 'assistant':
+            selected.pop(0)
+        return selected
+
+    def tokens(self) -> int:
+        return sum(estimate_tokens(message) for message in self.turns)
+
+
+class ConversationStore:
+    """Per-session conversations with LRU eviction of idle sessions"""
+
+    def __init__(self, max_sessions: int, idle_seconds: float):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # session id -> (last used, conversation), least recently used first
+        self._sessions: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    def get(self, session_id: str) -> Conversation:
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            conversation = entry[1] if entry else Conversation()
+            self._sessions[session_id] = (now, conversation)
+            self._evict(now)
+            return conversation
+
+    def _evict(self, now: float):
+        while self._sessions:
+            session_id, (last_used, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - last_used > self.idle_seconds:
+                del self._sessions[session_id]
+            else:
+                break
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,186 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from datetime import datetime
+from typing import Optional
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+from config import Config
+
+
+class CredentialManager:
+    """Keeps Google OAuth credentials in memory and fresh.
+
+    One manager is shared per credentials file, so every CalendarService in
+    the process sees a login as soon as it happens; a login or refresh saved
+    by another worker is picked up when the file changes. A background thread
+    refreshes the access token REFRESH_AHEAD seconds before it expires, so
+    requests never wait on a token refresh unless that refresh failed."""
+
+    # weak, so managers of users no longer in use are freed once closed
+    _managers = weakref.WeakValueDictionary()
+    _managers_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, path: str) -> 'CredentialManager':
+        """Return the manager for the given credentials file"""
+        key = os.path.abspath(path)
+        with cls._managers_lock:
+            manager = cls._managers.get(key)
+            if manager is None or manager._closed:
+                manager = cls._managers[key] = cls(path)
+            return manager
+
+    def __init__(self, path: str, refresh_ahead: float = None):
+        self.path = path
+        self.refresh_ahead = Config.CALENDAR_REFRESH_AHEAD_SECONDS if refresh_ahead is None else refresh_ahead
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._creds: Optional[Credentials] = None
+        # what the file looked like when we last read or wrote it
+        self._stamp = None
+        self._refresher = None
+        self._closed = False
+        self._load()
+
+    def get(self) -> Optional[Credentials]:
+        """Current usable credentials, or None if not logged in"""
+        if self._file_stamp() != self._stamp:
+            with self._lock:
+                if self._file_stamp() != self._stamp:
+                    self._load()
+        creds = self._creds
+        if creds is None:
+            return None
+        if creds.expired:
+            # the background refresh didn't make it in time
+            with self._lock:
+                if self._creds is creds and creds.expired and not self._refresh(creds):
+                    return None
+            creds = self._creds
+        self._start_refresher()
+        return creds
+
+    def save(self, creds: Credentials):
+        """Store new credentials from the OAuth flow"""
+        with self._lock:
+            self._creds = creds
+            self._write(creds)
+        self._start_refresher()
+        self._wake.set()
+
+    def close(self):
+        """Stop refreshing in the background; get() still refreshes an expired token itself"""
+        self._closed = True
+        self._wake.set()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _load(self):
+        """Load saved credentials if they exist"""
+        self._stamp = self._file_stamp()
+        if self._stamp is None:
+            self._creds = None
+            return
+        try:
+            with open(self.path, 'r') as f:
+                cred_data = json.load(f)
+            expiry = cred_data.get('expiry')
+            self._creds = Credentials(
+                token=cred_data.get('token'),
+                refresh_token=cred_data.get('refresh_token'),
+                token_uri=cred_data.get('token_uri'),
+                client_id=cred_data.get('client_id'),
+                client_secret=cred_data.get('client_secret'),
+                scopes=cred_data.get('scopes'),
+                # google-auth compares against a naive UTC datetime
+                expiry=datetime.fromisoformat(expiry) if expiry else None
+            )
+        except Exception as e:
+            print(f"Error loading credentials: {e}")
+            self._creds = None
+
+    def _write(self, creds: Credentials):
+        """Save credentials to file"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        cred_dict = {
+            'token': creds.token,
+            'refresh_token': creds.refresh_token,
+            'token_uri': creds.token_uri,
+            'client_id': creds.client_id,
+            'client_secret': creds.client_secret,
+            'scopes': creds.scopes,
+            'expiry': creds.expiry.isoformat() if creds.expiry else None
+        }
+        fd, tmp = tempfile.mkstemp(dir=directory or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cred_dict, f, indent=2)
+            os.replace(tmp, self.path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._stamp = self._file_stamp()
+
+    def _refresh(self, creds: Credentials) -> bool:
+        """Refresh the token in place; callers hold self._lock"""
+        if not creds.refresh_token:
+            return False
+        try:
+            creds.refresh(Request())
+            self._write(creds)
+            print("✅ Token refreshed automatically")
+            return True
+        except Exception as e:
+            print(f"❌ Failed to refresh token: {e}")
+            return False
+
+    def _start_refresher(self):
+        if self._closed or (self._refresher is not None and self._refresher.is_alive()):
+            return
+        with self._lock:
+            if self._refresher is None or not self._refresher.is_alive():
+                self._refresher = threading.Thread(target=self._refresh_loop, name='credential-refresh', daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self):
+        seen, retry_at, failures = None, 0.0, 0
+        while True:
+            creds = self._creds
+            if self._closed or creds is None or not creds.refresh_token:
+                return
+            if creds is not seen:
+                seen, retry_at, failures = creds, 0.0, 0
+
+            # an unknown expiry is refreshed right away, which records one
+            wait = 0.0
+            if creds.expiry is not None:
+                wait = (creds.expiry - datetime.utcnow()).total_seconds() - self.refresh_ahead
+            wait = max(wait, retry_at - time.time())
+
+            if wait > 0:
+                # woken early when new credentials are saved
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+
+            with self._lock:
+                if self._creds is not creds:
+                    continue
+                if self._refresh(creds):
+                    retry_at, failures = 0.0, 0
+                else:
+                    failures += 1
+                    retry_at = time.time() + min(60 * 2 ** failures, 900)
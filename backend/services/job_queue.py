@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    idempotency_key TEXT UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_run_at REAL NOT NULL,
+    locked_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    hold_key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_next_run ON jobs (status, next_run_at);
+"""
+# created after adding hold_key to job tables from before it existed
+HOLD_INDEX = "CREATE INDEX IF NOT EXISTS idx_jobs_hold_key ON jobs (hold_key) WHERE status = 'held'"
+
+# seconds a claimed job may run before another worker may pick it up again
+LEASE_SECONDS = 300
+
+
+class JobHeld(Exception):
+    """Raised by a handler whose job can't run until release(hold_key), e.g. until the user logs in"""
+
+    def __init__(self, hold_key: str):
+        super().__init__(f"Held until {hold_key}")
+        self.hold_key = hold_key
+
+
+class JobQueue:
+    """Durable in-process background job queue.
+
+    Jobs are rows in a SQLite table, so they survive restarts and are shared
+    by all workers. Each process runs one worker thread that claims due jobs
+    and calls the handler registered for the job's kind. A handler that
+    raises is retried with exponential backoff until max_attempts, after
+    which the job is marked dead. A handler that raises JobHeld parks its
+    job, without using up an attempt, until release() is called with the
+    same hold key. Jobs with an idempotency key are only enqueued once while
+    their row is kept."""
+
+    def __init__(self, db_path: str, max_attempts: int = 6, retry_base: float = 2.0,
+                 poll_interval: float = 1.0, keep_seconds: float = 7 * 86400):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.poll_interval = poll_interval
+        self.keep_seconds = keep_seconds
+
+        self._handlers: Dict[str, Callable[[dict], None]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._conn = None
+        self._pid = None
+        self._worker = None
+
+    def register(self, kind: str, handler: Callable[[dict], None]):
+        """Run handler(payload) for jobs of this kind"""
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind: str, payload: dict, idempotency_key: Optional[str] = None,
+                delay: float = 0) -> bool:
+        """Add a job; returns False if a job with the same idempotency key already exists"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (kind, payload, idempotency_key, next_run_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, json.dumps(payload), idempotency_key, now + delay, now, now)
+                )
+        self.start()
+        self._wake.set()
+        return cursor.rowcount == 1
+
+    def start(self):
+        """Start this process's worker thread if it is not running"""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+                return
+            self._connection()
+            self._worker = threading.Thread(target=self._run, name='job-queue', daemon=True)
+            self._worker.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def release(self, hold_key: str) -> int:
+        """Make the jobs held for hold_key due now; returns how many there were"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'pending', hold_key = NULL, next_run_at = ?, updated_at = ? "
+                    "WHERE status = 'held' AND hold_key = ?",
+                    (now, now, hold_key)
+                )
+        if cursor.rowcount:
+            self.start()
+            self._wake.set()
+        return cursor.rowcount
+
+    def run_pending(self) -> int:
+        """Run every job that is due now in the calling thread; returns how many ran"""
+        ran = 0
+        while True:
+            job = self._claim()
+            if job is None:
+                return ran
+            self._execute(job)
+            ran += 1
+
+    def _connection(self) -> sqlite3.Connection:
+        # connections must not cross a fork, so each process opens its own
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+            if 'hold_key' not in columns:
+                try:
+                    self._conn.execute('ALTER TABLE jobs ADD COLUMN hold_key TEXT')
+                except sqlite3.OperationalError:
+                    # another worker added it first
+                    pass
+            self._conn.execute(HOLD_INDEX)
+            self._pid = os.getpid()
+            self._worker = None
+        return self._conn
+
+    def _run(self):
+        last_cleanup = 0.0
+        while True:
+            try:
+                self.run_pending()
+                if time.time() - last_cleanup > 3600:
+                    self._cleanup()
+                    last_cleanup = time.time()
+            except Exception:
+                logger.exception("Job queue error")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _claim(self) -> Optional[tuple]:
+        """Atomically take the oldest due job, leasing it to this worker"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                # BEGIN IMMEDIATE takes the write lock up front so two workers never claim the same job
+                conn.execute('BEGIN IMMEDIATE')
+                row = conn.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs "
+                    "WHERE (status = 'pending' AND next_run_at <= ?) "
+                    "OR (status = 'running' AND locked_until <= ?) "
+                    "ORDER BY next_run_at LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (now + LEASE_SECONDS, now, row[0])
+                )
+        return row
+
+    def _execute(self, job: tuple):
+        job_id, kind, payload, attempts = job
+        attempts += 1
+        handler = self._handlers.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{kind}'")
+            handler(json.loads(payload))
+        except JobHeld as e:
+            # waiting isn't a failed attempt
+            self._hold(job_id, attempts - 1, e.hold_key)
+        except Exception as e:
+            logger.warning("Job %s (%s) failed on attempt %s: %s", job_id, kind, attempts, e)
+            self._finish(job_id, attempts, traceback.format_exception_only(type(e), e)[-1].strip())
+        else:
+            self._finish(job_id, attempts, None)
+
+    def _finish(self, job_id: int, attempts: int, error: Optional[str]):
+        now = time.time()
+        if error is None:
+            status, next_run_at = 'done', now
+        elif attempts >= self.max_attempts:
+            status, next_run_at = 'dead', now
+        else:
+            # 2s, 4s, 8s, ... between attempts
+            status, next_run_at = 'pending', now + self.retry_base * 2 ** (attempts - 1)
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, next_run_at = ?, locked_until = NULL, last_error = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (status, next_run_at, error, now, job_id)
+                )
+
+    def _hold(self, job_id: int, attempts: int, hold_key: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'held', attempts = ?, hold_key = ?, locked_until = NULL, updated_at = ? "
+                    "WHERE id = ?",
+                    (attempts, hold_key, now, job_id)
+                )
+
+    def _cleanup(self):
+        """Drop finished jobs past the retention window"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM jobs WHERE status IN ('done', 'dead') AND updated_at < ?",
+                             (time.time() - self.keep_seconds,))
+
+
+job_queue = JobQueue(
+    Config.JOBS_DB,
+    max_attempts=Config.JOBS_MAX_ATTEMPTS,
+    retry_base=Config.JOBS_RETRY_BASE_SECONDS
+)
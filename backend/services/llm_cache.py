@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# returned by get() when there is no usable entry
+MISSING = object()
+
+
+class LLMCache:
+    """Content-addressed cache for LLM results.
+
+    Keys are hashes of the normalized request (model, messages, functions),
+    so repeated prompts are answered without a remote call. Entries live in
+    a bounded in-memory LRU and, if a database path is configured, in a
+    SQLite table that survives restarts and is shared by workers. Entries
+    can be tied to the current day so date-dependent answers expire at
+    midnight."""
+
+    def __init__(self, max_entries: int = 1024, default_ttl: float = 86400, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), least recently used first
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            with self._db:
+                self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    @staticmethod
+    def make_key(model: str, messages: List[dict], **options) -> str:
+        """Hash of the request with whitespace in message text collapsed and keys sorted"""
+        normalized = [
+            {**message, 'content': re.sub(r'\s+', ' ', message['content']).strip()}
+            if isinstance(message.get('content'), str) else message
+            for message in messages
+        ]
+        payload = json.dumps({'model': model, 'messages': normalized, **options}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def cached(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None, same_day: bool = False):
+        """Return the cached value for key, or compute, store and return it. Errors are not cached"""
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        value = compute()
+        self.set(key, value, ttl=ttl, same_day=same_day)
+        return value
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return entry[1]
+                del self._entries[key]
+                self._counters['expired'] += 1
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                with self._lock:
+                    self._counters['disk_hits'] += 1
+                return value
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return MISSING
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, same_day: bool = False):
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        if same_day:
+            midnight = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+            expires_at = min(expires_at, midnight.timestamp())
+
+        self._remember(key, value, expires_at)
+        if self._db is not None:
+            try:
+                with self._db_lock, self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires_at)
+                    )
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning("LLM cache write error: %s", e)
+
+    def _remember(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+        hits = counters['memory_hits'] + counters['disk_hits']
+        return {
+            **counters,
+            'entries': size,
+            'max_entries': self.max_entries,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+            'disk_tier': self._db is not None,
+        }
+
+
+llm_cache = LLMCache(
+    max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+    default_ttl=Config.LLM_CACHE_TTL,
+    db_path=Config.LLM_CACHE_DB or None
+)
@@ -1,66 +1,58 @@
 import openai
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import List, Optional
 from config import Config
+from models.task import PRIORITIES, TASK_TYPES
+from services.llm_cache import MISSING, llm_cache
+from services.rule_parser_service import RuleBasedParser
 
 openai.api_key = Config.OPENAI_API_KEY
 
-class NLPParser:
-    """Parse natural language into structured task data"""
+# fields the model extracts for one task
+TASK_PROPERTIES = {
+    "title": {
+        "type": "string",
+        "description": "The main task title/description"
+    },
+    "due_date": {
+        "type": "string",
+        "description": "Due date in YYYY-MM-DD format. Parse relative dates like 'tomorrow', "
+                       "'next Monday', 'in 3 days'"
+    },
+    "due_time": {
+        "type": "string",
+        "description": "Due time in HH:MM format (24-hour). Parse times like '3pm', 'at noon', "
+                       "'in the morning'"
+    },
+    "priority": {
+        "type": "string",
+        "enum": ["low", "medium", "high"],
+        "description": "Task priority based on urgency words like 'urgent', 'important', 'ASAP'"
 
-    @staticmethod
-    def parse_task(usr_input: str) -> dict:
-        """Uses OpenAI API to parse natural language into structured task data"""
+    },
+    "task_type": {
+        "type": "string",
+        "enum": ["personal", "work", "quick"],
+        "description": "Type: 'personal' for errands/self-care, 'work' for job/school, 'quick' for "
+                       "tasks under 10 minutes"
 
-        functions = [
-            {
-                "name": "create_task",
-                "description": "Extract task information from natural language input",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "title": {
-                            "type": "string",
-                            "description": "The main task title/description"
-                        },
-                        "due_date": {
-                            "type": "string",
-                            "description": "Due date in YYYY-MM-DD format. Parse relative dates like 'tomorrow', "
-                                           "'next Monday', 'in 3 days'"
-                        },
-                        "due_time": {
-                            "type": "string",
-                            "description": "Due time in HH:MM format (24-hour). Parse times like '3pm', 'at noon', "
-                                           "'in the morning'"
-                        },
-                        "priority": {
-                            "type": "string",
-                            "enum": ["low", "medium", "high"],
-                            "description": "Task priority based on urgency words like 'urgent', 'important', 'ASAP'"
-
-                        },
-                        "task_type": {
-                            "type": "string",
-                            "enum": ["personal", "work", "quick"],
-                            "description": "Type: 'personal' for errands/self-care, 'work' for job/school, 'quick' for "
-                                           "tasks under 10 minutes"
-
-                        },
-                        "duration_est": {
-                            "type": "string",
-                            "description": "Estimated duration in minutes. Parse from phrases like '30 minutes', '2 hours', "
-                                           "'quick task' (5-10 min)"
-                        }
-                    },
-                    "required": ["title"]
-                }
+    },
+    "duration_est": {
+        "type": "string",
+        "description": "Estimated duration in minutes. Parse from phrases like '30 minutes', '2 hours', "
+                       "'quick task' (5-10 min)"
+    }
+}
 
-            }
-        ]
 
-        today = datetime.now()
-        sys_message = f"""You are a task parser. Current date is {today.strftime('%Y-%m-%d')} ({today.strftime('%A')}).
-Parse the user's input into structured task data.
+def _system_message(instructions: str) -> str:
+    today = datetime.now()
+    return f"""You are a task parser. Current date is {today.strftime('%Y-%m-%d')} ({today.strftime('%A')}).
+{instructions}
 
 Guidelines:
 - Extract the main action/task as the title
@@ -73,32 +65,247 @@ Guidelines:
   * 'quick' - any task under 10 minutes
 - Estimate duration in minutes (quick=5-10, short=15-30, medium=45-90, long=120+)
 - If no date/time/duration specified, leave those fields out"""
+
+
+def _tasks_function(indexed: bool) -> dict:
+    """Function schema returning a list of tasks, optionally tagged with the input line they came from"""
+    properties = dict(TASK_PROPERTIES)
+    required = ["title"]
+    if indexed:
+        properties["index"] = {"type": "integer", "description": "Number of the input line this task came from"}
+        required.append("index")
+    return {
+        "name": "create_tasks",
+        "description": "Extract every task in the input",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "tasks": {
+                    "type": "array",
+                    "items": {"type": "object", "properties": properties, "required": required}
+                }
+            },
+            "required": ["tasks"]
+        }
+    }
+
+
+def _clean(parsed_data: dict) -> dict:
+    """Normalize the model's task fields"""
+    # let the Task defaults apply instead of rejecting an unexpected value
+    for field, choices in (('priority', PRIORITIES), ('task_type', TASK_TYPES)):
+        if field in parsed_data and parsed_data[field] not in choices:
+            del parsed_data[field]
+
+    if 'duration_est' in parsed_data and parsed_data['duration_est']:
         try:
-            response = openai.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": sys_message},
-                    {"role": "user", "content": usr_input}
-                ],
-                functions=functions,
-                function_call={"name": "create_task"}
+            parsed_data['duration_est'] = int(parsed_data['duration_est'])
+        except (ValueError, TypeError):
+            parsed_data['duration_est'] = 0
+    return parsed_data
+
+
+def _fallback(usr_input: str) -> dict:
+    """Task data used when the model can't be reached"""
+    return {
+        "title": usr_input,
+        "priority": "medium",
+        "task_type": "personal"
+    }
+
+
+class TierStats:
+    """Call counts and latency for each parsing tier"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._total_ms = {}
+
+    def record(self, tier: str, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._calls[tier] = self._calls.get(tier, 0) + 1
+            self._total_ms[tier] = self._total_ms.get(tier, 0.0) + elapsed_ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = dict(self._calls)
+            total_ms = dict(self._total_ms)
+
+        # every request tries the local tier first
+        requests = calls.get('local', 0) + calls.get('local_miss', 0)
+        return {
+            'requests': requests,
+            'llm_calls_saved': calls.get('local', 0),
+            'tiers': {
+                tier: {
+                    'calls': count,
+                    'rate': round(count / requests, 3) if requests else 0.0,
+                    'avg_ms': round(total_ms[tier] / count, 2),
+                }
+                for tier, count in calls.items()
+            }
+        }
+
+
+_rule_parser = RuleBasedParser()
+_stats = TierStats()
+
+
+class NLPParser:
+    """Parse natural language into structured task data.
+
+    Input goes through a local rule-based tier first and only reaches the
+    LLM when the rules report low confidence."""
+
+    @staticmethod
+    def parse_task(usr_input: str) -> dict:
+        """Parse natural language into structured task data"""
+        parsed = NLPParser._parse_locally(usr_input)
+        if parsed is not None:
+            return parsed
+        return NLPParser._parse_with_llm(usr_input)
+
+    @staticmethod
+    def parse_tasks(usr_input: str) -> List[dict]:
+        """Parse an utterance that may list several tasks ("buy milk, call mom tomorrow") into one dict per task"""
+        items = RuleBasedParser.split_items(usr_input)
+        if len(items) <= 1:
+            return [NLPParser.parse_task(usr_input)]
+
+        local = [NLPParser._parse_locally(item) for item in items]
+        if all(parsed is not None and RuleBasedParser.looks_like_task(parsed) for parsed in local):
+            return local
+
+        # one request for the whole utterance, which also handles commas that don't separate tasks ("call mom, dad")
+        messages = [
+            {"role": "system", "content": _system_message(
+                "The input may describe several tasks. Return each one as a separate item of tasks, in order.")},
+            {"role": "user", "content": usr_input}
+        ]
+        tasks = NLPParser._call_llm(messages, _tasks_function(indexed=False))
+        if not tasks:
+            return [_fallback(usr_input)]
+        return [_clean(dict(task)) for task in tasks if isinstance(task, dict) and task.get('title')]
+
+    @staticmethod
+    def parse_many(usr_inputs: List[str], workers: Optional[int] = None) -> List[dict]:
+        """Parse many separate inputs, one dict each, in order.
+
+        Inputs the rules can't handle are sent to the LLM PARSE_BATCH_SIZE at
+        a time, with at most `workers` requests in flight."""
+        results = [NLPParser._parse_locally(usr_input) for usr_input in usr_inputs]
+        pending = [i for i, parsed in enumerate(results) if parsed is None]
+        if not pending:
+            return results
+
+        size = Config.PARSE_BATCH_SIZE
+        batches = [pending[start:start + size] for start in range(0, len(pending), size)]
+        workers = min(workers or Config.PARSE_BATCH_WORKERS, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parsed_batches = pool.map(
+                NLPParser._parse_batch_with_llm, [[usr_inputs[i] for i in batch] for batch in batches]
             )
+            for batch, parsed_batch in zip(batches, parsed_batches):
+                for i, parsed in zip(batch, parsed_batch):
+                    results[i] = parsed
+        return results
+
+    @staticmethod
+    def stats() -> dict:
+        """Hit rates and latency per tier (local, local_miss, llm_cache, llm, llm_error) in this process"""
+        return _stats.snapshot()
+
+    @staticmethod
+    def _parse_locally(usr_input: str) -> Optional[dict]:
+        """The rule-based result, or None when it isn't confident enough"""
+        started = time.perf_counter()
+        parsed, confidence = _rule_parser.parse(usr_input)
+        if confidence >= Config.PARSER_LOCAL_CONFIDENCE:
+            _stats.record('local', started)
+            return parsed
+        _stats.record('local_miss', started)
+        return None
+
+    @staticmethod
+    def _parse_with_llm(usr_input: str) -> dict:
+        """Uses OpenAI API to parse natural language into structured task data"""
+        functions = [
+            {
+                "name": "create_task",
+                "description": "Extract task information from natural language input",
+                "parameters": {
+                    "type": "object",
+                    "properties": TASK_PROPERTIES,
+                    "required": ["title"]
+                }
+
+            }
+        ]
+        messages = [
+            {"role": "system", "content": _system_message("Parse the user's input into structured task data.")},
+            {"role": "user", "content": usr_input}
+        ]
+
+        parsed_data = NLPParser._call_llm(messages, functions[0])
+        if parsed_data is None:
+            return _fallback(usr_input)
+        return _clean(parsed_data)
+
+    @staticmethod
+    def _parse_batch_with_llm(usr_inputs: List[str]) -> List[dict]:
+        """Parse several inputs with one request; each input gets exactly one task"""
+        numbered = "\n".join(f"{number}. {usr_input}" for number, usr_input in enumerate(usr_inputs, 1))
+        messages = [
+            {"role": "system", "content": _system_message(
+                "Each numbered line of the input is one task. Return one item per line, "
+                "with index set to the line's number.")},
+            {"role": "user", "content": numbered}
+        ]
+
+        tasks = NLPParser._call_llm(messages, _tasks_function(indexed=True)) or []
+        by_index = {}
+        for position, task in enumerate(tasks, 1):
+            if isinstance(task, dict) and task.get('title'):
+                index = task.pop('index', position)
+                by_index.setdefault(index, _clean(dict(task)))
+        return [by_index.get(number) or _fallback(usr_input) for number, usr_input in enumerate(usr_inputs, 1)]
+
+    @staticmethod
+    def _call_llm(messages: List[dict], function: dict):
+        """Call the model with one function and return a copy of its arguments, or None on error.
 
-            function_call = response.choices[0].message.function_call
-            parsed_data = json.loads(function_call.arguments)
+        For create_tasks the 'tasks' list is returned. Results are cached for the day,
+        since the system message carries today's date."""
+        started = time.perf_counter()
+        functions = [function]
+        function_call = {"name": function["name"]}
 
-            if 'duration_est' in parsed_data and parsed_data['duration_est']:
-                try:
-                    parsed_data['duration_est'] = int(parsed_data['duration_est'])
-                except (ValueError, TypeError):
-                    parsed_data['duration_est'] = 0
+        cache_key = llm_cache.make_key("gpt-4o-mini", messages, functions=functions, function_call=function_call)
+        cached = llm_cache.get(cache_key)
+        if cached is MISSING:
+            try:
+                response = openai.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=messages,
+                    functions=functions,
+                    function_call=function_call
+                )
 
-            return parsed_data
+                cached = json.loads(response.choices[0].message.function_call.arguments)
+                if function["name"] == "create_tasks":
+                    cached = cached.get("tasks", [])
+                llm_cache.set(cache_key, cached, same_day=True)
+                _stats.record('llm', started)
+            except Exception as e:
+                print(f"NLP Parse error: {e}")
+                _stats.record('llm_error', started)
+                return None
+        else:
+            _stats.record('llm_cache', started)
 
-        except Exception as e:
-            print(f"NLP Parse error: {e}")
-            return {
-                "title": usr_input,
-                "priority": "medium",
-                "task_type": "personal"
-            }
\ No newline at end of file
+        # callers add fields to the result, so never hand out the cached value
+        if isinstance(cached, list):
+            return [dict(task) if isinstance(task, dict) else task for task in cached]
+        return dict(cached)
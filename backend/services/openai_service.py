@@ -1,37 +1,126 @@
-from datetime import datetime
+import threading
 
 import openai
 from config import Config
-from typing import List
+from services.conversation_store import Conversation, ConversationStore, estimate_tokens
+from services.llm_cache import llm_cache
+from services.planner_service import local_now
+from typing import Iterator, List
 
 openai.api_key = Config.OPENAI_API_KEY
 
 class OpenAIService:
+    SYSTEM_PROMPT = "You are a supportive productivity assistant"
+
     def __init__(self):
         self.model = "gpt-4o-mini"
-        self.conversation_history = [
-            {"role": "system", "content": "You are a supportive productivity assistant"}
-        ]
+        self.conversations = ConversationStore(
+            max_sessions=Config.CHAT_MAX_SESSIONS,
+            idle_seconds=Config.CHAT_SESSION_IDLE_SECONDS
+        )
+        self.token_budget = Config.CHAT_TOKEN_BUDGET
 
-    def chat(self, message: str) -> str:
+    def chat(self, message: str, session_id: str = 'default') -> str:
         """Handle general chat interactions"""
+        conversation = self.conversations.get(session_id)
+        user_message = {"role": "user", "content": message}
 
-        self.conversation_history.append({"role": "system", "content": message})
+        with conversation.lock:
+            messages = self._build_messages(conversation, user_message)
 
         response = openai.chat.completions.create(
             model=self.model,
-            messages=self.conversation_history
+            messages=messages
         )
 
         reply = response.choices[0].message.content
-        self.conversation_history.append({"role": "system", "content": reply})
+        self._remember(conversation, user_message, {"role": "assistant", "content": reply})
 
         return reply
 
+    def chat_stream(self, message: str, session_id: str = 'default') -> Iterator[str]:
+        """Like chat, but yields the reply in pieces as the model generates it"""
+        conversation = self.conversations.get(session_id)
+        user_message = {"role": "user", "content": message}
+
+        with conversation.lock:
+            messages = self._build_messages(conversation, user_message)
+
+        stream = openai.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True
+        )
+
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+
+        self._remember(conversation, user_message, {"role": "assistant", "content": "".join(parts)})
+
+    def _build_messages(self, conversation: Conversation, user_message: dict) -> List[dict]:
+        """System prompt, summary of older turns and as many recent turns as the token budget allows"""
+        messages = [{"role": "system", "content": self.SYSTEM_PROMPT}]
+        if conversation.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {conversation.summary}"})
+
+        budget = self.token_budget - sum(estimate_tokens(m) for m in messages) - estimate_tokens(user_message)
+        if budget > 0:
+            messages += conversation.window(budget)
+        messages.append(user_message)
+        return messages
+
+    def _remember(self, conversation: Conversation, user_message: dict, reply: dict):
+        with conversation.lock:
+            conversation.turns += [user_message, reply]
+            if conversation.summarizing or conversation.tokens() <= self.token_budget:
+                return
+            conversation.summarizing = True
+
+        threading.Thread(target=self._summarize_older_turns, args=(conversation,), daemon=True).start()
+
+    def _summarize_older_turns(self, conversation: Conversation):
+        """Fold the turns outside the recent window into the rolling summary"""
+        with conversation.lock:
+            keep = len(conversation.window(self.token_budget // 2))
+            older = conversation.turns[:len(conversation.turns) - keep]
+            previous_summary = conversation.summary
+
+        try:
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in older)
+            if previous_summary:
+                transcript = f"Earlier summary: {previous_summary}\n{transcript}"
+            response = openai.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "Summarize this conversation between a user and their productivity "
+                                                  "assistant in under 120 words. Keep facts about the user's tasks, "
+                                                  "plans and preferences."},
+                    {"role": "user", "content": transcript}
+                ],
+                max_tokens=200
+            )
+            summary = response.choices[0].message.content
+        except Exception as e:
+            print(f"Conversation summary error: {e}")
+            summary = previous_summary
+
+        with conversation.lock:
+            conversation.summary = summary
+            # turns added meanwhile are after the ones we summarized
+            del conversation.turns[:len(older)]
+            conversation.summarizing = False
+
     def generate_daily_summary(self, tasks: List[dict]) -> str:
         """Generate the daily summary of the tasks"""
 
-        today = datetime.now().date()
+        # the same day the summary route picked the tasks for
+        today = local_now().date()
 
         #today's tasks
         today_tasks = [t for t in tasks if t.get('due_date') == today.isoformat() or not t.get('due_date')]
@@ -55,15 +144,21 @@ Provide:
 
 Keep it warm, supportive, and concise (150-200 words)."""
 
-        response = openai.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "You are a supportive "
-                                              "productivity coach who celebrates wins and encourages growth."},
-                {"role": "user", "content": context}
-            ]
-        )
-        return response.choices[0].message.content
+        messages = [
+            {"role": "system", "content": "You are a supportive "
+                                          "productivity coach who celebrates wins and encourages growth."},
+            {"role": "user", "content": context}
+        ]
+
+        def request_summary():
+            response = openai.chat.completions.create(
+                model=self.model,
+                messages=messages
+            )
+            return response.choices[0].message.content
+
+        # same task list, same day: reuse the summary
+        return llm_cache.cached(llm_cache.make_key(self.model, messages), request_summary, same_day=True)
 
     def _format_tasks(self, tasks: List[dict]) -> str:
         if not tasks:
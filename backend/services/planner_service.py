@@ -0,0 +1,275 @@
+import heapq
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from config import Config
+from models.task import OPEN_STATUSES, Task
+from services.balancer_service import WorkloadBalancer
+
+# tasks are moved off an overloaded day lowest priority first; high priority tasks stay
+PRIORITY_ORDER = {'low': 0, 'medium': 1, 'high': 2}
+# length of the slot looked for when a task has no estimate (a calendar event's default length)
+DEFAULT_SLOT_MINUTES = 60
+
+
+def local_now() -> datetime:
+    """The time in CALENDAR_TIMEZONE, naive like busy intervals and working hours (the server may run in UTC)"""
+    return datetime.now(ZoneInfo(Config.CALENDAR_TIMEZONE)).replace(tzinfo=None)
+
+
+def _clock(value: str) -> time:
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def _day(value) -> Optional[date]:
+    """A YYYY-MM-DD date, or None for anything else"""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _duration(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def merge_intervals(intervals: Iterable[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    """Sort intervals and merge the ones that overlap or touch"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_slots(busy: List[Tuple[datetime, datetime]], start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """Gaps between start and end not covered by any of the (merged, sorted) busy intervals"""
+    gaps = []
+    cursor = start
+    for busy_start, busy_end in busy:
+        if busy_end <= cursor:
+            continue
+        if busy_start >= end:
+            break
+        if busy_start > cursor:
+            gaps.append((cursor, busy_start))
+        cursor = busy_end
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class WorkloadPlanner:
+    """Find days with room for a task, and plans that spread overloaded days out.
+
+    A day's load is its open tasks, read from the per-day workload
+    aggregates, plus the time its calendar is busy during working hours
+    (PLANNER_DAY_START to PLANNER_DAY_END). A day is overloaded when it has
+    more tasks of a type than the balancer's DAILY_LIMITS or more minutes
+    than RECOMMENDED_DAILY_MINS. Loads come from one aggregate query and one
+    calendar query, days are picked from heaps ordered by distance and
+    load, and only the tasks of overloaded days are read."""
+
+    def __init__(self, task_service, calendar_service=None):
+        self.task_service = task_service
+        self.calendar_service = calendar_service
+        self.day_start = _clock(Config.PLANNER_DAY_START)
+        self.day_end = _clock(Config.PLANNER_DAY_END)
+
+    def day_loads(self, start: date, end: date) -> Dict[str, dict]:
+        """Load of every day from start to end (inclusive): {date: {'workload', 'busy', 'busy_minutes'}}"""
+        workloads = self.task_service.workloads(start.isoformat(), end.isoformat())
+        loads = {}
+        day = start
+        while day <= end:
+            loads[day.isoformat()] = {'workload': dict(workloads.get(day.isoformat(), {})), 'busy': []}
+            day += timedelta(days=1)
+
+        busy = []
+        if self.calendar_service is not None:
+            busy = self.calendar_service.busy_intervals(start, end + timedelta(days=1))
+        for busy_start, busy_end in busy:
+            # split events across the days they cover, keeping the part in working hours
+            day = busy_start.date()
+            while day <= busy_end.date():
+                day_start, day_end = self.working_hours(day)
+                clipped = (max(busy_start, day_start), min(busy_end, day_end))
+                if clipped[0] < clipped[1] and day.isoformat() in loads:
+                    loads[day.isoformat()]['busy'].append(clipped)
+                day += timedelta(days=1)
+
+        for load in loads.values():
+            load['busy'] = merge_intervals(load['busy'])
+            load['busy_minutes'] = sum(int((end - start).total_seconds() // 60) for start, end in load['busy'])
+        return loads
+
+    def suggest_dates(self, task_data: dict, limit: int = 3, horizon: Optional[int] = None,
+                      today: Optional[date] = None) -> List[dict]:
+        """Best days for a new task, best first.
+
+        Days that stay within the limits come before days that would only be
+        busy, and nearer days before farther ones from the task's due date
+        (or today). Each suggestion has the first free slot long enough for
+        the task in that day's working hours, if there is one."""
+        today = today or local_now().date()
+        horizon = horizon or Config.PLANNER_HORIZON_DAYS
+        task_type = task_data.get('task_type') if task_data.get('task_type') in WorkloadBalancer.DAILY_LIMITS else 'work'
+        duration = _duration(task_data.get('duration_est'))
+        # a due date that isn't YYYY-MM-DD (e.g. from the LLM) is treated as none
+        wanted = max(_day(task_data.get('due_date')) or today, today)
+
+        loads = self.day_loads(max(today, wanted - timedelta(days=horizon)), wanted + timedelta(days=horizon))
+        candidates = []
+        for key, load in loads.items():
+            count = self._count(load, task_type) + 1
+            minutes = self._minutes(load) + duration
+            if count > WorkloadBalancer.DAILY_LIMITS[task_type] + 2 or minutes > WorkloadBalancer.MAX_MINS:
+                continue
+            busy_day = count > WorkloadBalancer.DAILY_LIMITS[task_type] or \
+                minutes > WorkloadBalancer.RECOMMENDED_DAILY_MINS
+            distance = abs((date.fromisoformat(key) - wanted).days)
+            if busy_day and distance == 0:
+                # that's the day being warned about
+                continue
+            candidates.append(((busy_day, distance, minutes, key), count, minutes))
+
+        suggestions = []
+        for (busy_day, _, _, key), count, minutes in heapq.nsmallest(limit, candidates, key=lambda c: c[0]):
+            slot = self._first_slot(key, loads[key]['busy'], duration or DEFAULT_SLOT_MINUTES)
+            suggestions.append({
+                'date': key,
+                'slot': {'start': slot[0].strftime('%H:%M'), 'end': slot[1].strftime('%H:%M')} if slot else None,
+                'category_count': count,
+                'total_hours': round(minutes / 60, 1),
+                'busy': busy_day,
+            })
+        return suggestions
+
+    def rebalance(self, start: date, days: int = 7, today: Optional[date] = None) -> dict:
+        """Plan moves that bring every overloaded day from start on (for days days) within the limits.
+
+        Only tasks without a due time and below high priority are moved, and
+        only to days from today on within the range. Each task goes to the
+        nearest day that can take it, the least loaded of equally near ones.
+        Nothing is changed; apply the returned moves to carry out the plan."""
+        today = today or local_now().date()
+        end = start + timedelta(days=days - 1)
+        loads = self.day_loads(start, end)
+        targets = [key for key, load in loads.items() if key >= max(start, today).isoformat() and not self._overloaded(load)]
+
+        moves, unresolved = [], []
+        for key, load in loads.items():
+            if not self._overloaded(load):
+                continue
+            movable = sorted(
+                (task for task in self.task_service.tasks_for_date(key, OPEN_STATUSES)
+                 if not task.due_time and task.priority != 'high'),
+                key=lambda task: (PRIORITY_ORDER.get(task.priority, 1), -task.duration_minutes())
+            )
+            # nearest days first, then the least loaded
+            source = date.fromisoformat(key)
+            heap = [(abs((date.fromisoformat(target) - source).days), self._minutes(loads[target]), target)
+                    for target in targets]
+            heapq.heapify(heap)
+
+            for task in movable:
+                if not self._overloaded(load):
+                    break
+                over_limit = self._count(load, task.task_type) > WorkloadBalancer.DAILY_LIMITS[task.task_type]
+                if not over_limit and (self._minutes(load) <= WorkloadBalancer.RECOMMENDED_DAILY_MINS
+                                       or not task.duration_minutes()):
+                    # moving this task wouldn't make the day any less overloaded
+                    continue
+                target = self._take_day(heap, loads, task)
+                if target is None:
+                    continue
+                self._shift(load, task, -1)
+                self._shift(loads[target], task, 1)
+                moves.append({'task_id': task.id, 'title': task.title, 'from': key, 'to': target})
+            if self._overloaded(load):
+                unresolved.append(key)
+
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'moves': moves,
+            'unresolved': unresolved,
+            'days': {
+                key: {
+                    'tasks': sum(count for count, _ in load['workload'].values()),
+                    'task_hours': round(sum(minutes for _, minutes in load['workload'].values()) / 60, 1),
+                    'busy_hours': round(load['busy_minutes'] / 60, 1),
+                }
+                for key, load in loads.items()
+            },
+        }
+
+    def _take_day(self, heap: list, loads: Dict[str, dict], task: Task) -> Optional[str]:
+        """Pop the first day that can take the task and push it back with its new load.
+
+        Days that can't take it are put back for the next task; days full
+        in minutes are dropped, since their load only grows."""
+        rejected = []
+        target = None
+        while heap:
+            distance, minutes, key = heapq.heappop(heap)
+            if minutes + task.duration_minutes() > WorkloadBalancer.RECOMMENDED_DAILY_MINS:
+                if minutes < WorkloadBalancer.RECOMMENDED_DAILY_MINS:
+                    rejected.append((distance, minutes, key))
+                continue
+            if self._count(loads[key], task.task_type) < WorkloadBalancer.DAILY_LIMITS[task.task_type]:
+                target = key
+                heapq.heappush(heap, (distance, minutes + task.duration_minutes(), key))
+                break
+            rejected.append((distance, minutes, key))
+        for entry in rejected:
+            heapq.heappush(heap, entry)
+        return target
+
+    def _first_slot(self, key: str, busy: List[Tuple[datetime, datetime]], minutes: int):
+        """First free (start, end) of the given length in a day's working hours, or None"""
+        day_start, day_end = self.working_hours(date.fromisoformat(key))
+        # timed tasks hold their slot too
+        for task in self.task_service.tasks_for_date(key, OPEN_STATUSES):
+            if task.due_time:
+                try:
+                    task_start = datetime.combine(day_start.date(), _clock(task.due_time))
+                except (TypeError, ValueError):
+                    # a stored time that isn't HH:MM, e.g. "3pm" from an import
+                    continue
+                busy = busy + [(task_start, task_start + timedelta(minutes=task.duration_minutes() or DEFAULT_SLOT_MINUTES))]
+        for gap_start, gap_end in free_slots(merge_intervals(busy), day_start, day_end):
+            if gap_end - gap_start >= timedelta(minutes=minutes):
+                return gap_start, gap_start + timedelta(minutes=minutes)
+        return None
+
+    def working_hours(self, day: date) -> Tuple[datetime, datetime]:
+        return datetime.combine(day, self.day_start), datetime.combine(day, self.day_end)
+
+    @staticmethod
+    def _count(load: dict, task_type: str) -> int:
+        return load['workload'].get(task_type, (0, 0))[0]
+
+    @staticmethod
+    def _minutes(load: dict) -> int:
+        """Task and calendar minutes of a day"""
+        return sum(minutes for _, minutes in load['workload'].values()) + load['busy_minutes']
+
+    @staticmethod
+    def _overloaded(load: dict) -> bool:
+        return WorkloadPlanner._minutes(load) > WorkloadBalancer.RECOMMENDED_DAILY_MINS or any(
+            count > WorkloadBalancer.DAILY_LIMITS[task_type] for task_type, (count, _) in load['workload'].items()
+        )
+
+    @staticmethod
+    def _shift(load: dict, task: Task, sign: int):
+        """Add (sign=1) or remove (sign=-1) a task from a day's load"""
+        count, minutes = load['workload'].get(task.task_type, (0, 0))
+        load['workload'][task.task_type] = (count + sign, minutes + sign * task.duration_minutes())
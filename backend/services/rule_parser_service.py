@@ -0,0 +1,342 @@
+import re
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+WEEKDAY_PATTERN = '|'.join(WEEKDAYS)
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'twelve': 12, 'fifteen': 15,
+    'twenty': 20, 'thirty': 30, 'forty': 40, 'forty-five': 45, 'sixty': 60, 'ninety': 90,
+}
+DIGITS = r'\d+(?:\.\d+)?'
+WORD_NUMBER = '|'.join(sorted(NUMBER_WORDS, key=len, reverse=True))
+NUMBER = DIGITS + '|' + WORD_NUMBER
+
+
+def _amount(units: str, short: str) -> str:
+    """A number (captured) and its unit; the short unit only after digits, or "I am" would be a minute"""
+    return rf'({DIGITS}(?= ?(?:{units}|{short})\b)|(?:{WORD_NUMBER})(?= (?:{units})\b)) ?(?:{units}|{short})'
+
+
+HOURS = _amount('hours?|hrs?', 'h')
+MINUTES = _amount('minutes?|mins?', 'm')
+
+PART_OF_DAY_TIMES = {
+    'noon': '12:00', 'midday': '12:00', 'midnight': '00:00',
+    'morning': '09:00', 'afternoon': '15:00', 'evening': '18:00', 'night': '20:00', 'tonight': '20:00',
+}
+
+HIGH_PRIORITY_WORDS = {'urgent', 'urgently', 'asap', 'important', 'critical', 'immediately', 'high priority'}
+LOW_PRIORITY_WORDS = {'low priority', 'whenever', 'someday', 'eventually', 'no rush', 'not urgent'}
+
+WORK_WORDS = {
+    'meeting', 'meet', 'report', 'email', 'emails', 'client', 'clients', 'presentation', 'slides',
+    'project', 'deadline', 'assignment', 'homework', 'study', 'exam', 'class', 'lecture', 'standup',
+    'review', 'interview', 'invoice', 'proposal', 'draft', 'deploy', 'code', 'boss', 'team',
+    'manager', 'office', 'work', 'essay', 'paper', 'submit', 'sync', 'spreadsheet', 'budget',
+}
+PERSONAL_WORDS = {
+    'buy', 'groceries', 'grocery', 'gym', 'workout', 'run', 'doctor', 'dentist', 'laundry', 'clean',
+    'cook', 'dinner', 'lunch', 'breakfast', 'mom', 'dad', 'mum', 'family', 'friend', 'friends',
+    'birthday', 'pay', 'bills', 'rent', 'haircut', 'walk', 'dog', 'cat', 'pharmacy', 'shopping',
+    'read', 'yoga', 'meditate', 'appointment', 'car', 'house', 'garden', 'milk', 'bank', 'gift',
+}
+QUICK_WORDS = {'quick', 'quickly', 'briefly', 'real quick'}
+# verbs a task usually starts with, used to tell a list of tasks from a list inside one task
+ACTION_WORDS = {
+    'add', 'apply', 'ask', 'attend', 'bake', 'book', 'bring', 'buy', 'call', 'cancel', 'change', 'charge',
+    'check', 'clean', 'collect', 'complete', 'confirm', 'contact', 'cook', 'create', 'deliver', 'deploy',
+    'do', 'donate', 'draft', 'drop', 'email', 'exercise', 'feed', 'file', 'fill', 'finish', 'fix', 'follow',
+    'get', 'go', 'grab', 'install', 'invite', 'learn', 'mail', 'make', 'meditate', 'meet', 'message', 'mop',
+    'move', 'mow', 'order', 'organize', 'pack', 'pay', 'phone', 'pick', 'plan', 'post', 'prepare', 'print',
+    'read', 'refill', 'register', 'remind', 'renew', 'repair', 'replace', 'reply', 'research', 'respond',
+    'return', 'review', 'run', 'schedule', 'see', 'sell', 'send', 'set', 'share', 'shop', 'sign', 'sort',
+    'start', 'study', 'submit', 'take', 'talk', 'test', 'text', 'thank', 'tidy', 'update', 'upload',
+    'vacuum', 'visit', 'walk', 'wash', 'watch', 'water', 'work', 'workout', 'write',
+}
+
+# phrases that mention time in ways the rules below don't understand
+UNHANDLED_TIME_WORDS = re.compile(
+    r'\b(?:weekend|month|year|soon|later|after|before|until|till|every|daily|weekly|monthly|'
+    r'end of|beginning of|start of|next few|couple|few days|'
+    r'january|february|march|april|june|july|august|september|october|november|december|'
+    r'jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec)\b',
+    re.IGNORECASE
+)
+
+LEADING_FILLER = re.compile(
+    r'^(?:(?:please\s+)?(?:remind me to|remind me|add a task to|add task to|add a task|add task|add|'
+    r'create a task to|create task to|schedule|i need to|i have to|i must|need to|have to|'
+    r'todo:?|to do:?|task:?)(?:\s+|$))+(?:(?:a|an)\s+)?',
+    re.IGNORECASE
+)
+
+# words the rules above take out of the title; losing any other word means a rule misfired
+PARSED_WORDS = {
+    'please', 'remind', 'me', 'to', 'add', 'a', 'task', 'create', 'schedule', 'i', 'need', 'have', 'must',
+    'todo', 'do', 'on', 'at', 'by', 'for', 'in', 'due', 'from', 'and', 'the', 'this', 'next', 'coming',
+    'around', 'about', 'roughly', 'later', 'day', 'days', 'week', 'weeks', 'after', 'tomorrow', 'today',
+    'half', 'hour', 'hours', 'hr', 'hrs', 'minute', 'minutes', 'min', 'mins',
+} | set(WEEKDAYS) | {word for number in NUMBER_WORDS for word in number.split('-')} | set(PART_OF_DAY_TIMES) | {
+    word for phrase in HIGH_PRIORITY_WORDS | LOW_PRIORITY_WORDS | QUICK_WORDS for word in phrase.split()
+}
+# a number with the unit or am/pm stuck to it counts as one word
+WORD = re.compile(r"\d+(?:[:./-]\d+)*(?: ?(?:[ap]\.?m\.?|h|m)(?![a-z]))?|[a-z']+", re.IGNORECASE)
+
+
+# separators between items of a list of tasks ("buy milk, call mom; finish report")
+ITEM_SEPARATOR = re.compile(r'\s*(?:[,;\n]|\band then\b)\s*', re.IGNORECASE)
+ITEM_PREFIX = re.compile(r'^(?:[-*\u2022]\s*|\d+[.)]\s+|and\s+)', re.IGNORECASE)
+
+
+class RuleBasedParser:
+    """Deterministic parser for common task phrasing.
+
+    Handles relative and weekday dates, 12/24-hour times, durations, urgency
+    words and the personal/work/quick classification. Each result comes with
+    a confidence score; NLPParser only calls the LLM when it is low."""
+
+    @staticmethod
+    def split_items(usr_input: str) -> List[str]:
+        """Split input that lists several tasks into one string per item (bullets and a final 'and' dropped)"""
+        items = (ITEM_PREFIX.sub('', item.strip()) for item in ITEM_SEPARATOR.split(usr_input))
+        return [item for item in items if item]
+
+    @staticmethod
+    def looks_like_task(parsed: dict) -> bool:
+        """Whether a parsed list item stands on its own as a task: it has a date or time, or starts with an action"""
+        if parsed.get('due_date') or parsed.get('due_time'):
+            return True
+        words = re.findall(r"[a-z']+", parsed.get('title', '').lower())
+        return bool(words) and words[0] in ACTION_WORDS
+
+    def parse(self, usr_input: str, today: Optional[date] = None) -> Tuple[dict, float]:
+        """Parse the input; returns the task data and a confidence between 0 and 1"""
+        today = today or datetime.now().date()
+        # matching is case-insensitive; the title keeps the user's casing
+        text = ' ' + re.sub(r'\s+', ' ', usr_input.strip()) + ' '
+        parsed = {}
+        confidence = 1.0
+
+        text, priority = self._extract_priority(text)
+        parsed['priority'] = priority
+
+        text, due_date, date_time = self._extract_date(text, today)
+        if due_date:
+            parsed['due_date'] = due_date.isoformat()
+
+        text, due_time = self._extract_time(text)
+        due_time = due_time or date_time
+        if due_time:
+            parsed['due_time'] = due_time
+            if 'due_date' not in parsed:
+                # a bare time means later today, or tomorrow once it has passed
+                now = datetime.now()
+                if today == now.date() and due_time < now.strftime('%H:%M'):
+                    parsed['due_date'] = (today + timedelta(days=1)).isoformat()
+                else:
+                    parsed['due_date'] = today.isoformat()
+
+        text, duration = self._extract_duration(text)
+        if duration is not None:
+            parsed['duration_est'] = duration
+
+        if UNHANDLED_TIME_WORDS.search(text):
+            confidence -= 0.6
+        if re.search(r'\d', text):
+            # leftover numbers are probably dates or times we did not understand
+            confidence -= 0.4
+
+        text, quick = self._strip_words(text, QUICK_WORDS)
+        task_type, type_confidence = self._classify(text, duration, quick)
+        parsed['task_type'] = task_type
+        confidence -= 1 - type_confidence
+
+        title = self._clean_title(text)
+        if not title:
+            return {'title': usr_input.strip()}, 0.0
+        parsed['title'] = title
+        if len(title.split()) > 8:
+            # long sentences tend to hide details the rules miss
+            confidence -= 0.3
+        if self._lost_words(usr_input, title):
+            confidence -= 0.5
+
+        return parsed, max(0.0, round(confidence, 2))
+
+    def named_date(self, usr_input: str, today: Optional[date] = None) -> Optional[str]:
+        """The date the input names itself, if any (parse() also dates inputs that only give a time)"""
+        _, due_date, _ = self._extract_date(' ' + re.sub(r'\s+', ' ', usr_input.strip()) + ' ', today or datetime.now().date())
+        return due_date.isoformat() if due_date else None
+
+    # priority
+
+    def _extract_priority(self, text: str) -> Tuple[str, str]:
+        text, high = self._strip_words(text, HIGH_PRIORITY_WORDS)
+        text, low = self._strip_words(text, LOW_PRIORITY_WORDS)
+        if high:
+            return text, 'high'
+        if low:
+            return text, 'low'
+        return text, 'medium'
+
+    # dates
+
+    def _extract_date(self, text: str, today: date) -> Tuple[str, Optional[date], Optional[str]]:
+        """Returns the remaining text, the due date and a time implied by the date phrase"""
+        rules = [
+            (r'\b(?:on |by |due )?(?:the )?day after tomorrow\b', lambda m: (today + timedelta(days=2), None)),
+            (r'\b(?:by |due )?tomorrow(?: (morning|afternoon|evening|night))?\b',
+             lambda m: (today + timedelta(days=1), PART_OF_DAY_TIMES.get((m.group(1) or '').lower()))),
+            (r'\b(?:by |due )?tonight\b', lambda m: (today, PART_OF_DAY_TIMES['tonight'])),
+            (r'\b(?:by |due )?(?:later )?today\b', lambda m: (today, None)),
+            (rf'\bin ({NUMBER}) (day|days|week|weeks)\b', lambda m: (today + self._offset(m.group(1), m.group(2)), None)),
+            (r'\b(?:by |due )?next week\b', lambda m: (today + timedelta(days=7), None)),
+            (rf'\b(?:on |by |due )?(next|this|coming)? ?({WEEKDAY_PATTERN})\b', lambda m: (self._weekday(today, m.group(2).lower(), (m.group(1) or '').lower()), None)),
+            (r'\b(?:on |by |due )?(\d{4})-(\d{2})-(\d{2})\b', lambda m: (self._date(int(m.group(1)), int(m.group(2)), int(m.group(3))), None)),
+            (r'\b(?:on |by |due )?(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b', lambda m: (self._month_day(today, m), None)),
+        ]
+        for pattern, resolve in rules:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                due_date, implied_time = resolve(match)
+                if due_date is None:
+                    continue
+                return text[:match.start()] + ' ' + text[match.end():], due_date, implied_time
+        return text, None, None
+
+    def _offset(self, amount: str, unit: str) -> timedelta:
+        days = int(self._number(amount))
+        return timedelta(days=days * 7 if unit.startswith('week') else days)
+
+    @staticmethod
+    def _weekday(today: date, name: str, modifier: Optional[str]) -> date:
+        days_ahead = (WEEKDAYS.index(name) - today.weekday()) % 7
+        if days_ahead == 0 and modifier != 'this':
+            # "monday" said on a Monday means next week's
+            days_ahead = 7
+        return today + timedelta(days=days_ahead)
+
+    @staticmethod
+    def _date(year: int, month: int, day: int) -> Optional[date]:
+        try:
+            return date(year, month, day)
+        except ValueError:
+            return None
+
+    def _month_day(self, today: date, match) -> Optional[date]:
+        month, day, year = int(match.group(1)), int(match.group(2)), match.group(3)
+        if year:
+            year = int(year) + (2000 if len(year) == 2 else 0)
+            return self._date(year, month, day)
+        result = self._date(today.year, month, day)
+        if result and result < today:
+            result = self._date(today.year + 1, month, day)
+        return result
+
+    # times
+
+    def _extract_time(self, text: str) -> Tuple[str, Optional[str]]:
+        rules = [
+            (r'\b(?:at |by |around |@ ?)?(\d{1,2})(?::(\d{2}))? ?([ap])\.?m\.?\b', self._twelve_hour),
+            (r'\b(?:at |by |around |@ ?)(\d{1,2}):(\d{2})\b', self._twenty_four_hour),
+            (r'\b(\d{1,2}):(\d{2})\b', self._twenty_four_hour),
+            (r'\b(?:at |by |around )?(noon|midday|midnight)\b', lambda m: PART_OF_DAY_TIMES[m.group(1).lower()]),
+            (r'\b(?:in the |this )(morning|afternoon|evening)\b', lambda m: PART_OF_DAY_TIMES[m.group(1).lower()]),
+        ]
+        for pattern, resolve in rules:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                due_time = resolve(match)
+                if due_time is None:
+                    continue
+                return text[:match.start()] + ' ' + text[match.end():], due_time
+        return text, None
+
+    @staticmethod
+    def _twelve_hour(match) -> Optional[str]:
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+        if not 1 <= hour <= 12 or minute > 59:
+            return None
+        hour = hour % 12 + (12 if match.group(3).lower() == 'p' else 0)
+        return f"{hour:02d}:{minute:02d}"
+
+    @staticmethod
+    def _twenty_four_hour(match) -> Optional[str]:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            return None
+        return f"{hour:02d}:{minute:02d}"
+
+    # durations
+
+    def _extract_duration(self, text: str) -> Tuple[str, Optional[int]]:
+        rules = [
+            (r'\b(?:for )?(?:about |around |roughly )?half an hour\b', lambda m: 30),
+            (r'\b(?:for )?(?:about |around |roughly )?an hour and a half\b', lambda m: 90),
+            (rf'\b(?:for )?(?:about |around |roughly )?{HOURS}\b(?: and {MINUTES}\b)?',
+             lambda m: round(self._number(m.group(1)) * 60 + (self._number(m.group(2)) if m.group(2) else 0))),
+            (rf'\b(?:for )?(?:about |around |roughly )?{MINUTES}\b', lambda m: round(self._number(m.group(1)))),
+        ]
+        for pattern, resolve in rules:
+            match = re.search(pattern, text, re.IGNORECASE)
+            if match:
+                return text[:match.start()] + ' ' + text[match.end():], resolve(match)
+        return text, None
+
+    @staticmethod
+    def _number(value: str) -> float:
+        if value.lower() in NUMBER_WORDS:
+            return NUMBER_WORDS[value.lower()]
+        return float(value)
+
+    # classification and title
+
+    def _classify(self, text: str, duration: Optional[int], quick: bool) -> Tuple[str, float]:
+        """Returns the task type and how sure we are about it"""
+        if quick or (duration is not None and duration <= 10):
+            return 'quick', 1.0
+
+        words = set(re.findall(r"[a-z']+", text.lower()))
+        work = len(words & WORK_WORDS)
+        personal = len(words & PERSONAL_WORDS)
+        if work > personal:
+            return 'work', 1.0
+        if personal > work:
+            return 'personal', 1.0
+        # no clear signal: guess personal like the LLM fallback, but let the LLM decide
+        return 'personal', 0.6
+
+    @staticmethod
+    def _strip_words(text: str, words) -> Tuple[str, bool]:
+        found = False
+        for word in sorted(words, key=len, reverse=True):
+            pattern = re.compile(rf'\b{re.escape(word)}\b', re.IGNORECASE)
+            if pattern.search(text):
+                text = pattern.sub(' ', text)
+                found = True
+        return text, found
+
+    @staticmethod
+    def _lost_words(usr_input: str, title: str) -> bool:
+        """Whether the title is missing words of the input that none of the rules understand"""
+        kept = Counter(word.lower() for word in WORD.findall(title))
+        for word in WORD.findall(usr_input):
+            word = word.lower()
+            if kept[word]:
+                kept[word] -= 1
+            elif word not in PARSED_WORDS and not word[0].isdigit():
+                return True
+        return False
+
+    @staticmethod
+    def _clean_title(text: str) -> str:
+        text = re.sub(r'\s+', ' ', text).strip(' ,.;:!-')
+        text = LEADING_FILLER.sub('', text)
+        # connecting words left dangling by the phrases we removed
+        text = re.sub(r'(?:\s+(?:on|at|by|for|in|due|from|and|the|this|next|around|about|[:,;!-]))+$', '', text,
+                      flags=re.IGNORECASE)
+        text = re.sub(r'\s+([,.;:!?])', r'\1', text)
+        return re.sub(r'\s+', ' ', text).strip(' ,.;:!-')
@@ -0,0 +1,128 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from models.task import OPEN_STATUSES, Task
+from services.planner_service import DEFAULT_SLOT_MINUTES, PRIORITY_ORDER, free_slots, local_now, merge_intervals
+
+# length given to a quick task without an estimate
+QUICK_TASK_MINUTES = 10
+# slots start on multiples of this many minutes
+SLOT_STEP_MINUTES = 5
+
+
+def _round_up(moment: datetime) -> datetime:
+    """The moment rounded up to the next SLOT_STEP_MINUTES boundary"""
+    floor = moment.replace(second=0, microsecond=0)
+    floor -= timedelta(minutes=floor.minute % SLOT_STEP_MINUTES)
+    return floor if floor == moment else floor + timedelta(minutes=SLOT_STEP_MINUTES)
+
+
+class FreeTime:
+    """Free gaps of one day, sorted by start, that tasks are packed into first fit"""
+
+    def __init__(self, gaps: List[Tuple[datetime, datetime]]):
+        self.gaps = [(_round_up(start), end) for start, end in gaps if _round_up(start) < end]
+
+    def reserve(self, minutes: int) -> Optional[Tuple[datetime, datetime]]:
+        """Take the earliest free (start, end) of the given length, or None if no gap is long enough"""
+        length = timedelta(minutes=minutes)
+        for index, (start, end) in enumerate(self.gaps):
+            if end - start >= length:
+                rest = _round_up(start + length)
+                if rest < end:
+                    self.gaps[index] = (rest, end)
+                else:
+                    del self.gaps[index]
+                return start, start + length
+        return None
+
+
+class TaskScheduler:
+    """Pack open tasks without a due time into the free time of their days.
+
+    A day's free time is its working hours minus timed calendar events (from
+    the planner's day loads, one calendar query for the whole range) and
+    minus tasks that already have a due time. Tasks are placed highest
+    priority first, then earliest due date, each on its due date or else the
+    nearest earlier day; overdue tasks go on the first day that has room. The
+    result is a proposed timeline; committing it sets each task's due date
+    and time, after which its calendar events can be written in one batch."""
+
+    def __init__(self, task_service, planner):
+        self.task_service = task_service
+        self.planner = planner
+
+    def plan(self, start: date, days: int = 7, include_undated: bool = False,
+             now: Optional[datetime] = None) -> dict:
+        """Proposed timeline for the open tasks due from start on, for days days"""
+        now = now or local_now()
+        end = start + timedelta(days=days - 1)
+        first_day = max(start, now.date())
+        loads = self.planner.day_loads(start, end)
+        dates = list(loads)
+
+        due_dates = dates + [None] if include_undated else dates
+        tasks = list(self.task_service.query_tasks(due_dates=due_dates, statuses=OPEN_STATUSES))
+
+        # timed tasks keep their time and take it from the day's free time
+        busy = {key: list(load['busy']) for key, load in loads.items()}
+        for task in tasks:
+            if task.due_date and task.due_time:
+                try:
+                    task_start = datetime.fromisoformat(f"{task.due_date}T{task.due_time}")
+                except ValueError:
+                    continue
+                busy[task.due_date].append((task_start, task_start + timedelta(minutes=self._minutes(task))))
+
+        open_days = [key for key in dates if key >= first_day.isoformat()]
+        free = {}
+        for key in open_days:
+            day_start, day_end = self.planner.working_hours(date.fromisoformat(key))
+            if key == first_day.isoformat() and now > day_start:
+                day_start = now
+            free[key] = FreeTime(free_slots(merge_intervals(busy[key]), day_start, day_end))
+
+        untimed = sorted(
+            (task for task in tasks if not task.due_time),
+            key=lambda task: (-PRIORITY_ORDER.get(task.priority, 1), task.due_date or '9999-12-31', task.created_at or '')
+        )
+        slots, unscheduled = [], []
+        for task in untimed:
+            minutes = self._minutes(task)
+            placed = None
+            for key in self._candidate_days(task, open_days):
+                placed = free[key].reserve(minutes)
+                if placed:
+                    break
+            if placed is None:
+                unscheduled.append({'task_id': task.id, 'title': task.title, 'due_date': task.due_date,
+                                    'reason': 'No free time long enough before the due date'})
+                continue
+            slots.append({
+                'task_id': task.id,
+                'title': task.title,
+                'priority': task.priority,
+                'date': placed[0].date().isoformat(),
+                'start': placed[0].strftime('%H:%M'),
+                'end': placed[1].strftime('%H:%M'),
+                'duration_est': minutes,
+            })
+
+        slots.sort(key=lambda slot: (slot['date'], slot['start']))
+        return {'start': start.isoformat(), 'end': end.isoformat(), 'slots': slots, 'unscheduled': unscheduled}
+
+    @staticmethod
+    def _candidate_days(task: Task, open_days: List[str]) -> List[str]:
+        """Days a task may go on, best first"""
+        if not open_days:
+            return []
+        if task.due_date is None or task.due_date < open_days[0]:
+            # undated or overdue: as soon as possible
+            return open_days
+        return [key for key in reversed(open_days) if key <= task.due_date]
+
+    @staticmethod
+    def _minutes(task: Task) -> int:
+        if task.duration_minutes():
+            return task.duration_minutes()
+        return QUICK_TASK_MINUTES if task.task_type == 'quick' else DEFAULT_SLOT_MINUTES
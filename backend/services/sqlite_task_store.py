@@ -0,0 +1,353 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import weakref
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import Config
+from models.task import OPEN_STATUSES, Task, TASK_FIELDS
+from services.task_store import make_revision, parse_revision
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    description TEXT,
+    due_date TEXT,
+    due_time TEXT,
+    priority TEXT,
+    status TEXT,
+    created_at TEXT,
+    task_type TEXT,
+    duration_est INTEGER,
+    calendar_event_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_due_date_status ON tasks (due_date, status);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+CREATE TABLE IF NOT EXISTS task_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS task_changes (
+    rev INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    task_id TEXT,
+    changed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS task_workload (
+    due_date TEXT NOT NULL,
+    task_type TEXT NOT NULL,
+    open_count INTEGER NOT NULL,
+    open_minutes INTEGER NOT NULL,
+    PRIMARY KEY (due_date, task_type)
+);
+""" + ''.join(
+    f"""
+CREATE TRIGGER IF NOT EXISTS task_workload_{name} AFTER {event} ON tasks
+WHEN {row}.due_date IS NOT NULL AND {row}.status IN {OPEN_STATUSES!r}
+BEGIN
+    INSERT INTO task_workload (due_date, task_type, open_count, open_minutes)
+    VALUES ({row}.due_date, {row}.task_type, {sign}1, {sign}COALESCE(CAST({row}.duration_est AS INTEGER), 0))
+    ON CONFLICT (due_date, task_type) DO UPDATE SET
+        open_count = open_count + excluded.open_count,
+        open_minutes = open_minutes + excluded.open_minutes;
+    DELETE FROM task_workload
+    WHERE due_date = {row}.due_date AND task_type = {row}.task_type AND open_count <= 0;
+END;
+"""
+    for name, event, row, sign in (
+        ('insert', 'INSERT', 'NEW', ''),
+        ('delete', 'DELETE', 'OLD', '-'),
+        ('update_old', 'UPDATE OF due_date, status, task_type, duration_est', 'OLD', '-'),
+        ('update_new', 'UPDATE OF due_date, status, task_type, duration_est', 'NEW', ''),
+    )
+)
+
+# (due_date, task_type) aggregates of the open tasks, for databases created before task_workload existed
+REBUILD_WORKLOAD = f"""
+INSERT INTO task_workload (due_date, task_type, open_count, open_minutes)
+SELECT due_date, task_type, COUNT(*), SUM(COALESCE(CAST(duration_est AS INTEGER), 0))
+FROM tasks WHERE due_date IS NOT NULL AND status IN {OPEN_STATUSES!r}
+GROUP BY due_date, task_type
+"""
+
+COLUMNS = ', '.join(TASK_FIELDS)
+QUERY_BATCH_SIZE = 500
+
+
+class SqliteTaskStore:
+    """Task storage backed by SQLite, with the same interface as TaskStore.
+
+    Each worker process keeps one connection to the database in WAL mode, so
+    readers in other workers are not blocked by a writer. Date and status
+    queries are answered from indexes instead of loading every task.
+
+    Each write also records a row in task_changes in the same transaction,
+    so revisions and the change feed are shared by all workers."""
+
+    # weak, so stores of users no longer in use are freed (and their connections closed)
+    _stores = weakref.WeakValueDictionary()
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, path: str) -> 'SqliteTaskStore':
+        """Return this process's store for the given database"""
+        key = (os.path.abspath(path), os.getpid())
+        with cls._stores_lock:
+            store = cls._stores.get(key)
+            if store is None:
+                store = cls._stores[key] = cls(path)
+            return store
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        # INSERT OR REPLACE only fires the delete trigger for the replaced row with this on
+        self._conn.execute('PRAGMA recursive_triggers=ON')
+        self._conn.executescript(SCHEMA)
+        with self._conn:
+            # take the write lock before checking, so workers starting together rebuild the aggregates only once
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute("INSERT OR IGNORE INTO task_meta (key, value) VALUES ('epoch', ?)",
+                               (uuid.uuid4().hex[:12],))
+            # the triggers keep task_workload current from here on; count the tasks from before they existed
+            if self._conn.execute("SELECT 1 FROM task_meta WHERE key = 'workload_ready'").fetchone() is None:
+                self._conn.execute("DELETE FROM task_workload")
+                self._conn.execute(REBUILD_WORKLOAD)
+                self._conn.execute("INSERT OR IGNORE INTO task_meta (key, value) VALUES ('workload_ready', '1')")
+        self._epoch = self._conn.execute("SELECT value FROM task_meta WHERE key = 'epoch'").fetchone()[0]
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[Task]:
+        with self._lock:
+            rows = self._conn.execute(sql, tuple(params)).fetchall()
+        return [Task.from_values(row) for row in rows]
+
+    # reads
+
+    def get(self, task_id: str) -> Optional[Task]:
+        tasks = self._query(f"SELECT {COLUMNS} FROM tasks WHERE id = ?", (task_id,))
+        return tasks[0] if tasks else None
+
+    def all(self) -> List[Task]:
+        return self._query(f"SELECT {COLUMNS} FROM tasks ORDER BY seq")
+
+    def for_date(self, due_date: Optional[str], statuses: Optional[Iterable[str]] = None) -> List[Task]:
+        """Tasks due on the given date (None for undated tasks), optionally limited to some statuses"""
+        if due_date is None:
+            sql = f"SELECT {COLUMNS} FROM tasks WHERE due_date IS NULL"
+            params = []
+        else:
+            sql = f"SELECT {COLUMNS} FROM tasks WHERE due_date = ?"
+            params = [due_date]
+
+        if statuses is not None:
+            statuses = list(statuses)
+            sql += f" AND status IN ({', '.join('?' for _ in statuses)})"
+            params += statuses
+        return self._query(sql + " ORDER BY seq", params)
+
+    def workload(self, due_date: str) -> Dict[str, Tuple[int, int]]:
+        """Open task count and estimated minutes per task type due on a date"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_type, open_count, open_minutes FROM task_workload WHERE due_date = ?", (due_date,)
+            ).fetchall()
+        return {task_type: (count, minutes) for task_type, count, minutes in rows}
+
+    def workloads(self, start_date: str, end_date: str) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        """workload() for every date from start_date to end_date (inclusive) that has open tasks"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT due_date, task_type, open_count, open_minutes FROM task_workload "
+                "WHERE due_date BETWEEN ? AND ?", (start_date, end_date)
+            ).fetchall()
+        result = {}
+        for due_date, task_type, count, minutes in rows:
+            result.setdefault(due_date, {})[task_type] = (count, minutes)
+        return result
+
+    def query(self, due_dates: Optional[Iterable[Optional[str]]] = None,
+              statuses: Optional[Iterable[str]] = None,
+              task_type: Optional[str] = None,
+              priority: Optional[str] = None,
+              offset: int = 0,
+              limit: Optional[int] = None) -> Iterator[Task]:
+        """Lazily yield tasks matching every given filter, fetching rows in batches"""
+        clauses = []
+        params = []
+        if due_dates is not None:
+            due_dates = list(due_dates)
+            dated = [due_date for due_date in due_dates if due_date is not None]
+            options = []
+            if dated:
+                options.append(f"due_date IN ({', '.join('?' for _ in dated)})")
+                params += dated
+            if len(dated) < len(due_dates):
+                options.append("due_date IS NULL")
+            clauses.append(f"({' OR '.join(options) or '0'})")
+        if statuses is not None:
+            statuses = list(statuses)
+            clauses.append(f"status IN ({', '.join('?' for _ in statuses) or 'NULL'})")
+            params += statuses
+        if task_type is not None:
+            clauses.append("task_type = ?")
+            params.append(task_type)
+        if priority is not None:
+            clauses.append("priority = ?")
+            params.append(priority)
+
+        # page on seq so the connection is only held for one batch at a time
+        sql = f"SELECT seq, {COLUMNS} FROM tasks WHERE {' AND '.join(clauses + ['seq > ?'])} ORDER BY seq LIMIT ? OFFSET ?"
+        last_seq = 0
+        remaining = limit
+        while remaining is None or remaining > 0:
+            batch = QUERY_BATCH_SIZE if remaining is None else min(QUERY_BATCH_SIZE, remaining)
+            with self._lock:
+                rows = self._conn.execute(sql, params + [last_seq, batch, offset]).fetchall()
+            offset = 0
+            for row in rows:
+                yield Task.from_values(row[1:])
+            if len(rows) < batch:
+                return
+            last_seq = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    # writes
+
+    def add(self, task: Task) -> Task:
+        self.add_many([task])
+        return task
+
+    def add_many(self, tasks: List[Task]):
+        rows = [task.to_values() for task in tasks]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO tasks ({COLUMNS}) VALUES ({', '.join('?' for _ in TASK_FIELDS)})",
+                rows
+            )
+            self._log_changes('upsert', [task.id for task in tasks])
+
+    def update(self, task_id: str, updates: dict) -> Optional[Task]:
+        with self._lock, self._conn:
+            task = self.get(task_id)
+            if task is None:
+                return None
+            task_dict = task.to_dict()
+            task_dict.update(updates)
+            updated = Task.from_dict(task_dict)
+
+            self._conn.execute(
+                f"UPDATE tasks SET {', '.join(f'{field} = ?' for field in TASK_FIELDS[1:])} WHERE id = ?",
+                updated.to_values()[1:] + (task_id,)
+            )
+            self._log_changes('upsert', [task_id])
+            return updated
+
+    def delete(self, task_id: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            if cursor.rowcount == 0:
+                return False
+            self._log_changes('delete', [task_id])
+            return True
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tasks")
+            self._log_changes('clear', [None])
+
+    # revisions and change feed
+
+    def _log_changes(self, op: str, task_ids: List[Optional[str]]):
+        """Record changes inside the caller's transaction and trim the log"""
+        now = time.time()
+        self._conn.executemany(
+            "INSERT INTO task_changes (op, task_id, changed_at) VALUES (?, ?, ?)",
+            [(op, task_id, now) for task_id in task_ids]
+        )
+        self._conn.execute(
+            "DELETE FROM task_changes WHERE rev <= (SELECT MAX(rev) FROM task_changes) - ?",
+            (Config.TASKS_CHANGELOG_SIZE,)
+        )
+
+    def current_revision(self) -> Tuple[str, float]:
+        """The revision token and the time of the last change"""
+        with self._lock:
+            row = self._conn.execute("SELECT rev, changed_at FROM task_changes ORDER BY rev DESC LIMIT 1").fetchone()
+        if row is None:
+            return make_revision(self._epoch, 0), 0.0
+        return make_revision(self._epoch, row[0]), row[1]
+
+    def matches_revision(self, token: Optional[str]) -> bool:
+        """Whether a token names the current state"""
+        return token == self.current_revision()[0]
+
+    def changes_since(self, token: Optional[str]) -> Optional[dict]:
+        """Tasks changed or deleted after the given revision, or None if the client must reload everything"""
+        since = parse_revision(token, self._epoch)
+        if since is None:
+            return None
+
+        with self._lock:
+            oldest, newest = self._conn.execute("SELECT MIN(rev), MAX(rev) FROM task_changes").fetchone()
+            newest = newest or 0
+            if since > newest or (since < newest and oldest > since + 1):
+                return None
+            rows = self._conn.execute(
+                "SELECT op, task_id FROM task_changes WHERE rev > ? AND rev <= ? ORDER BY rev", (since, newest)
+            ).fetchall()
+
+        latest = {}
+        for op, task_id in rows:
+            if op == 'clear':
+                return None
+            latest[task_id] = op
+
+        upserted = [task_id for task_id, op in latest.items() if op == 'upsert']
+        changed = []
+        for start in range(0, len(upserted), QUERY_BATCH_SIZE):
+            ids = upserted[start:start + QUERY_BATCH_SIZE]
+            changed += self._query(
+                f"SELECT {COLUMNS} FROM tasks WHERE id IN ({', '.join('?' for _ in ids)}) ORDER BY seq", ids
+            )
+        found = {task.id for task in changed}
+
+        return {
+            'revision': make_revision(self._epoch, newest),
+            'changed': changed,
+            'deleted': [task_id for task_id in latest if task_id not in found],
+        }
+
+    def flush(self):
+        # every write is committed in its own transaction
+        pass
+
+
+def migrate_json(json_path: str, db_path: str) -> int:
+    """Copy tasks from a tasks.json file into the SQLite database"""
+    with open(json_path, 'rb') as f:
+        tasks = Task.decode_many(f.read())
+
+    store = SqliteTaskStore(db_path)
+    store.add_many(tasks)
+    return len(tasks)
+
+
+if __name__ == '__main__':
+    # usage: python -m services.sqlite_task_store [tasks.json] [tasks.db]
+    json_path = sys.argv[1] if len(sys.argv) > 1 else Config.TASKS_FILE
+    db_path = sys.argv[2] if len(sys.argv) > 2 else Config.TASKS_DB_FILE
+    count = migrate_json(json_path, db_path)
+    print(f"Migrated {count} tasks from {json_path} to {db_path}")
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from config import Config
+from services.openai_service import OpenAIService
+
+
+class DailySummaryService:
+    """Keeps end-of-day summaries keyed by date and a fingerprint of the day's tasks.
+
+    A summary is only generated again when the day's tasks actually change.
+    With background refresh on, a changed task set is summarized on a
+    background thread while the previous summary is served, flagged stale."""
+
+    KEEP_DAYS = 7
+
+    def __init__(self, openai_service: OpenAIService, background: bool = Config.SUMMARY_BACKGROUND_REFRESH):
+        self.openai_service = openai_service
+        self.background = background
+        self._lock = threading.Lock()
+        # date -> (fingerprint, summary, generated_at)
+        self._summaries: Dict[str, Tuple[str, str, float]] = {}
+        # (date, fingerprint) currently being generated in the background
+        self._refreshing = set()
+
+    @staticmethod
+    def fingerprint(tasks: List[dict]) -> str:
+        """Hash of the parts of the day's tasks that the summary depends on"""
+        state = sorted(
+            (t.get('id') or '', t.get('title') or '', t.get('status') or '', t.get('duration_est') or 0)
+            for t in tasks
+        )
+        return hashlib.sha1(json.dumps(state).encode('utf-8')).hexdigest()[:16]
+
+    def get_summary(self, date: str, tasks: List[dict]) -> dict:
+        """Summary for the day's tasks, with 'stale' set if it predates the latest changes"""
+        fingerprint = self.fingerprint(tasks)
+        with self._lock:
+            entry = self._summaries.get(date)
+
+        if entry and entry[0] == fingerprint:
+            return self._result(entry, stale=False)
+
+        if entry and self.background:
+            self._refresh_in_background(date, fingerprint, tasks)
+            return self._result(entry, stale=True)
+
+        return self._result(self._generate(date, fingerprint, tasks), stale=False)
+
+    def _generate(self, date: str, fingerprint: str, tasks: List[dict]) -> Tuple[str, str, float]:
+        summary = self.openai_service.generate_daily_summary(tasks)
+        entry = (fingerprint, summary, time.time())
+        with self._lock:
+            self._summaries[date] = entry
+            for old_date in sorted(self._summaries)[:-self.KEEP_DAYS]:
+                del self._summaries[old_date]
+        return entry
+
+    def _refresh_in_background(self, date: str, fingerprint: str, tasks: List[dict]):
+        key = (date, fingerprint)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._generate(date, fingerprint, tasks)
+            except Exception as e:
+                print(f"Daily summary refresh error: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    @staticmethod
+    def _result(entry: Tuple[str, str, float], stale: bool) -> dict:
+        fingerprint, summary, generated_at = entry
+        return {
+            'summary': summary,
+            'fingerprint': fingerprint,
+            'generated_at': generated_at,
+            'stale': stale,
+        }
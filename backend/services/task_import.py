@@ -0,0 +1,132 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from config import Config
+from models.task import TASK_FIELDS, Task, task_fields_error
+
+# rows read and parsed at a time, which bounds memory and queued parses
+IMPORT_CHUNK_SIZE = 500
+
+
+class ImportTooLarge(Exception):
+    pass
+
+
+def read_ndjson(stream) -> Iterator:
+    """Rows from an NDJSON byte stream: objects, or strings of free text"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+
+def read_csv(stream) -> Iterator:
+    """Rows from a CSV byte stream with a header of task fields (or an 'input' column of free text)"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        # empty cells mean "not set"
+        yield {key: value for key, value in row.items() if key and value not in (None, '')}
+
+
+def encode_csv(tasks: Iterable[Task], chunk_size: int = 200) -> Iterator[str]:
+    """Yield tasks as CSV with a header row, a chunk of tasks at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TASK_FIELDS)
+    count = 0
+    for task in tasks:
+        writer.writerow(task.to_values())
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class TaskImporter:
+    """Turn imported rows into tasks and add them in one write.
+
+    A row is either structured task fields (title required) or free text,
+    given as a plain string or an object with an 'input' key whose other
+    fields override the parsed ones. The free text of each chunk of rows is
+    parsed with one parse_many call, which batches LLM requests and bounds
+    their concurrency. Nothing is written unless every row was read; rows
+    that fail are reported and skipped."""
+
+    def __init__(self, task_service, parse_many: Callable[..., List[dict]], workers: Optional[int] = None,
+                 max_rows: Optional[int] = None):
+        self.task_service = task_service
+        self.parse_many = parse_many
+        self.workers = workers or Config.BULK_PARSE_WORKERS
+        self.max_rows = max_rows or Config.BULK_IMPORT_MAX_ROWS
+
+    def run(self, rows: Iterable) -> List[dict]:
+        """Import rows; returns a result per row: {'row', 'id'} or {'row', 'error'}"""
+        results, tasks = [], []
+        numbered = enumerate(rows, 1)
+        while True:
+            chunk = list(islice(numbered, IMPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+            if chunk[-1][0] > self.max_rows:
+                raise ImportTooLarge(f"At most {self.max_rows} rows can be imported at once")
+
+            rows_data = [self._row_data(row) for _, row in chunk]
+            free_text = [row['input'] for row in rows_data if self._needs_parse(row)]
+            parsed = iter(self.parse_many(free_text, workers=self.workers) if free_text else [])
+
+            for (number, _), row in zip(chunk, rows_data):
+                if not isinstance(row, Exception):
+                    row = self._task_data(row, next(parsed) if self._needs_parse(row) else {})
+                if isinstance(row, Exception):
+                    results.append({'row': number, 'error': str(row)})
+                    continue
+                try:
+                    task = self.task_service.build_task(row)
+                except (TypeError, ValueError) as e:
+                    results.append({'row': number, 'error': str(e)})
+                    continue
+                tasks.append(task)
+                results.append({'row': number, 'id': task.id})
+
+        self.task_service.add_tasks(tasks)
+        return results
+
+    @staticmethod
+    def _row_data(row):
+        """The row as a dict, or the exception explaining why it can't be used"""
+        if isinstance(row, str):
+            return {'input': row}
+        if isinstance(row, (dict, Exception)):
+            return row
+        return ValueError("Row must be an object or a string")
+
+    @staticmethod
+    def _needs_parse(row) -> bool:
+        return isinstance(row, dict) and bool(row.get('input')) and not row.get('title')
+
+    @staticmethod
+    def _task_data(row: dict, parsed: dict):
+        """Task data from the parsed free text overridden by the row's own fields, or the error"""
+        task_data = dict(parsed)
+        task_data.update((key, value) for key, value in row.items() if key in TASK_FIELDS)
+
+        if not task_data.get('title'):
+            return ValueError("Row needs a title or input")
+        if task_data.get('duration_est') is not None:
+            try:
+                task_data['duration_est'] = int(task_data['duration_est'])
+            except (TypeError, ValueError):
+                return ValueError(f"Invalid duration_est: {task_data['duration_est']!r}")
+        error = task_fields_error(task_data)
+        if error:
+            return ValueError(error)
+        return task_data
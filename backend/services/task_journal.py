@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TaskJournal:
+    """Append-only JSON-lines log of task changes.
+
+    Each line is one record: create (full task), patch (changed fields only),
+    delete (tombstone) or clear. Appending costs the size of the change, not
+    the size of the task list."""
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._drop_torn_tail()
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def _drop_torn_tail(self):
+        """Cut off a partial last line so new records start on a fresh line"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def append(self, record: dict):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def read_from(self, offset: int = 0) -> Tuple[List[dict], int]:
+        """Read the complete records after `offset`; returns them and the offset they end at"""
+        records = []
+        if not os.path.exists(self.path):
+            return records, offset
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # torn or in-progress write; pick it up next time
+                    break
+                offset += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.warning("Skipping corrupt journal record: %r", line[:80])
+        return records, offset
+
+    def stamp(self) -> Optional[Tuple[int, int]]:
+        """(inode, size) of the journal file, used to spot appends by other workers"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size
+
+    def close(self):
+        """Close the append handle; the next append reopens the current file"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def size(self) -> int:
+        with self._lock:
+            if self._file is not None:
+                return self._file.tell()
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def discard_before(self, offset: int):
+        """Drop the first `offset` bytes, keeping records appended after them"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+            tail = b''
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    tail = f.read()
+
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(tail)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
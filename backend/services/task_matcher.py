@@ -0,0 +1,104 @@
+import math
+import re
+from collections import Counter
+from datetime import date
+from typing import List, Optional, Tuple
+
+from services.rule_parser_service import RuleBasedParser
+
+# words that say what to do with the task rather than which task it is
+STOP_WORDS = {
+    'a', 'an', 'the', 'my', 'to', 'for', 'of', 'on', 'at', 'in', 'by', 'with', 'and', 'or', 'that', 'this',
+    'it', 'i', 'me', 'please', 'task', 'todo', 'item', 'one', 'delete', 'remove', 'cancel', 'drop', 'clear',
+    'forget', 'scrap', 'erase', 'get', 'rid', 'about', 'thing', 'from', 'list', 'can', 'you', 'done',
+}
+WORD = re.compile(r"[a-z0-9]+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# score added when the request's date/time agrees with the task's, or subtracted when the task has another
+DATE_BONUS = 1.5
+TIME_BONUS = 1.5
+
+_rule_parser = RuleBasedParser()
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stop words, plural 's' stripped"""
+    tokens = []
+    for word in WORD.findall(text.lower().replace("'s", '')):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class TaskMatcher:
+    """Find the task a request refers to without calling the LLM.
+
+    Task titles are scored against the request with BM25. Dates and times
+    in the request ("tomorrow", "at 5pm") are parsed with the rule-based
+    parser and compared with each task's due_date and due_time. The
+    confidence combines how much of the request the best task explains with
+    how far it is ahead of the runner-up."""
+
+    def __init__(self, tasks: List[dict]):
+        self.tasks = tasks
+        self._docs = [Counter(tokenize(task.get('title') or '')) for task in tasks]
+        self._avg_len = (sum(sum(doc.values()) for doc in self._docs) / len(self._docs)) if self._docs else 0.0
+        doc_freq = Counter(token for doc in self._docs for token in doc)
+        n = len(self._docs)
+        self._idf = {token: math.log(1 + (n - df + 0.5) / (df + 0.5)) for token, df in doc_freq.items()}
+
+    def rank(self, query: str, today: Optional[date] = None) -> List[Tuple[float, int]]:
+        """(score, task index) for every task, best first"""
+        terms, due_date, due_time = self._read_query(query, today)
+        scored = []
+        for index, (task, doc) in enumerate(zip(self.tasks, self._docs)):
+            score = self._bm25(terms, doc)
+            if due_date and task.get('due_date'):
+                score += DATE_BONUS if task['due_date'] == due_date else -DATE_BONUS
+            if due_time and task.get('due_time'):
+                score += TIME_BONUS if task['due_time'] == due_time else -TIME_BONUS
+            scored.append((score, index))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return scored
+
+    def match(self, query: str, today: Optional[date] = None) -> Tuple[Optional[int], float, List[int]]:
+        """Best task index (None if nothing matches), its confidence 0-1, and all task indexes best first"""
+        ranked = self.rank(query, today)
+        order = [index for _, index in ranked]
+        if not ranked or ranked[0][0] <= 0:
+            return None, 0.0, order
+
+        best_score, best = ranked[0]
+        runner_up = max(ranked[1][0], 0.0) if len(ranked) > 1 else 0.0
+        margin = (best_score - runner_up) / best_score
+
+        terms = set(self._read_query(query, today)[0])
+        coverage = len(terms & set(self._docs[best])) / len(terms) if terms else 1.0
+        return best, round(coverage * (0.5 + 0.5 * margin), 3), order
+
+    @staticmethod
+    def _read_query(query: str, today: Optional[date]) -> Tuple[List[str], Optional[str], Optional[str]]:
+        """Title terms, due date and due time mentioned in the request"""
+        parsed, _ = _rule_parser.parse(query, today)
+        # the parser's title drops date and time words, which would otherwise count as unmatched terms
+        terms = tokenize(parsed.get('title') or '') or tokenize(query)
+        # not parsed['due_date'], which is filled in for a bare time ("the 3pm dentist appointment")
+        return terms, _rule_parser.named_date(query, today), parsed.get('due_time')
+
+    def _bm25(self, terms: List[str], doc: Counter) -> float:
+        length = sum(doc.values())
+        score = 0.0
+        for term in terms:
+            tf = doc.get(term)
+            if not tf:
+                continue
+            norm = tf + K1 * (1 - B + B * length / self._avg_len) if self._avg_len else tf + K1
+            score += self._idf[term] * tf * (K1 + 1) / norm
+        return score
@@ -0,0 +1,567 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import Config
+from models.task import OPEN_STATUSES, TASK_TYPES, Task
+from services.file_lock import FileLock
+from services.task_journal import TaskJournal
+
+logger = logging.getLogger(__name__)
+
+
+def make_revision(epoch: str, rev: int) -> str:
+    return f"{epoch}-{rev}"
+
+
+def parse_revision(token: Optional[str], epoch: str) -> Optional[int]:
+    """The change number in a revision token, or None if it is from another epoch or malformed"""
+    if not token:
+        return None
+    token_epoch, _, rev = token.rpartition('-')
+    if token_epoch != epoch or not rev.isdigit():
+        return None
+    return int(rev)
+
+
+# every store still in use, flushed at exit
+_open_stores = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_stores():
+    for store in list(_open_stores):
+        store.flush()
+
+
+class TaskStore:
+    """Resident copy of the task file, indexed by id, due date and status.
+
+    The file is read once when the store is created. Mutations update memory
+    straight away and are then persisted in one of two ways:
+
+    * 'json': schedule a debounced, atomic rewrite of the file on a
+      background timer, so request handlers never serialize the whole list.
+    * 'journal': append a small create/patch/delete record to a JSON-lines
+      journal. Once the journal passes a size threshold it is folded back
+      into the snapshot file in the background.
+
+    Several worker processes may share the same files. Disk writes happen
+    under an advisory file lock, and before each read the store compares the
+    files' inode/mtime/size with what it last saw, reloading only when
+    another worker has changed them. Pending changes are kept as records and
+    re-applied on top of whatever is on disk, so workers never overwrite
+    each other's updates.
+
+    Every applied change bumps a revision counter and is kept in a bounded
+    change log, which backs ETags and the change feed. Revisions are
+    '<epoch>-<n>' tokens. The epoch, counter and log are saved next to the
+    snapshot ('<file>.meta') whenever it is written, and journal records are
+    replayed in the same order everywhere, so every worker numbers the same
+    state the same way. In json mode, states with unflushed changes get
+    tokens of a per-process epoch instead, which no other worker matches;
+    once the flush writes them under the same numbers those tokens stay
+    valid. A new epoch (a snapshot that doesn't match its metadata) tells
+    clients holding older tokens to fetch everything again."""
+
+    # weak, so stores of users no longer in use are freed
+    _stores = weakref.WeakValueDictionary()
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, path: str, mode: str = 'json') -> 'TaskStore':
+        """Return the process-wide store for the given file"""
+        key = os.path.abspath(path)
+        with cls._stores_lock:
+            store = cls._stores.get(key)
+            if store is None:
+                store = cls._stores[key] = cls(path, mode=mode)
+            return store
+
+    def __init__(self, path: str, mode: str = 'json', flush_delay: float = Config.TASKS_FLUSH_DELAY):
+        if mode not in ('json', 'journal'):
+            raise ValueError(f"Unknown task storage mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.flush_delay = flush_delay
+
+        self.journal = None
+        self.compact_bytes = Config.TASKS_JOURNAL_COMPACT_BYTES
+        self._compacting = False
+        if mode == 'journal':
+            self.journal = TaskJournal(path + '.journal', fsync=Config.TASKS_JOURNAL_FSYNC)
+
+        # lock order: _file_lock, then _flush_lock, then _lock
+        self._file_lock = FileLock(path)
+        self._flush_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._flush_timer = None
+
+        # records applied in memory but not yet written to tasks.json (json mode)
+        self._pending: List[dict] = []
+        # what the files looked like after we last read or wrote them
+        self._snapshot_stamp = None
+        self._journal_offset = 0
+
+        # change feed: (revision number, 'upsert' | 'delete' | 'clear', task id)
+        self.meta_path = path + '.meta'
+        self._epoch = uuid.uuid4().hex[:12]
+        # used in tokens for changes that could not be flushed, so no other worker matches them
+        self._local_epoch = uuid.uuid4().hex[:12]
+        self._rev = 0
+        self._modified_at = time.time()
+        self._changes = deque(maxlen=Config.TASKS_CHANGELOG_SIZE)
+
+        self._tasks: Dict[str, Task] = {}
+        # dicts used as ordered sets of task ids
+        self._by_due_date: Dict[Optional[str], Dict[str, None]] = {}
+        self._by_status: Dict[str, Dict[str, None]] = {}
+        # (due_date, task_type) -> (open task count, open minutes), kept current on every change
+        self._workload: Dict[Tuple[str, str], Tuple[int, int]] = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._file_lock:
+            if not os.path.exists(path):
+                self._write_atomic([], self._meta())
+            with self._lock:
+                self._reload()
+
+        if self.journal is not None and self.journal.size() > self.compact_bytes:
+            self.compact()
+        _open_stores.add(self)
+
+    # loading and indexing
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _reload(self):
+        """Rebuild memory from disk, then re-apply changes not yet written. Needs the file lock"""
+        self._snapshot_stamp = self._file_stamp()
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        tasks = Task.decode_many(raw)
+
+        epoch = self._epoch
+        self._reset(tasks)
+        self._load_meta(len(raw))
+        if self._pending or self._epoch != epoch:
+            # pending changes are renumbered on top of what is on disk, so tokens given out for them are void
+            self._local_epoch = uuid.uuid4().hex[:12]
+        if self.journal is not None:
+            # the journal may have been replaced by another worker's compaction
+            self.journal.close()
+            records, self._journal_offset = self.journal.read_from(0)
+            for record in records:
+                self._apply(record)
+        for record in self._pending:
+            self._apply(record)
+
+    def _load_meta(self, size: int):
+        """Take the revision and change log saved with the snapshot. Needs the file lock"""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if meta is None or meta.get('size') != size:
+            # missing, or the snapshot was written without it: we can't tell which tasks changed
+            self._epoch = uuid.uuid4().hex[:12]
+            self._rev = 0
+            self._modified_at = time.time()
+            self._changes.clear()
+            self._write_meta(self._meta(), size)
+            return
+        self._epoch = meta['epoch']
+        self._rev = meta['rev']
+        self._modified_at = meta['modified_at']
+        self._changes.clear()
+        self._changes.extend(tuple(change) for change in meta['changes'])
+
+    def _meta(self) -> dict:
+        return {
+            'epoch': self._epoch,
+            'rev': self._rev,
+            'modified_at': self._modified_at,
+            'changes': list(self._changes),
+        }
+
+    def _sync(self):
+        """Pick up changes other workers have written since we last looked"""
+        if self._is_current():
+            return
+        with self._file_lock, self._lock:
+            if self._is_current():
+                return
+            if self._file_stamp() != self._snapshot_stamp:
+                self._reload()
+            else:
+                # only new journal records: replay just those
+                records, self._journal_offset = self.journal.read_from(self._journal_offset)
+                for record in records:
+                    self._apply(record)
+
+    def _is_current(self) -> bool:
+        if self._file_stamp() != self._snapshot_stamp:
+            return False
+        if self.journal is None:
+            return True
+        stamp = self.journal.stamp()
+        return stamp is None or stamp[1] == self._journal_offset
+
+    def _reset(self, tasks: Iterable[Task]):
+        self._tasks = {}
+        self._by_due_date = {}
+        self._by_status = {}
+        self._workload = {}
+        for task in tasks:
+            self._insert(task)
+
+    def _insert(self, task: Task):
+        self._tasks[task.id] = task
+        self._by_due_date.setdefault(task.due_date, {})[task.id] = None
+        self._by_status.setdefault(task.status, {})[task.id] = None
+        self._count_workload(task, 1)
+
+    def _remove(self, task: Task):
+        del self._tasks[task.id]
+        self._discard(self._by_due_date, task.due_date, task.id)
+        self._discard(self._by_status, task.status, task.id)
+        self._count_workload(task, -1)
+
+    def _count_workload(self, task: Task, sign: int):
+        """Add (sign=1) or remove (sign=-1) an open dated task from the workload aggregates"""
+        if task.due_date is None or task.status not in OPEN_STATUSES:
+            return
+        key = (task.due_date, task.task_type)
+        count, minutes = self._workload.get(key, (0, 0))
+        count += sign
+        if count:
+            self._workload[key] = (count, minutes + sign * task.duration_minutes())
+        else:
+            self._workload.pop(key, None)
+
+    @staticmethod
+    def _discard(index: dict, key, task_id: str):
+        ids = index.get(key)
+        if ids is None:
+            return
+        ids.pop(task_id, None)
+        if not ids:
+            del index[key]
+
+    # reads
+
+    def get(self, task_id: str) -> Optional[Task]:
+        self._sync()
+        with self._lock:
+            return self._tasks.get(task_id)
+
+    def all(self) -> List[Task]:
+        self._sync()
+        with self._lock:
+            return list(self._tasks.values())
+
+    def for_date(self, due_date: Optional[str], statuses: Optional[Iterable[str]] = None) -> List[Task]:
+        """Tasks due on the given date (None for undated tasks), optionally limited to some statuses"""
+        self._sync()
+        with self._lock:
+            tasks = [self._tasks[task_id] for task_id in self._by_due_date.get(due_date, ())]
+        if statuses is not None:
+            statuses = set(statuses)
+            tasks = [task for task in tasks if task.status in statuses]
+        return tasks
+
+    def workload(self, due_date: str) -> Dict[str, Tuple[int, int]]:
+        """Open task count and estimated minutes per task type due on a date"""
+        self._sync()
+        with self._lock:
+            return {
+                task_type: self._workload[(due_date, task_type)]
+                for task_type in TASK_TYPES if (due_date, task_type) in self._workload
+            }
+
+    def workloads(self, start_date: str, end_date: str) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        """workload() for every date from start_date to end_date (inclusive) that has open tasks"""
+        self._sync()
+        result = {}
+        with self._lock:
+            for (due_date, task_type), value in self._workload.items():
+                if start_date <= due_date <= end_date:
+                    result.setdefault(due_date, {})[task_type] = value
+        return result
+
+    def query(self, due_dates: Optional[Iterable[Optional[str]]] = None,
+              statuses: Optional[Iterable[str]] = None,
+              task_type: Optional[str] = None,
+              priority: Optional[str] = None,
+              offset: int = 0,
+              limit: Optional[int] = None) -> Iterator[Task]:
+        """Lazily yield tasks matching every given filter, starting from the index that narrows it most"""
+        self._sync()
+        with self._lock:
+            if due_dates is not None:
+                ids = [task_id for due_date in due_dates for task_id in self._by_due_date.get(due_date, ())]
+            elif statuses is not None:
+                ids = [task_id for status in statuses for task_id in self._by_status.get(status, ())]
+            else:
+                ids = list(self._tasks)
+            tasks = [self._tasks[task_id] for task_id in ids]
+
+        statuses = set(statuses) if statuses is not None else None
+        matches = (
+            task for task in tasks
+            if (statuses is None or task.status in statuses)
+            and (task_type is None or task.task_type == task_type)
+            and (priority is None or task.priority == priority)
+        )
+        stop = offset + limit if limit is not None else None
+        return islice(matches, offset, stop)
+
+    # writes
+
+    def add(self, task: Task) -> Task:
+        self._write({'op': 'create', 'task': task.to_dict()})
+        return task
+
+    def add_many(self, tasks: List[Task]):
+        """Add tasks as one change record, so they are persisted together"""
+        if tasks:
+            self._write({'op': 'create_many', 'tasks': [task.to_dict() for task in tasks]})
+
+    def update(self, task_id: str, updates: dict) -> Optional[Task]:
+        record = {'op': 'patch', 'id': task_id, 'changes': dict(updates)}
+        if not self._write(record, must_exist=task_id):
+            return None
+        with self._lock:
+            return self._tasks.get(task_id)
+
+    def delete(self, task_id: str) -> bool:
+        return self._write({'op': 'delete', 'id': task_id}, must_exist=task_id)
+
+    def clear(self):
+        self._write({'op': 'clear'})
+
+    def _write(self, record: dict, must_exist: Optional[str] = None) -> bool:
+        """Apply a change record in memory and persist it. Returns False if the target task is missing"""
+        if self.journal is None:
+            # json mode: the flush re-applies pending records onto the latest file
+            self._sync()
+            with self._lock:
+                if must_exist is not None and must_exist not in self._tasks:
+                    return False
+                self._pending.append(self._apply(record))
+                self._schedule_flush()
+            return True
+
+        with self._file_lock:
+            self._sync()
+            with self._lock:
+                if must_exist is not None and must_exist not in self._tasks:
+                    return False
+                record['at'] = time.time()
+                self.journal.append(self._apply(record))
+                self._journal_offset = self.journal.stamp()[1]
+                if not self._compacting and self._journal_offset > self.compact_bytes:
+                    self._compacting = True
+                    threading.Thread(target=self.compact, daemon=True).start()
+        return True
+
+    def _apply(self, record: dict) -> dict:
+        """Apply one change record to memory; used for live writes, pending changes and journal replay"""
+        op = record.get('op')
+        if op == 'create':
+            task = Task.from_dict(record['task'])
+            if task.id in self._tasks:
+                self._remove(self._tasks[task.id])
+            self._insert(task)
+            self._log_change('upsert', task.id, record.get('at'))
+        elif op == 'create_many':
+            for task_dict in record['tasks']:
+                self._apply({'op': 'create', 'task': task_dict, 'at': record.get('at')})
+        elif op == 'patch':
+            task = self._tasks.get(record['id'])
+            if task is not None:
+                task_dict = task.to_dict()
+                task_dict.update(record['changes'])
+                updated = Task.from_dict(task_dict)
+
+                # replace in place so the task keeps its position in listings
+                self._discard(self._by_due_date, task.due_date, task.id)
+                self._discard(self._by_status, task.status, task.id)
+                self._count_workload(task, -1)
+                self._tasks[task.id] = updated
+                self._by_due_date.setdefault(updated.due_date, {})[task.id] = None
+                self._by_status.setdefault(updated.status, {})[task.id] = None
+                self._count_workload(updated, 1)
+                self._log_change('upsert', task.id, record.get('at'))
+        elif op == 'delete':
+            task = self._tasks.get(record['id'])
+            if task is not None:
+                self._remove(task)
+                self._log_change('delete', task.id, record.get('at'))
+        elif op == 'clear':
+            self._reset([])
+            self._log_change('clear', None, record.get('at'))
+        else:
+            logger.warning("Ignoring unknown task record: %s", record)
+        return record
+
+    # revisions and change feed
+
+    def _log_change(self, op: str, task_id: Optional[str], at: Optional[float] = None):
+        self._rev += 1
+        self._modified_at = at or time.time()
+        self._changes.append((self._rev, op, task_id))
+
+    def _revision_epoch(self) -> str:
+        """The epoch for tokens of the current state; needs _lock"""
+        # unflushed changes are numbered locally, so their tokens must not match another worker's
+        return self._local_epoch if self._pending else self._epoch
+
+    def _parse_revision(self, token: Optional[str]) -> Optional[int]:
+        """The change number of a token given out by this store or read from disk; needs _lock"""
+        # local tokens are only given out above the flushed changes, and local and
+        # flushed changes share one numbering until a reload voids the local epoch
+        since = parse_revision(token, self._epoch)
+        return since if since is not None else parse_revision(token, self._local_epoch)
+
+    def current_revision(self) -> Tuple[str, float]:
+        """The revision token and the time of the last change"""
+        self._sync()
+        with self._lock:
+            return make_revision(self._revision_epoch(), self._rev), self._modified_at
+
+    def matches_revision(self, token: Optional[str]) -> bool:
+        """Whether a token names the current state, even if it was given out before a flush"""
+        self._sync()
+        with self._lock:
+            return self._parse_revision(token) == self._rev
+
+    def changes_since(self, token: Optional[str]) -> Optional[dict]:
+        """Tasks changed or deleted after the given revision, or None if the client must reload everything"""
+        self._sync()
+        with self._lock:
+            since = self._parse_revision(token)
+            if since is None or since > self._rev:
+                return None
+            if since < self._rev and (not self._changes or self._changes[0][0] > since + 1):
+                # older than the retained log
+                return None
+
+            latest = {}
+            for rev, op, task_id in self._changes:
+                if rev <= since:
+                    continue
+                if op == 'clear':
+                    return None
+                latest[task_id] = op
+
+            return {
+                'revision': make_revision(self._revision_epoch(), self._rev),
+                'changed': [self._tasks[task_id] for task_id, op in latest.items()
+                            if op == 'upsert' and task_id in self._tasks],
+                'deleted': [task_id for task_id in latest if task_id not in self._tasks],
+            }
+
+    # persistence
+
+    def _schedule_flush(self):
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """Write pending changes to disk, replacing the file atomically"""
+        if self.journal is not None:
+            # journal records are already on disk
+            return
+        with self._file_lock, self._flush_lock:
+            with self._lock:
+                self._flush_timer = None
+                if not self._pending:
+                    return
+                if self._file_stamp() != self._snapshot_stamp:
+                    self._reload()
+                # tasks are replaced on update, never changed in place,
+                # so a shallow copy is a consistent snapshot to encode outside the lock
+                tasks = list(self._tasks.values())
+                meta = self._meta()
+                written = len(self._pending)
+
+            try:
+                self._write_atomic(tasks, meta)
+            except Exception:
+                logger.exception("Task flush error, retrying")
+                with self._lock:
+                    self._schedule_flush()
+                return
+
+            with self._lock:
+                del self._pending[:written]
+                self._snapshot_stamp = self._file_stamp()
+
+    def compact(self):
+        """Fold the journal into the snapshot file and drop the folded records"""
+        try:
+            with self._file_lock, self._flush_lock:
+                self._sync()
+                with self._lock:
+                    tasks = list(self._tasks.values())
+                    meta = self._meta()
+                    offset = self._journal_offset
+
+                # other writers wait on the file lock, so nothing is appended meanwhile
+                self._write_atomic(tasks, meta)
+                self.journal.discard_before(offset)
+
+                with self._lock:
+                    self._snapshot_stamp = self._file_stamp()
+                    self._journal_offset = 0
+        except Exception:
+            logger.exception("Task journal compaction error")
+        finally:
+            self._compacting = False
+
+    def _write_atomic(self, tasks: List[Task], meta: dict):
+        """Replace the snapshot, and the metadata describing it first"""
+        data = Task.encode_many(tasks)
+        # a crash between the two leaves metadata of another size, which starts a new epoch
+        self._write_meta(meta, len(data))
+        self._replace(self.path, data)
+
+    def _write_meta(self, meta: dict, size: int):
+        self._replace(self.meta_path, json.dumps(dict(meta, size=size), separators=(',', ':')).encode('utf-8'))
+
+    @staticmethod
+    def _replace(path: str, data: bytes):
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tasks-', suffix='.tmp')
+        try:
+            # mkstemp creates the file as 0600; keep the usual permissions
+            os.chmod(tmp_path, 0o644)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -1,69 +1,79 @@
-import json
-import os
 import uuid
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 from config import Config
 from models.task import Task
+from services.sqlite_task_store import SqliteTaskStore
+from services.task_store import TaskStore
+from services.tenancy import DEFAULT_USER, user_path
 
 
 class TaskService:
-    def __init__(self):
-        self.tasks_file = Config.TASKS_FILE
-        self._ensure_file_exists()
+    def __init__(self, user_id: str = DEFAULT_USER):
+        self.user_id = user_id
+        self.tasks_file = user_path(user_id, Config.TASKS_FILE)
+        if Config.TASKS_STORAGE == 'sqlite':
+            self.store = SqliteTaskStore.shared(user_path(user_id, Config.TASKS_DB_FILE))
+        else:
+            self.store = TaskStore.shared(self.tasks_file, mode=Config.TASKS_STORAGE)
 
-    def _ensure_file_exists(self):
-        os.makedirs(os.path.dirname(self.tasks_file), exist_ok=True)
-        if not os.path.exists(self.tasks_file):
-            with open(self.tasks_file, 'w') as f:
-                json.dump([], f)
-
-    def _load_tasks_from_file(self) -> List[Task]:
-        with open(self.tasks_file, 'r') as f:
-            data = json.load(f)
-            return [Task.from_dict(tasks) for tasks in data]
+    def add_task(self, task_data: dict) -> Task:
+        return self.store.add(self.build_task(task_data))
 
-    def _save_tasks_to_file(self, tasks: List[Task]):
-        with open(self.tasks_file, 'w') as f:
-            json.dump([tasks.to_dict() for tasks in tasks], f, indent=2)
+    def build_task(self, task_data: dict) -> Task:
+        """Make a Task from task data, giving it a new id unless it has one; raises ValueError for invalid fields"""
+        if not task_data.get('id'):
+            task_data['id'] = str(uuid.uuid4())
+        return Task.from_dict(task_data)
 
-    def add_task(self, task_data: dict) -> Task:
-        tasks = self._load_tasks_from_file()
-        task_data['id'] = str(uuid.uuid4())
-        new_task = Task.from_dict(task_data)
-        tasks.append(new_task)
-        self._save_tasks_to_file(tasks)
-        return new_task
+    def add_tasks(self, tasks: List[Task]):
+        """Add many tasks in a single write"""
+        self.store.add_many(tasks)
 
     def delete_task(self, task_id: str) -> bool:
-        tasks = self._load_tasks_from_file()
-        initial_length = len(tasks)
-        tasks = [task for task in tasks if task.id != task_id]
-        if len(tasks) < initial_length:
-            self._save_tasks_to_file(tasks)
-            return True
-        return False
+        return self.store.delete(task_id)
 
     def get_task(self, task_id: str) -> Optional[Task]:
-        tasks = self._load_tasks_from_file()
-        for task in tasks:
-            if task.id == task_id:
-                return task
-        return None
+        return self.store.get(task_id)
 
     def update_task(self, task_id: str, updates: dict) -> Optional[Task]:
-        tasks = self._load_tasks_from_file()
-        for i, task in enumerate(tasks):
-            if task.id == task_id:
-                task_dict = task.to_dict()
-                task_dict.update(updates)
-                tasks[i] = Task.from_dict(task_dict)
-                self._save_tasks_to_file(tasks)
-                return tasks[i]
-        return None
+        return self.store.update(task_id, updates)
 
     def clear_tasks(self):
-        self._save_tasks_to_file([])
+        self.store.clear()
 
     def get_all_tasks(self) -> List[Task]:
-        return self._load_tasks_from_file()
+        return self.store.all()
+
+    def tasks_for_date(self, due_date: Optional[str], statuses: Optional[Iterable[str]] = None) -> List[Task]:
+        """Get tasks due on a date (None for undated tasks), optionally filtered by status"""
+        return self.store.for_date(due_date, statuses)
+
+    def workload(self, due_date: str) -> Dict[str, Tuple[int, int]]:
+        """Open task count and estimated minutes per task type due on a date, kept current by the store"""
+        return self.store.workload(due_date)
+
+    def workloads(self, start_date: str, end_date: str) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        """Workload of every date in a range (inclusive) that has open tasks"""
+        return self.store.workloads(start_date, end_date)
+
+    def query_tasks(self, due_dates: Optional[Iterable[Optional[str]]] = None,
+                    statuses: Optional[Iterable[str]] = None,
+                    task_type: Optional[str] = None,
+                    priority: Optional[str] = None,
+                    offset: int = 0,
+                    limit: Optional[int] = None) -> Iterator[Task]:
+        """Lazily iterate over tasks matching the given filters (a None due date means undated)"""
+        return self.store.query(due_dates, statuses, task_type, priority, offset, limit)
+
+    def current_revision(self) -> Tuple[str, float]:
+        """Revision token of the task list and the time it last changed"""
+        return self.store.current_revision()
+
+    def matches_revision(self, revision: Optional[str]) -> bool:
+        """Whether a revision token still names the current task list"""
+        return self.store.matches_revision(revision)
+
+    def changes_since(self, revision: Optional[str]) -> Optional[dict]:
+        """Tasks changed and ids deleted since a revision, or None if a full reload is needed"""
+        return self.store.changes_since(revision)
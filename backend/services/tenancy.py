@@ -0,0 +1,123 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from config import Config
+
+# in single-user mode every request acts as this user, whose data stays at the original paths
+DEFAULT_USER = 'default'
+
+# also used as a directory name, so no slashes and no leading dot; emails fit
+USER_ID = re.compile(r'[A-Za-z0-9_@+-][A-Za-z0-9_.@+-]{0,127}')
+
+
+def valid_user_id(user_id) -> bool:
+    return isinstance(user_id, str) and USER_ID.fullmatch(user_id) is not None
+
+
+def normalize_user_id(user_id):
+    """The id a user's data is kept under: trimmed and lowercased, so every casing of an email is one user"""
+    return user_id.strip().lower() if isinstance(user_id, str) else user_id
+
+
+def check_multi_user_config():
+    """Refuse to start multi-user mode with settings that would let anyone sign in as anyone"""
+    if not Config.MULTI_USER:
+        return
+    missing = [name for name in ('SECRET_KEY', 'API_KEY') if not os.getenv(name)]
+    if missing:
+        raise RuntimeError(f"MULTI_USER needs {' and '.join(missing)} to be set")
+
+
+def _token_serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(Config.SECRET_KEY, salt='user-token')
+
+
+def issue_user_token(user_id: str) -> str:
+    """A token that identifies the user to the API until USER_TOKEN_MAX_AGE passes"""
+    return _token_serializer().dumps(user_id)
+
+
+def user_from_token(token: str) -> Optional[str]:
+    """The user a token was issued to, or None if it is forged, expired or malformed"""
+    try:
+        user_id = _token_serializer().loads(token, max_age=Config.USER_TOKEN_MAX_AGE)
+    except BadSignature:
+        return None
+    return user_id if valid_user_id(user_id) else None
+
+
+def public(view):
+    """Mark a view that doesn't act for a user, so it needs no user token"""
+    view.public = True
+    return view
+
+
+def user_path(user_id: str, path: str) -> str:
+    """Where a user's copy of a data file lives: USERS_DIR/<user id>/<file name>"""
+    if user_id == DEFAULT_USER:
+        return path
+    if not valid_user_id(user_id):
+        raise ValueError(f"Invalid user id: {user_id!r}")
+    return os.path.join(Config.USERS_DIR, user_id, os.path.basename(path))
+
+
+class UserCache:
+    """Per-user objects, built on first use and kept for the most recently used max_size users.
+
+    The least recently used object is dropped (and passed to on_evict) when
+    another user's is added, so memory stays bounded however many users
+    there are. Objects are built outside the lock; if two requests build
+    one for the same user at once, the second is discarded."""
+
+    def __init__(self, factory: Callable[[str], object], max_size: int,
+                 on_evict: Optional[Callable[[object], None]] = None):
+        self.factory = factory
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._items: 'OrderedDict[str, object]' = OrderedDict()
+
+    def get(self, user_id: str):
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is not None:
+                self._items.move_to_end(user_id)
+                return item
+
+        built = self.factory(user_id)
+        evicted = []
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None:
+                item = self._items[user_id] = built
+                built = None
+            self._items.move_to_end(user_id)
+            while len(self._items) > self.max_size:
+                evicted.append(self._items.popitem(last=False)[1])
+
+        if built is not None:
+            evicted.append(built)
+        if self.on_evict is not None:
+            for old in evicted:
+                try:
+                    self.on_evict(old)
+                except Exception as e:
+                    print(f"Error releasing user data: {e}")
+        return item
+
+    def clear(self):
+        with self._lock:
+            items = list(self._items.values())
+            self._items.clear()
+        if self.on_evict is not None:
+            for item in items:
+                self.on_evict(item)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -0,0 +1,26 @@
+from config import Config
+from services.calendar_services import CalendarService
+from services.planner_service import WorkloadPlanner
+from services.scheduler_service import TaskScheduler
+from services.tasks_service import TaskService
+from services.tenancy import UserCache
+
+
+class UserServices:
+    """One user's task storage and calendar, with the planner and scheduler over them"""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.task_service = TaskService(user_id)
+        self.calendar_service = CalendarService(user_id)
+        self.planner = WorkloadPlanner(self.task_service, self.calendar_service)
+        self.scheduler = TaskScheduler(self.task_service, self.planner)
+
+    def close(self):
+        """Write pending task changes and stop background work; the objects stay usable"""
+        self.task_service.store.flush()
+        self.calendar_service.close()
+
+
+# services of the most recently active users in this process
+user_services = UserCache(UserServices, Config.USER_CACHE_SIZE, on_evict=UserServices.close)
@@ -0,0 +1,22 @@
+import os
+import sys
+
+# tests import the backend modules the way the app does (from services... import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A test client whose data files are under a temporary directory; jobs only run when a test runs them"""
+    monkeypatch.chdir(tmp_path)
+    from app import app
+    from services.job_queue import job_queue
+    from services.user_services import user_services
+    monkeypatch.setattr(job_queue, '_conn', None)
+    monkeypatch.setattr(job_queue, 'start', lambda: None)
+    user_services.clear()
+    yield app.test_client()
+    user_services.clear()
+    monkeypatch.setattr(job_queue, '_conn', None)
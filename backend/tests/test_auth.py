@@ -0,0 +1,44 @@
+import pytest
+
+from config import Config
+
+
+@pytest.fixture
+def multi_user(client, monkeypatch):
+    monkeypatch.setattr(Config, 'MULTI_USER', True)
+    monkeypatch.setattr(Config, 'API_KEY', 'test-key')
+    return client
+
+
+def issue(client, user_id, api_key='test-key'):
+    return client.post('/api/auth/token', json={'user_id': user_id}, headers={'X-Api-Key': api_key})
+
+
+def bearer(token):
+    return {'Authorization': f"Bearer {token}"}
+
+
+def test_a_token_is_issued_for_an_email_with_a_plus(multi_user):
+    response = issue(multi_user, 'a+b@x.com')
+
+    assert response.status_code == 200
+    assert response.json['user_id'] == 'a+b@x.com'
+    created = multi_user.post('/api/tasks/bulk', data='{"title": "x"}', headers=bearer(response.json['token']))
+    assert created.json['imported'] == 1
+
+
+def test_every_casing_of_an_email_is_the_same_user(multi_user):
+    lower = issue(multi_user, 'ann@x.com').json
+    mixed = issue(multi_user, ' Ann@X.com ').json
+    multi_user.post('/api/tasks/bulk', data='{"title": "x"}', headers=bearer(lower['token']))
+
+    assert mixed['user_id'] == 'ann@x.com'
+    listing = multi_user.get('/api/tasks/', headers=bearer(mixed['token']))
+    assert [task['title'] for task in listing.json] == ['x']
+
+
+def test_requests_need_a_token_issued_with_the_api_key(multi_user):
+    assert issue(multi_user, 'ann@x.com', api_key='wrong').status_code == 401
+    assert issue(multi_user, '../ann').status_code == 400
+    assert multi_user.get('/api/tasks/').status_code == 401
+    assert multi_user.get('/api/tasks/', headers={'X-User-Id': 'ann@x.com'}).status_code == 401
@@ -0,0 +1,104 @@
+from services.job_queue import JobHeld, JobQueue
+
+
+def make_queue(tmp_path, **kwargs):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), **kwargs)
+    # jobs only run when a test runs them
+    queue.start = lambda: None
+    return queue
+
+
+def test_held_jobs_wait_for_release_without_using_attempts(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=1)
+    logged_in = []
+    ran = []
+
+    def handler(payload):
+        if not logged_in:
+            raise JobHeld('login:ann')
+        ran.append(payload)
+    queue.register('sync', handler)
+    queue.enqueue('sync', {'n': 1})
+
+    assert queue.run_pending() == 1
+    assert queue.run_pending() == 0
+    assert queue.stats() == {'held': 1}
+
+    assert queue.release('login:bob') == 0
+    logged_in.append(True)
+    assert queue.release('login:ann') == 1
+    queue.run_pending()
+    assert ran == [{'n': 1}]
+    assert queue.stats() == {'done': 1}
+
+
+def failing(times):
+    calls = []
+
+    def handler(payload):
+        calls.append(payload)
+        if len(calls) <= times:
+            raise RuntimeError(f"failure {len(calls)}")
+    return handler, calls
+
+
+def job_rows(queue):
+    return queue._connection().execute("SELECT status, attempts, last_error FROM jobs").fetchall()
+
+
+def test_failed_jobs_are_retried_after_a_backoff(tmp_path):
+    queue = make_queue(tmp_path, retry_base=60)
+    handler, calls = failing(1)
+    queue.register('sync', handler)
+    queue.enqueue('sync', {'n': 1})
+
+    assert queue.run_pending() == 1
+    # the retry isn't due for another minute
+    assert queue.run_pending() == 0
+    assert job_rows(queue) == [('pending', 1, 'RuntimeError: failure 1')]
+
+    with queue._connection() as conn:
+        conn.execute("UPDATE jobs SET next_run_at = 0")
+    assert queue.run_pending() == 1
+    assert job_rows(queue) == [('done', 2, None)]
+    assert len(calls) == 2
+
+
+def test_jobs_that_keep_failing_are_dropped(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=3, retry_base=0)
+    handler, calls = failing(10)
+    queue.register('sync', handler)
+    queue.enqueue('sync', {'n': 1})
+
+    queue.run_pending()
+
+    assert len(calls) == 3
+    assert job_rows(queue) == [('dead', 3, 'RuntimeError: failure 3')]
+
+
+def test_jobs_without_a_handler_are_dropped_too(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=1)
+    queue.enqueue('unknown', {})
+
+    queue.run_pending()
+
+    assert queue.stats() == {'dead': 1}
+
+
+def test_an_idempotency_key_enqueues_a_job_once(tmp_path):
+    queue = make_queue(tmp_path)
+
+    assert queue.enqueue('sync', {'n': 1}, idempotency_key='task-1')
+    assert not queue.enqueue('sync', {'n': 2}, idempotency_key='task-1')
+    assert queue.stats() == {'pending': 1}
+
+
+def test_jobs_are_shared_by_queues_on_the_same_database(tmp_path):
+    producer, worker = make_queue(tmp_path), make_queue(tmp_path)
+    ran = []
+    worker.register('sync', ran.append)
+    producer.enqueue('sync', {'n': 1})
+
+    assert worker.run_pending() == 1
+    assert producer.run_pending() == 0
+    assert ran == [{'n': 1}]
@@ -0,0 +1,34 @@
+import pytest
+
+from services.nlp_parser_service import NLPParser
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    """Record model requests instead of making them; the model answers with one task"""
+    calls = []
+
+    def call_llm(messages, function):
+        calls.append(messages[-1]['content'])
+        return [{'title': 'Call mom and dad', 'priority': 'medium', 'task_type': 'personal'}]
+
+    monkeypatch.setattr(NLPParser, '_call_llm', staticmethod(call_llm))
+    return calls
+
+
+def test_list_of_tasks_is_parsed_locally(llm_calls):
+    tasks = NLPParser.parse_tasks('buy milk, call mom tomorrow; finish the report by friday')
+    assert [task['title'] for task in tasks] == ['buy milk', 'call mom', 'finish the report']
+    assert llm_calls == []
+
+
+@pytest.mark.parametrize('text', ['Call mom, dad', 'buy milk, eggs, bread'])
+def test_list_inside_one_task_goes_to_the_model_whole(llm_calls, text):
+    tasks = NLPParser.parse_tasks(text)
+    assert llm_calls == [text]
+    assert len(tasks) == 1
+
+
+def test_model_failure_keeps_the_utterance_together(monkeypatch):
+    monkeypatch.setattr(NLPParser, '_call_llm', staticmethod(lambda messages, function: None))
+    assert [task['title'] for task in NLPParser.parse_tasks('Call mom, dad')] == ['Call mom, dad']
@@ -0,0 +1,78 @@
+from datetime import date, datetime
+
+from models.task import Task
+from services.planner_service import WorkloadPlanner
+from services.task_store import TaskStore
+
+TODAY = date(2099, 12, 1)
+
+
+class Tasks:
+    """The part of TaskService the planner reads, over a store in a temp directory"""
+
+    def __init__(self, store):
+        self.workloads = store.workloads
+        self.tasks_for_date = store.for_date
+
+
+class Calendar:
+    def __init__(self, *busy):
+        self.busy = [(datetime.fromisoformat(start), datetime.fromisoformat(end)) for start, end in busy]
+
+    def busy_intervals(self, start, end):
+        return [(s, e) for s, e in self.busy if s.date() < end and e.date() >= start]
+
+
+def planner_with(tmp_path, tasks, *busy):
+    store = TaskStore(str(tmp_path / 'tasks.json'), flush_delay=60)
+    store.add_many([Task(id=str(n), **fields) for n, fields in enumerate(tasks)])
+    return WorkloadPlanner(Tasks(store), Calendar(*busy))
+
+
+def test_the_slot_goes_after_calendar_events_and_timed_tasks(tmp_path):
+    planner = planner_with(
+        tmp_path,
+        [{'title': 'call', 'due_date': '2099-12-01', 'due_time': '10:30', 'duration_est': 60}],
+        ('2099-12-01T09:00', '2099-12-01T10:30'),
+    )
+
+    best = planner.suggest_dates({'due_date': '2099-12-01', 'duration_est': 30}, today=TODAY)[0]
+
+    assert best['date'] == '2099-12-01'
+    assert best['slot'] == {'start': '11:30', 'end': '12:00'}
+
+
+def test_a_day_at_its_task_limit_is_not_suggested(tmp_path):
+    planner = planner_with(tmp_path, [{'title': f"report {n}", 'due_date': '2099-12-01'} for n in range(3)])
+
+    suggestions = planner.suggest_dates({'due_date': '2099-12-01', 'task_type': 'work'}, today=TODAY)
+
+    assert [s['date'] for s in suggestions] == ['2099-12-02', '2099-12-03', '2099-12-04']
+    assert suggestions[0]['slot'] == {'start': '09:00', 'end': '10:00'}
+
+
+def test_a_day_without_a_long_enough_gap_has_no_slot(tmp_path):
+    # two half-hour gaps; a task without an estimate needs an hour
+    planner = planner_with(
+        tmp_path, [],
+        ('2099-12-01T09:00', '2099-12-01T12:00'), ('2099-12-01T12:30', '2099-12-01T17:30'),
+    )
+
+    best = planner.suggest_dates({'due_date': '2099-12-01'}, today=TODAY)[0]
+
+    assert best['date'] == '2099-12-01'
+    assert best['slot'] is None
+
+
+def test_rebalancing_moves_the_lowest_priority_untimed_task(tmp_path):
+    planner = planner_with(tmp_path, [
+        {'title': 'board meeting', 'due_date': '2099-12-01', 'priority': 'high'},
+        {'title': 'standup', 'due_date': '2099-12-01', 'due_time': '09:00'},
+        {'title': 'report', 'due_date': '2099-12-01'},
+        {'title': 'tidy inbox', 'due_date': '2099-12-01', 'priority': 'low'},
+    ])
+
+    plan = planner.rebalance(TODAY, days=3, today=TODAY)
+
+    assert plan['moves'] == [{'task_id': '3', 'title': 'tidy inbox', 'from': '2099-12-01', 'to': '2099-12-02'}]
+    assert plan['unresolved'] == []
@@ -0,0 +1,67 @@
+from datetime import date
+
+import pytest
+
+from services.rule_parser_service import RuleBasedParser
+
+# a Monday, so weekday rules are predictable
+TODAY = date(2030, 1, 7)
+
+
+def parse(text):
+    return RuleBasedParser().parse(text, today=TODAY)
+
+
+@pytest.mark.parametrize('text, title', [
+    ('I am going to the gym tomorrow', 'I am going to the gym'),
+    ('I am at the dentist', 'I am at the dentist'),
+    ('grab a m&m', 'grab a m&m'),
+])
+def test_a_and_am_are_not_durations(text, title):
+    parsed, _ = parse(text)
+    assert 'duration_est' not in parsed
+    assert parsed['title'] == title
+
+
+def test_an_umbrella_keeps_its_article():
+    parsed, confidence = parse('buy an umbrella')
+    assert parsed['title'] == 'buy an umbrella'
+    assert 'duration_est' not in parsed
+    assert confidence == 1.0
+
+
+@pytest.mark.parametrize('text', ['dentist at 9am', 'dentist at 9 am', 'dentist at 9 a.m.'])
+def test_am_after_a_number_is_a_time(text):
+    parsed, confidence = parse(text)
+    assert parsed['due_time'] == '09:00'
+    assert parsed['title'] == 'dentist'
+    assert 'duration_est' not in parsed
+    assert confidence == 1.0
+
+
+@pytest.mark.parametrize('text, minutes', [
+    ('call mom for an hour', 60),
+    ('workout 1h', 60),
+    ('read 30m', 30),
+    ('read for 30 minutes', 30),
+    ('study for two hours and 15 min', 135),
+    ('run 2 h and 30 m', 150),
+    ('gym for an hour and a half', 90),
+    ('walk for half an hour', 30),
+])
+def test_durations(text, minutes):
+    parsed, _ = parse(text)
+    assert parsed['duration_est'] == minutes
+
+
+def test_dates_and_times():
+    parsed, confidence = parse('remind me to call mom tomorrow at 3pm')
+    assert parsed['title'] == 'call mom'
+    assert parsed['due_date'] == '2030-01-08'
+    assert parsed['due_time'] == '15:00'
+    assert confidence == 1.0
+
+
+def test_lost_words_lower_the_confidence():
+    assert RuleBasedParser._lost_words('I am going to the gym', 'I going to the gym')
+    assert not RuleBasedParser._lost_words('call mom tomorrow at 3pm', 'call mom')
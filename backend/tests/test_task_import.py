@@ -0,0 +1,43 @@
+import json
+
+from services.user_services import user_services
+
+
+def ndjson(*rows):
+    return '\n'.join(json.dumps(row) for row in rows)
+
+
+def test_bulk_rows_with_bad_dates_or_times_are_rejected(client):
+    body = ndjson(
+        {'title': 'ok', 'due_date': '2099-10-20', 'due_time': '09:30'},
+        {'title': 'number date', 'due_date': 20991020},
+        {'title': 'basic format date', 'due_date': '20991020'},
+        {'title': 'spoken time', 'due_date': '2099-10-20', 'due_time': '3pm'},
+        {'title': 'number time', 'due_time': 930},
+    )
+
+    response = client.post('/api/tasks/bulk', data=body, content_type='application/x-ndjson')
+
+    assert response.status_code == 200
+    assert response.json['imported'] == 1
+    errors = {result['row']: result.get('error') for result in response.json['results']}
+    assert errors[1] is None
+    assert errors[2] == errors[3] == 'due_date must be YYYY-MM-DD'
+    assert errors[4] == errors[5] == 'due_time must be HH:MM'
+
+
+def test_workloads_still_work_after_a_bad_import(client):
+    client.post('/api/tasks/bulk', data=ndjson({'title': 'x', 'due_date': 20991020}),
+                content_type='application/x-ndjson')
+
+    assert user_services.get('default').task_service.workloads('2099-01-01', '2099-12-31') == {}
+    response = client.post('/api/tasks/suggest-dates', json={'due_date': '2099-10-20'})
+    assert response.status_code == 200
+
+
+def test_csv_rows_are_checked_after_duration_is_read(client):
+    body = 'title,due_date,duration_est\nreport,2099-10-20,30\nreport,10/20/2099,30\n'
+
+    response = client.post('/api/tasks/bulk?format=csv', data=body, content_type='text/csv')
+
+    assert [result.get('error') for result in response.json['results']] == [None, 'due_date must be YYYY-MM-DD']
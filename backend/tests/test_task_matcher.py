@@ -0,0 +1,21 @@
+from datetime import date
+
+from services.task_matcher import TaskMatcher
+
+TODAY = date(2030, 1, 7)
+
+
+def test_a_bare_time_does_not_name_a_day():
+    tasks = [
+        {'title': 'dentist appointment', 'due_date': '2030-01-07'},
+        {'title': 'dentist appointment', 'due_date': '2030-01-08', 'due_time': '15:00'},
+    ]
+    best, _, _ = TaskMatcher(tasks).match('delete the 3pm dentist appointment', TODAY)
+    assert best == 1
+
+
+def test_undated_tasks_are_not_penalised_for_a_date():
+    tasks = [{'title': 'renew passport'}, {'title': 'renew library books', 'due_date': '2030-01-09'}]
+    scores = dict((index, score) for score, index in TaskMatcher(tasks).rank('remove renew passport tomorrow', TODAY))
+    assert scores[0] > 0
+    assert scores[0] > scores[1]
@@ -0,0 +1,106 @@
+import os
+
+from models.task import Task
+from routes import tasks as task_routes
+from services.user_services import user_services
+
+
+def store_task(task_id):
+    return Task(id=task_id, title=task_id)
+
+
+def parse_as(monkeypatch, task_data):
+    monkeypatch.setattr(task_routes.nlp_parser, 'parse_task', lambda usr_input: dict(task_data))
+
+
+def test_a_stored_time_the_planner_cant_read_does_not_stop_a_task_being_created(client, monkeypatch):
+    task_service = user_services.get('default').task_service
+    for n in range(4):
+        task_service.add_task({'title': f"report {n}", 'due_date': '2099-12-01', 'task_type': 'work'})
+    task_service.add_task({'title': 'imported', 'due_date': '2099-12-02', 'due_time': '3pm', 'task_type': 'work'})
+    parse_as(monkeypatch, {'title': 'finish report', 'due_date': '2099-12-01', 'task_type': 'work'})
+
+    response = client.post('/api/tasks/', json={'input': 'finish report on 12/1'})
+
+    assert response.status_code == 201
+    assert response.json['workload_check']['warnings']
+    assert '2099-12-02' in [day['date'] for day in response.json['workload_check']['suggested_dates']]
+
+
+def test_a_planner_error_only_leaves_out_suggested_dates(client, monkeypatch):
+    task_service = user_services.get('default').task_service
+    for n in range(4):
+        task_service.add_task({'title': f"report {n}", 'due_date': '2099-12-01', 'task_type': 'work'})
+    parse_as(monkeypatch, {'title': 'finish report', 'due_date': '2099-12-01', 'task_type': 'work'})
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('calendar unavailable')
+    monkeypatch.setattr(user_services.get('default').planner, 'suggest_dates', fail)
+
+    response = client.post('/api/tasks/', json={'input': 'finish report on 12/1'})
+
+    assert response.status_code == 201
+    assert 'suggested_dates' not in response.json['workload_check']
+    assert len(task_service.tasks_for_date('2099-12-01')) == 5
+
+
+def test_a_parsed_due_date_that_isnt_iso_is_planned_from_today(client, monkeypatch):
+    parse_as(monkeypatch, {'title': 'finish report', 'due_date': 'next friday', 'task_type': 'work'})
+
+    response = client.post('/api/tasks/suggest-dates', json={'input': 'finish report next friday', 'limit': 1})
+
+    assert response.status_code == 200
+    assert len(response.json['suggestions']) == 1
+
+
+def test_updates_with_unknown_fields_or_bad_values_are_rejected(client):
+    task = user_services.get('default').task_service.add_task({'title': 'report', 'due_date': '2099-12-01'})
+
+    unknown = client.put(f"/api/tasks/{task.id}", json={'title': 'x', 'colour': 'red'})
+    bad_time = client.put(f"/api/tasks/{task.id}", json={'due_time': '3pm'})
+    bad_status = client.put(f"/api/tasks/{task.id}", json={'status': 'finished'})
+    not_an_object = client.put(f"/api/tasks/{task.id}", json=['title'])
+
+    assert (unknown.status_code, unknown.json['error']) == (400, 'Unknown fields: colour')
+    assert (bad_time.status_code, bad_time.json['error']) == (400, 'due_time must be HH:MM')
+    assert bad_status.status_code == 400
+    assert not_an_object.status_code == 400
+    assert client.put(f"/api/tasks/{task.id}", json={'due_time': '15:00'}).json['due_time'] == '15:00'
+    assert user_services.get('default').task_service.get_task(task.id).title == 'report'
+
+
+def test_listing_after_a_write_does_not_rewrite_the_file(client):
+    store = user_services.get('default').task_service.store
+    store.flush_delay = 60
+    first = client.get('/api/tasks/')
+    first.get_data()  # the listing is streamed
+    before = os.stat(store.path).st_mtime_ns
+
+    store.add_many([store_task('a')])
+    listing = client.get('/api/tasks/', headers={'If-None-Match': first.headers['ETag']})
+    assert listing.status_code == 200
+    listing.get_data()
+    assert os.stat(store.path).st_mtime_ns == before
+
+    store.flush()
+    again = client.get('/api/tasks/', headers={'If-None-Match': listing.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_deleting_a_task_while_logged_out_keeps_its_event_for_later(client, monkeypatch):
+    from services.job_queue import job_queue
+    services = user_services.get('default')
+    task = services.task_service.add_task({'title': 'report', 'calendar_event_id': 'event1'})
+    deleted = []
+    monkeypatch.setattr(services.calendar_service, 'delete_event', deleted.append)
+
+    response = client.delete(f"/api/tasks/{task.id}")
+    job_queue.run_pending()
+
+    assert response.json['calendar_delete'] == 'waiting_for_login'
+    assert job_queue.stats() == {'held': 1}
+
+    monkeypatch.setattr(services.calendar_service, 'is_authenticated', lambda: True)
+    job_queue.release(services.calendar_service.login_hold_key)
+    job_queue.run_pending()
+    assert deleted == ['event1']
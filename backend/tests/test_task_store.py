@@ -0,0 +1,171 @@
+import os
+
+from models.task import Task
+from services import task_store
+from services.sqlite_task_store import SqliteTaskStore
+from services.task_store import TaskStore
+
+
+def task(task_id, **fields):
+    return Task(id=task_id, title=fields.pop('title', task_id), **fields)
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return st.st_ino, st.st_mtime_ns
+
+
+def make_revision_before(revision, changes):
+    epoch, _, rev = revision.rpartition('-')
+    return f"{epoch}-{int(rev) - changes}"
+
+
+def test_reading_the_revision_does_not_flush_pending_changes(tmp_path):
+    path = str(tmp_path / 'tasks.json')
+    store = TaskStore(path, flush_delay=60)
+    before = file_stamp(path)
+
+    store.add(task('a'))
+    revision, _ = store.current_revision()
+    assert store.changes_since(revision) == {'revision': revision, 'changed': [], 'deleted': []}
+
+    assert file_stamp(path) == before
+    assert store.matches_revision(revision)
+
+
+def test_tokens_given_out_before_a_flush_stay_valid_after_it(tmp_path):
+    path = str(tmp_path / 'tasks.json')
+    store = TaskStore(path, flush_delay=60)
+    store.add(task('a'))
+    pending, _ = store.current_revision()
+
+    store.flush()
+    flushed, _ = store.current_revision()
+    store.update('a', {'title': 'renamed'})
+
+    assert flushed != pending
+    assert not store.matches_revision(pending)
+    changes = store.changes_since(pending)
+    assert [t.title for t in changes['changed']] == ['renamed']
+    assert changes['deleted'] == []
+
+
+def test_tokens_of_changes_renumbered_by_another_worker_are_void(tmp_path):
+    path = str(tmp_path / 'tasks.json')
+    mine = TaskStore(path, flush_delay=60)
+    other = TaskStore(path, flush_delay=60)
+    mine.add(task('a'))
+    pending, _ = mine.current_revision()
+
+    other.add(task('b'))
+    other.flush()
+    mine.flush()
+
+    assert mine.changes_since(pending) is None
+    assert {t.id for t in mine.all()} == {'a', 'b'}
+
+
+def test_journal_records_are_replayed_by_a_new_store(tmp_path):
+    path = str(tmp_path / 'tasks.json')
+    store = TaskStore(path, mode='journal')
+    store.add(task('a', due_date='2099-12-01', duration_est=30))
+    store.add(task('b'))
+    store.update('a', {'status': 'in_progress'})
+    store.delete('b')
+
+    replayed = TaskStore(path, mode='journal')
+
+    assert [t.id for t in replayed.all()] == ['a']
+    assert replayed.get('a').status == 'in_progress'
+    assert replayed.workload('2099-12-01') == {'work': (1, 30)}
+    assert replayed.current_revision() == store.current_revision()
+
+
+def test_compaction_folds_the_journal_into_the_snapshot(tmp_path):
+    path = str(tmp_path / 'tasks.json')
+    store = TaskStore(path, mode='journal')
+    for task_id in 'abc':
+        store.add(task(task_id))
+    store.delete('b')
+    revision, _ = store.current_revision()
+
+    store.compact()
+
+    assert os.path.getsize(path + '.journal') == 0
+    reopened = TaskStore(path, mode='journal')
+    assert [t.id for t in reopened.all()] == ['a', 'c']
+    assert reopened.current_revision()[0] == revision
+    assert reopened.changes_since(make_revision_before(revision, 1))['deleted'] == ['b']
+
+
+def test_a_torn_journal_tail_is_ignored(tmp_path):
+    path = str(tmp_path / 'tasks.json')
+    TaskStore(path, mode='journal').add(task('a'))
+    with open(path + '.journal', 'a', encoding='utf-8') as f:
+        f.write('{"op": "create", "task": {"id": "b"')
+
+    store = TaskStore(path, mode='journal')
+    store.add(task('c'))
+
+    assert [t.id for t in TaskStore(path, mode='journal').all()] == ['a', 'c']
+
+
+def test_unknown_journal_records_are_logged_and_skipped(tmp_path, caplog):
+    path = str(tmp_path / 'tasks.json')
+    TaskStore(path, mode='journal').add(task('a'))
+    with open(path + '.journal', 'a', encoding='utf-8') as f:
+        f.write('{"op": "archive", "id": "a"}\n')
+
+    store = TaskStore(path, mode='journal')
+
+    assert [t.id for t in store.all()] == ['a']
+    assert 'Ignoring unknown task record' in caplog.text
+
+
+def test_pending_changes_are_written_at_exit(tmp_path):
+    path = str(tmp_path / 'tasks.json')
+    store = TaskStore(path, flush_delay=60)
+    store.add(task('a'))
+
+    task_store._flush_open_stores()
+
+    assert [t.id for t in TaskStore(path).all()] == ['a']
+
+
+def test_unloading_a_user_writes_their_pending_changes(client):
+    from services.user_services import user_services
+    store = user_services.get('default').task_service.store
+    store.flush_delay = 60
+    store.add(task('a'))
+
+    user_services.clear()
+
+    assert [t.id for t in TaskStore(store.path).all()] == ['a']
+
+
+def test_workers_hand_out_the_same_revisions(tmp_path):
+    path = str(tmp_path / 'tasks.json')
+    for mode in ('json', 'journal'):
+        first = TaskStore(f"{path}.{mode}", mode=mode, flush_delay=60)
+        second = TaskStore(f"{path}.{mode}", mode=mode, flush_delay=60)
+        first.add(task('a'))
+        first.flush()
+        second.update('a', {'title': 'renamed'})
+        second.flush()
+
+        assert first.current_revision() == second.current_revision()
+        assert first.get('a').title == 'renamed'
+        changes = first.changes_since(make_revision_before(first.current_revision()[0], 1))
+        assert [t.title for t in changes['changed']] == ['renamed']
+
+
+def test_sqlite_workers_hand_out_the_same_revisions(tmp_path):
+    path = str(tmp_path / 'tasks.db')
+    first, second = SqliteTaskStore(path), SqliteTaskStore(path)
+    first.add(task('a'))
+    second.delete('a')
+
+    assert first.current_revision() == second.current_revision()
+    assert first.changes_since(make_revision_before(first.current_revision()[0], 1)) == {
+        'revision': first.current_revision()[0], 'changed': [], 'deleted': ['a']
+    }
@@ -1,44 +1,144 @@
+import json
 import os
+import time
+import uuid
 
 import streamlit as st
 import requests
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:5000/api")
+# multi-user mode: users sign in (st.login, configured under [auth] in
+# .streamlit/secrets.toml) and the backend is called with a user token that
+# API_KEY lets this app request for the signed-in user
+MULTI_USER = os.getenv("MULTI_USER", "false").lower() == "true"
+API_KEY = os.getenv("API_KEY", "")
+# seconds a task listing is reused before asking the backend whether it changed
+TASK_CACHE_TTL = float(os.getenv("TASK_CACHE_TTL", "5"))
 
 # page title
 st.set_page_config(page_title="Productivity Assistant", layout="wide")
 
 st.title("🤖 Productivity Assistant")
 
+if MULTI_USER:
+    if not st.user.is_logged_in:
+        st.button("Log in", on_click=st.login)
+        st.stop()
+    USER_ID = st.user.email
+else:
+    USER_ID = "default"
+
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 if 'day_complete' not in st.session_state:
     st.session_state.day_complete = False
+if 'task_cache' not in st.session_state:
+    st.session_state.task_cache = {}
+if 'session_id' not in st.session_state:
+    # keeps this browser session's chat context separate on the backend
+    st.session_state.session_id = str(uuid.uuid4())
+if st.session_state.get('user_id') != USER_ID:
+    # another user's tasks must not be served from this session's cache
+    st.session_state.user_id = USER_ID
+    st.session_state.task_cache = {}
+    st.session_state.user_token = None
+
+# Data layer
+
+@st.cache_resource
+def get_session():
+    """One keep-alive HTTP session shared by every rerun"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class UserApi:
+    """The shared HTTP session, sending this browser session's user token with every request"""
+
+    def __init__(self, session, user_id):
+        self.session = session
+        self.user_id = user_id
+
+    def _token(self):
+        """The backend's token for this user, requested again shortly before it expires"""
+        cached = st.session_state.get('user_token')
+        if cached and cached['expires'] > time.time() + 60:
+            return cached['token']
+        response = self.session.post(
+            f"{API_BASE_URL}/auth/token", headers={"X-Api-Key": API_KEY}, json={"user_id": self.user_id}, timeout=10
+        )
+        response.raise_for_status()
+        data = response.json()
+        st.session_state.user_token = {'token': data['token'], 'expires': time.time() + data['expires_in']}
+        return data['token']
+
+    def request(self, method, url, headers=None, **kwargs):
+        if MULTI_USER:
+            headers = {**(headers or {}), "Authorization": f"Bearer {self._token()}"}
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+api = UserApi(get_session(), USER_ID)
+
+# Streamlit re-executes this script on every rerun, so this memo only lives for one run
+_rerun_memo = {}
+
+def memoize_per_rerun(fn):
+    """Collapse repeated identical calls within one rerun into a single request"""
+    def wrapper(*args, **kwargs):
+        key = (fn.__name__, repr(args), repr(sorted(kwargs.items())))
+        if key not in _rerun_memo:
+            _rerun_memo[key] = fn(*args, **kwargs)
+        return _rerun_memo[key]
+    return wrapper
+
+def invalidate_tasks():
+    """Forget cached task listings after a change"""
+    st.session_state.task_cache = {}
+    for key in [k for k in _rerun_memo if k[0] == 'get_tasks']:
+        del _rerun_memo[key]
 
 # Some helpers
 
 def delete_tasks(task_id):
     """Delete tasks"""
     try:
-        response = requests.delete(f"{API_BASE_URL}/tasks/{task_id}")
+        response = api.delete(f"{API_BASE_URL}/tasks/{task_id}")
+        invalidate_tasks()
         return response.json()
     except Exception as e:
         print(f"Delete error: {e}")
         return {'error': str(e)}
 
-def add_task(user_input, sync_calendar=False):
-    """Add task using natural language"""
-    response = requests.post(
-        f"{API_BASE_URL}/tasks/",
+def add_tasks(user_input, sync_calendar=False):
+    """Add the task, or every task listed in the input ("buy milk, call mom tomorrow"), with one request"""
+    response = api.post(
+        f"{API_BASE_URL}/tasks/batch",
         json={"input": user_input, "sync_calendar": sync_calendar}
     )
+    invalidate_tasks()
     return response.json()
 
+@memoize_per_rerun
 def check_calendar_auth():
     """Check Google Calendar auth status"""
     try:
-        response = requests.get(f"{API_BASE_URL}/calendar/status")
+        response = api.get(f"{API_BASE_URL}/calendar/status")
         return response.json()
     except:
         return {'authenticated': False}
@@ -46,7 +146,7 @@ def check_calendar_auth():
 def get_calendar_auth_url():
     """Get Google Calendar auth url"""
     try:
-        response = requests.get(f"{API_BASE_URL}/calendar/auth")
+        response = api.get(f"{API_BASE_URL}/calendar/auth")
         return response.json()
     except:
         return {'auth_url': None}
@@ -70,7 +170,7 @@ def find_matching_task(user_input, tasks):
             })
 
         # Ask AI to match
-        response = requests.post(
+        response = api.post(
             f"{API_BASE_URL}/chat/match-task",
             json={
                 "user_input": user_input,
@@ -92,10 +192,11 @@ def find_matching_task(user_input, tasks):
                 return task
         return None
 
+@memoize_per_rerun
 def get_calendar_events():
     """Get upcoming calendar events"""
     try:
-        response = requests.get(f"{API_BASE_URL}/calendar/events")
+        response = api.get(f"{API_BASE_URL}/calendar/events")
         if response.status_code == 200:
             return response.json()
         else:
@@ -106,14 +207,34 @@ def get_calendar_events():
         return {'events': []}
 
 
-def get_tasks():
+@memoize_per_rerun
+def get_tasks(params=None):
+    """Get tasks, optionally filtered server-side (due_date, status, task_type, priority, limit).
+
+    Listings are cached per session with the backend's revision (ETag): within
+    TASK_CACHE_TTL no request is made, after that a conditional GET only
+    transfers the tasks again if something changed."""
+    cache_key = repr(sorted((params or {}).items()))
+    cached = st.session_state.task_cache.get(cache_key)
+    if cached and time.monotonic() - cached['fetched_at'] < TASK_CACHE_TTL:
+        return cached['data']
+
+    headers = {'If-None-Match': cached['etag']} if cached and cached['etag'] else {}
     try:
-        response = requests.get(f"{API_BASE_URL}/tasks/", timeout=10)
+        response = api.get(f"{API_BASE_URL}/tasks/", params=params, headers=headers, timeout=10)
+        if response.status_code == 304:
+            cached['fetched_at'] = time.monotonic()
+            return cached['data']
         response.raise_for_status()
         data = response.json()
 
         # Ensure we got a list, not an error object
         if isinstance(data, list):
+            st.session_state.task_cache[cache_key] = {
+                'etag': response.headers.get('ETag'),
+                'data': data,
+                'fetched_at': time.monotonic(),
+            }
             return data
         else:
             print(f"Unexpected response: {data}")
@@ -130,24 +251,38 @@ def get_tasks():
         return []
 
 def toggle_task(task, new_status):
-    requests.put(f"{API_BASE_URL}/tasks/{task}", json={"status": new_status})
+    api.put(f"{API_BASE_URL}/tasks/{task}", json={"status": new_status})
+    invalidate_tasks()
 
 def get_summary():
-    response = requests.get(f"{API_BASE_URL}/chat/daily-summary")
+    response = api.get(f"{API_BASE_URL}/chat/daily-summary")
     return response.json()
 
+def stream_chat_reply(response):
+    """Yield reply pieces from the chat Server-Sent Events stream"""
+    response.raise_for_status()
+    event = 'message'
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            event = 'message'
+        elif line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            payload = json.loads(line[len('data:'):])
+            if event == 'error':
+                raise RuntimeError(payload.get('error', 'chat stream failed'))
+            if event == 'done':
+                return
+            yield payload.get('delta', '')
+
 # sidebar section
 with st.sidebar:
     st.title("Menu")
 
     st.subheader("Today's Progress")
     try:
-        tasks = get_tasks()
         today = datetime.now().date().isoformat()
-        today_tasks = []
-        for t in tasks:
-            if t.get('due_date') == today:
-                today_tasks.append(t)
+        today_tasks = get_tasks({'due_date': today})
         done_today = len([t for t in today_tasks if t['status'] == 'done'])
         total = len(today_tasks)
 
@@ -272,10 +407,21 @@ if user_input:
         # is a task then
         with st.spinner("Creating task..."):
             try:
-                result = add_task(user_input, sync_to_calendar)
+                # the backend decides whether the input lists several tasks
+                result = add_tasks(user_input, sync_to_calendar)
+                if len(result.get('tasks', [])) == 1:
+                    result['task'] = result.pop('tasks')[0]
+                    result['workload_check'] = result.pop('workload_checks')[0]
                 task_data = result.get('task', result)
 
-                if 'error' in result:
+                if 'tasks' in result:
+                    response = f"Added {len(result['tasks'])} tasks:\n"
+                    for task in result['tasks']:
+                        response += f"- **{task['title']}**" + (f" ({task['due_date']})" if task.get('due_date') else "") + "\n"
+                    task_data = {}
+                    warnings = [w for check in result.get('workload_checks', []) for w in check.get('warnings', [])]
+                    result['workload_check'] = {'warnings': list(dict.fromkeys(warnings))}
+                elif 'error' in result:
                     st.error(f"❌ Couldn't create task: {result['error']}")
                     st.info("💡 Try: 'Buy groceries tomorrow' or 'Meeting at 2pm Friday'")
                 else:
@@ -286,18 +432,20 @@ if user_input:
                 if task_data.get('duration_est'):
                     response += f"Duration: {task_data['duration_est']} min\n"
 
-                if sync_to_calendar and task_data.get('due_date'):
-                    with st.spinner("📅 Syncing to Google Calendar..."):
-
-                        import time
-                        time.sleep(0.5)
-                        response += "\n✅ Synced to Google Calendar!\n"
+                if result.get('calendar_sync') == 'queued':
+                    response += "\n📅 Adding to Google Calendar in the background\n"
 
                 workload = result.get('workload_check', {})
                 if workload.get('warnings'):
                     response += "\n**Workload Warning**\n"
                     for warning in workload['warnings']:
                         response += f"- {warning}\n"
+                if workload.get('suggested_dates'):
+                    response += "\n**Days with more room:** "
+                    response += ", ".join(
+                        suggestion['date'] + (f" ({suggestion['slot']['start']})" if suggestion.get('slot') else "")
+                        for suggestion in workload['suggested_dates']
+                    ) + "\n"
 
                 st.session_state.chat_history.append({'role': 'assistant', 'content': response})
 
@@ -310,8 +458,13 @@ if user_input:
 
     else:
         try:
-            chat_response = requests.post(f"{API_BASE_URL}/chat/message", json={"message": user_input})
-            reply = chat_response.json()
+            chat_response = api.post(
+                f"{API_BASE_URL}/chat/message/stream",
+                json={"message": user_input, "session_id": st.session_state.session_id},
+                stream=True
+            )
+            with st.chat_message('assistant'):
+                reply = st.write_stream(stream_chat_reply(chat_response))
             st.session_state.chat_history.append({'role': 'assistant', 'content': reply})
 
         except Exception as e:
@@ -325,18 +478,14 @@ st.divider()
 st.subheader("Today's To-Do List")
 
 try:
-    tasks = get_tasks()
+    today = datetime.now().date().isoformat()
+    # today's tasks plus undated ones
+    today_tasks = get_tasks({'due_date': [today, 'none']})
 
     # Defensive check
-    if not isinstance(tasks, list):
+    if not isinstance(today_tasks, list):
         st.error("Error: Tasks data is not in the expected format")
-        tasks = []
-
-    today = datetime.now().date().isoformat()
-    today_tasks = [
-        t for t in tasks
-        if isinstance(t, dict) and (t.get('due_date') == today or not t.get('due_date'))
-    ]
+        today_tasks = []
 
     if not today_tasks:
         st.info("No tasks for today (lucky you). Add some tasks below!")
@@ -386,7 +535,8 @@ try:
                     st.rerun()
         st.divider()
 
-        all_done = all(t['status'] == 'done' for t in tasks)
+        # every task is done when there is not a single open one left
+        all_done = not get_tasks({'status': ['todo', 'in_progress'], 'limit': 1})
 
         if all_done:
             st.success("All tasks are complete! Great job!")
@@ -402,6 +552,8 @@ try:
                         summary_data = get_summary()
                         st.success("✅ Summary ready!")
                         st.markdown(summary_data['summary'])
+                        if summary_data.get('stale'):
+                            st.caption("Updating your summary with your latest changes...")
 
                         col1, col2, col3 = st.columns(3)
 